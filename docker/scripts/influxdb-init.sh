@@ -4,6 +4,9 @@ set -eu
 : "${INFLUX_URL:=http://influxdb:8181}"
 : "${INFLUXDB_DATABASE:=home}"
 : "${INFLUXDB_TOKEN:?INFLUXDB_TOKEN is required}"
+# Optional raw tier: MQTT history in its own database that expires after INFLUXDB_RAW_RETENTION.
+: "${INFLUXDB_RAW_DATABASE:=}"
+: "${INFLUXDB_RAW_RETENTION:=30d}"
 
 echo "Waiting for InfluxDB at ${INFLUX_URL}..."
 attempt=0
@@ -18,11 +21,27 @@ do
   sleep 2
 done
 
-if grep -F "\"iox::database\":\"${INFLUXDB_DATABASE}\"" /tmp/influx-databases.json >/dev/null 2>&1; then
+database_exists() {
+  grep -F "\"iox::database\":\"$1\"" /tmp/influx-databases.json >/dev/null 2>&1
+}
+
+if database_exists "${INFLUXDB_DATABASE}"; then
   echo "Database '${INFLUXDB_DATABASE}' already exists."
-  exit 0
+else
+  echo "Creating database '${INFLUXDB_DATABASE}'..."
+  influxdb3 create database "${INFLUXDB_DATABASE}" --host "${INFLUX_URL}" --token "${INFLUXDB_TOKEN}"
+  echo "Database '${INFLUXDB_DATABASE}' is ready."
 fi
 
-echo "Creating database '${INFLUXDB_DATABASE}'..."
-influxdb3 create database "${INFLUXDB_DATABASE}" --host "${INFLUX_URL}" --token "${INFLUXDB_TOKEN}"
-echo "Database '${INFLUXDB_DATABASE}' is ready."
+if [ -n "${INFLUXDB_RAW_DATABASE}" ] && [ "${INFLUXDB_RAW_DATABASE}" != "${INFLUXDB_DATABASE}" ]; then
+  if database_exists "${INFLUXDB_RAW_DATABASE}"; then
+    echo "Setting retention ${INFLUXDB_RAW_RETENTION} on '${INFLUXDB_RAW_DATABASE}'..."
+    influxdb3 update database --database "${INFLUXDB_RAW_DATABASE}" --retention-period "${INFLUXDB_RAW_RETENTION}" \
+      --host "${INFLUX_URL}" --token "${INFLUXDB_TOKEN}" \
+      || echo "Could not update retention (needs a newer influxdb3); existing raw data will not expire."
+  else
+    echo "Creating raw database '${INFLUXDB_RAW_DATABASE}' (retention ${INFLUXDB_RAW_RETENTION})..."
+    influxdb3 create database "${INFLUXDB_RAW_DATABASE}" --retention-period "${INFLUXDB_RAW_RETENTION}" \
+      --host "${INFLUX_URL}" --token "${INFLUXDB_TOKEN}"
+  fi
+fi
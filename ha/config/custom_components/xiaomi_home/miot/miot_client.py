@@ -52,7 +52,7 @@ import json
 import logging
 import time
 import traceback
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
 
 from homeassistant.core import HomeAssistant
@@ -71,6 +71,8 @@ from .miot_mips import (
     MIoTDeviceState, MipsCloudClient, MipsDeviceState,
     MipsLocalClient)
 from .miot_lan import MIoTLan
+from .miot_refresh import (
+    MIoTRefreshItem, MIoTRefreshPriority, MIoTRefreshScheduler)
 from .miot_network import MIoTNetwork
 from .miot_storage import MIoTCert, MIoTStorage
 from .miot_mdns import MipsService, MipsServiceState
@@ -80,10 +82,20 @@ _LOGGER = logging.getLogger(__name__)
 
 
 REFRESH_PROPS_DELAY = 0.2
-REFRESH_PROPS_RETRY_DELAY = 3
+# Properties read from one device per refresh cycle, in a single request
+REFRESH_PROPS_DEVICE_PATCH_LEN = 16
+# Properties refreshed per cycle over all devices
+REFRESH_PROPS_PATCH_LEN = 150
 REFRESH_CLOUD_DEVICES_DELAY = 6
 REFRESH_CLOUD_DEVICES_RETRY_DELAY = 60
 REFRESH_GATEWAY_DEVICES_DELAY = 3
+# Seconds a pushed or read property value answers get_prop_async
+GET_PROP_CACHE_TTL = 30
+GET_PROP_CHANNELS = ('gw', 'lan', 'cloud')
+# Latency assumed for a channel before it is measured, seconds
+GET_PROP_LATENCY_PRIOR = {'gw': 0.05, 'lan': 0.05, 'cloud': 0.3}
+# Seconds for a measured latency to decay halfway back to the prior
+GET_PROP_LATENCY_HALF_LIFE = 60
 
 @dataclass
 class MIoTClientSub:
@@ -96,6 +108,44 @@ class MIoTClientSub:
         return f'{self.topic}, {id(self.handler)}, {id(self.handler_ctx)}'
 
 
+@dataclass
+class _MIoTGetPropChannelStats:
+    """get_prop_async requests over one channel."""
+    prior: float
+    # Smoothed, including failures so that timeouts push a channel back
+    latency: float = field(init=False)
+    update_ts: float = 0
+    requests: int = 0
+    failures: int = 0
+
+    def __post_init__(self) -> None:
+        self.latency = self.prior
+
+    def estimate(self, now: float) -> float:
+        """Smoothed latency, decaying back to the prior. A channel pushed
+        back by timeouts is therefore tried again after a while."""
+        if not self.update_ts:
+            return self.latency
+        return self.prior + (self.latency - self.prior) * 0.5 ** (
+            (now - self.update_ts) / GET_PROP_LATENCY_HALF_LIFE)
+
+    def update(self, latency: float, succeed: bool, now: float) -> None:
+        # The first sample is blended with the prior too, one timeout must
+        # not demote a local channel for good
+        self.latency = 0.8*self.estimate(now=now) + 0.2*latency
+        self.update_ts = now
+        self.requests += 1
+        if not succeed:
+            self.failures += 1
+
+    def as_dict(self, now: float) -> dict[str, Any]:
+        return {
+            'latency_ms': round(self.estimate(now=now)*1000, 1),
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
 class CtrlMode(Enum):
     """MIoT client control mode."""
     AUTO = 0
@@ -166,9 +216,15 @@ class MIoTClient:
     _refresh_cert_timer: Optional[asyncio.TimerHandle]
     _refresh_cloud_devices_timer: Optional[asyncio.TimerHandle]
     # Refresh prop
-    _refresh_props_list: dict[str, dict]
+    _refresh_props_queue: MIoTRefreshScheduler
     _refresh_props_timer: Optional[asyncio.TimerHandle]
-    _refresh_props_retry_count: int
+
+    # Get prop, did -> siid|piid -> (value, ts)
+    _prop_cache: dict[str, dict[str, tuple[Any, float]]]
+    _prop_cache_hits: int
+    _prop_cache_misses: int
+    _get_prop_order: Optional[list[str]]
+    _get_prop_channel_stats: dict[str, _MIoTGetPropChannelStats]
 
     # Persistence notify handler, params: notify_id, title, message
     _persistence_notify: Callable[[str, Optional[str], Optional[str]], None]
@@ -237,9 +293,22 @@ class MIoTClient:
         self._refresh_cloud_devices_timer = None
 
         # Refresh prop
-        self._refresh_props_list = {}
+        self._refresh_props_queue = MIoTRefreshScheduler(
+            time_func=self._main_loop.time)
         self._refresh_props_timer = None
-        self._refresh_props_retry_count = 0
+
+        self._prop_cache = {}
+        self._prop_cache_hits = 0
+        self._prop_cache_misses = 0
+        self._get_prop_order = None
+        try:
+            self.get_prop_order = entry_data.get('get_prop_order', None)
+        except MIoTClientError as err:
+            _LOGGER.error('%s, order by latency', err)
+        self._get_prop_channel_stats = {
+            channel: _MIoTGetPropChannelStats(
+                prior=GET_PROP_LATENCY_PRIOR[channel])
+            for channel in GET_PROP_CHANNELS}
 
         self._persistence_notify = None
         self._show_devices_changed_notify_timer = None
@@ -379,8 +448,8 @@ class MIoTClient:
         if self._refresh_props_timer:
             self._refresh_props_timer.cancel()
             self._refresh_props_timer = None
-        self._refresh_props_list.clear()
-        self._refresh_props_retry_count = 0
+        self._refresh_props_queue.clear()
+        self._prop_cache.clear()
         # Cloud mips
         self._mips_cloud.unsub_mips_state(
             key=f'{self._uid}-{self._cloud_server}')
@@ -640,6 +709,7 @@ class MIoTClient:
     ) -> bool:
         if did not in self._device_list_cache:
             raise MIoTClientError(f'did not exist, {did}')
+        self._prop_cache.get(did, {}).pop(f'{siid}|{piid}', None)
         # Priority local control
         if self._ctrl_mode == CtrlMode.AUTO:
             # Gateway control
@@ -711,62 +781,109 @@ class MIoTClient:
             f'{self._i18n.translate("error.common.-10007")}')
 
     def request_refresh_prop(
-        self, did: str, siid: int, piid: int
+        self, did: str, siid: int, piid: int,
+        priority: MIoTRefreshPriority = MIoTRefreshPriority.BACKGROUND
     ) -> None:
         if did not in self._device_list_cache:
             raise MIoTClientError(f'did not exist, {did}')
-        key: str = f'{did}|{siid}|{piid}'
-        if key in self._refresh_props_list:
-            return
-        self._refresh_props_list[key] = {
-            'did': did, 'siid': siid, 'piid': piid}
+        self._refresh_props_queue.add(
+            did=did, siid=siid, piid=piid, priority=priority)
         if self._refresh_props_timer:
-            return
-        self._refresh_props_timer = self._main_loop.call_later(
-            REFRESH_PROPS_DELAY, lambda: self._main_loop.create_task(
-                self.__refresh_props_handler()))
+            if (
+                self._refresh_props_timer.when()
+                <= self._main_loop.time() + REFRESH_PROPS_DELAY
+            ):
+                # Due soon or running, it reschedules itself when done
+                return
+            # Waiting out a retry backoff
+            self._refresh_props_timer.cancel()
+        self.__schedule_refresh_props()
+
+    @property
+    def refresh_props_stats(self) -> dict[str, Any]:
+        """Property refresh queue depth and age."""
+        return self._refresh_props_queue.stats
 
     async def get_prop_async(self, did: str, siid: int, piid: int) -> Any:
         if did not in self._device_list_cache:
             raise MIoTClientError(f'did not exist, {did}')
-
-        # NOTICE: Since there are too many request attributes and obtaining
-        # them directly from the hub or device will cause device abnormalities,
-        # so obtaining the cache from the cloud is the priority here.
-        try:
-            if self._network.network_status:
-                result = await self._http.get_prop_async(
-                    did=did, siid=siid, piid=piid)
-                if result:
-                    return result
-        except Exception as err:  # pylint: disable=broad-exception-caught
-            # Catch all exceptions
-            _LOGGER.error(
-                'client get prop from cloud error, %s, %s',
-                err, traceback.format_exc())
-        if self._ctrl_mode == CtrlMode.AUTO:
-            # Central hub gateway
-            device_gw = self._device_list_gateway.get(did, None)
-            if (
-                device_gw and device_gw.get('online', False)
-                and device_gw.get('specv2_access', False)
-                and 'group_id' in device_gw
-            ):
-                mips = self._mips_local.get(device_gw['group_id'], None)
-                if mips is None:
-                    _LOGGER.error('no gw route, %s', device_gw)
+        key: str = f'{siid}|{piid}'
+        cached: Optional[tuple[Any, float]] = self._prop_cache.get(
+            did, {}).get(key, None)
+        if (
+            cached
+            and self._main_loop.time() - cached[1] <= GET_PROP_CACHE_TTL
+        ):
+            self._prop_cache_hits += 1
+            return cached[0]
+        self._prop_cache_misses += 1
+
+        # NOTICE: Too many requests to the hub or the device cause device
+        # abnormalities, lan requests are queued per device for that.
+        for channel in self.__get_prop_channels(did=did):
+            result: Any = None
+            ts_start: float = self._main_loop.time()
+            try:
+                if channel == 'gw':
+                    mips = self._mips_local[
+                        self._device_list_gateway[did]['group_id']]
+                    result = await mips.get_prop_async(
+                        did=did, siid=siid, piid=piid)
+                elif channel == 'lan':
+                    result = await self._miot_lan.get_prop_async(
+                        did=did, siid=siid, piid=piid)
                 else:
-                    return await mips.get_prop_async(
+                    result = await self._http.get_prop_async(
                         did=did, siid=siid, piid=piid)
-            # Lan
-            device_lan = self._device_list_lan.get(did, None)
-            if device_lan and device_lan.get('online', False):
-                return await self._miot_lan.get_prop_async(
-                    did=did, siid=siid, piid=piid)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                # Catch all exceptions
+                _LOGGER.error(
+                    'client get prop from %s error, %s, %s',
+                    channel, err, traceback.format_exc())
+            # Don't use "not result", it is skipped when result is 0, false
+            self._get_prop_channel_stats[channel].update(
+                latency=self._main_loop.time() - ts_start,
+                succeed=result is not None, now=self._main_loop.time())
+            if result is not None:
+                self._prop_cache.setdefault(did, {})[key] = (
+                    result, self._main_loop.time())
+                return result
         # _LOGGER.error(
         #     'client get prop failed, no-link, %s.%d.%d', did, siid, piid)
         return None
 
+    @property
+    def get_prop_order(self) -> Optional[list[str]]:
+        """Fixed channel order of get_prop_async, None to order by latency."""
+        return self._get_prop_order
+
+    @get_prop_order.setter
+    def get_prop_order(self, value: Optional[list[str]]) -> None:
+        if value is not None and (
+            not value or not set(value).issubset(GET_PROP_CHANNELS)
+        ):
+            raise MIoTClientError(f'invalid get prop order, {value}')
+        self._get_prop_order = list(value) if value is not None else None
+
+    @property
+    def get_prop_stats(self) -> dict[str, Any]:
+        """Property cache hit rate and per channel latency."""
+        requests: int = self._prop_cache_hits + self._prop_cache_misses
+        return {
+            'order': self._get_prop_order or 'latency',
+            'cache': {
+                'size': sum(
+                    len(did_cache) for did_cache in self._prop_cache.values()),
+                'hits': self._prop_cache_hits,
+                'misses': self._prop_cache_misses,
+                'hit_rate': round(
+                    self._prop_cache_hits / requests, 3) if requests else None,
+            },
+            'channels': {
+                channel: stats.as_dict(now=self._main_loop.time())
+                for channel, stats in self._get_prop_channel_stats.items()},
+        }
+
     async def action_async(
         self, did: str, siid: int, aiid: int, in_list: list
     ) -> list:
@@ -904,6 +1021,7 @@ class MIoTClient:
         if did not in self._device_list_cache:
             return
         sub_from = self._sub_source_list.pop(did, None)
+        self.__clear_prop_cache(did=did)
         # Unsub
         if sub_from:
             self.__unsub_from(sub_from, did)
@@ -1120,6 +1238,8 @@ class MIoTClient:
                 if state_old == state_new:
                     continue
                 self._device_list_cache[did]['online'] = state_new
+                if not state_new:
+                    self.__clear_prop_cache(did=did)
                 sub = self._sub_device_state.get(did, None)
                 if sub and sub.handler:
                     sub.handler(did, MIoTDeviceState.OFFLINE, sub.handler_ctx)
@@ -1165,6 +1285,8 @@ class MIoTClient:
                 if state_old == state_new:
                     continue
                 self._device_list_cache[did]['online'] = state_new
+                if not state_new:
+                    self.__clear_prop_cache(did=did)
                 sub = self._sub_device_state.get(did, None)
                 if sub and sub.handler:
                     sub.handler(did, MIoTDeviceState.OFFLINE, sub.handler_ctx)
@@ -1213,6 +1335,8 @@ class MIoTClient:
                 if state_old == state_new:
                     continue
                 self._device_list_cache[did]['online'] = state_new
+                if not state_new:
+                    self.__clear_prop_cache(did=did)
                 sub = self._sub_device_state.get(did, None)
                 if sub and sub.handler:
                     sub.handler(did, MIoTDeviceState.OFFLINE, sub.handler_ctx)
@@ -1243,6 +1367,8 @@ class MIoTClient:
         if state_old == state_new:
             return
         self._device_list_cache[did]['online'] = state_new
+        if not state_new:
+            self.__clear_prop_cache(did=did)
         sub = self._sub_device_state.get(did, None)
         if sub and sub.handler:
             sub.handler(
@@ -1307,6 +1433,8 @@ class MIoTClient:
         if state_old == state_new:
             return
         self._device_list_cache[did]['online'] = state_new
+        if not state_new:
+            self.__clear_prop_cache(did=did)
         sub = self._sub_device_state.get(did, None)
         if sub and sub.handler:
             sub.handler(
@@ -1319,6 +1447,10 @@ class MIoTClient:
         """params MUST contain did, siid, piid, value"""
         # BLE device has no online/offline msg
         try:
+            if 'value' in params:
+                self._prop_cache.setdefault(params['did'], {})[
+                    f'{params["siid"]}|{params["piid"]}'] = (
+                        params['value'], self._main_loop.time())
             subs: list[MIoTClientSub] = list(self._sub_tree.iter_match(
                 f'{params["did"]}/p/{params["siid"]}/{params["piid"]}'))
             for sub in subs:
@@ -1326,6 +1458,11 @@ class MIoTClient:
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('on prop msg error, %s, %s', params, err)
 
+    @final
+    def __clear_prop_cache(self, did: str) -> None:
+        """Drop cached values of an offline or removed device."""
+        self._prop_cache.pop(did, None)
+
     @final
     def __on_event_msg(self, params: dict, ctx: Any) -> None:
         try:
@@ -1414,6 +1551,7 @@ class MIoTClient:
             else:
                 # Device deleted
                 self._device_list_cloud[did]['online'] = None
+                self.__clear_prop_cache(did=did)
             if cloud_state_old == cloud_state_new:
                 # Cloud online status no change
                 continue
@@ -1427,6 +1565,8 @@ class MIoTClient:
                 # Online status no change
                 continue
             info['online'] = state_new
+            if not state_new:
+                self.__clear_prop_cache(did=did)
             # Call device state changed callback
             sub = self._sub_device_state.get(did, None)
             if sub and sub.handler:
@@ -1553,6 +1693,8 @@ class MIoTClient:
             if state_old == state_new:
                 continue
             info['online'] = state_new
+            if not state_new:
+                self.__clear_prop_cache(did=did)
             sub = self._sub_device_state.get(did, None)
             if sub and sub.handler:
                 sub.handler(
@@ -1578,6 +1720,8 @@ class MIoTClient:
             if state_old == state_new:
                 continue
             self._device_list_cache[did]['online'] = state_new
+            if not state_new:
+                self.__clear_prop_cache(did=did)
             sub = self._sub_device_state.get(did, None)
             if sub and sub.handler:
                 sub.handler(
@@ -1648,176 +1792,181 @@ class MIoTClient:
                         group_id=group_id))))
 
     @final
-    async def __refresh_props_from_cloud(self, patch_len: int = 150) -> bool:
-        if not self._network.network_status:
-            return False
-
-        request_list = None
-        if len(self._refresh_props_list) < patch_len:
-            request_list = self._refresh_props_list
-            self._refresh_props_list = {}
-        else:
-            request_list = {}
-            for _ in range(patch_len):
-                key, value = self._refresh_props_list.popitem()
-                request_list[key] = value
+    async def __refresh_props_handler(self) -> None:
+        batch: dict[str, list[MIoTRefreshItem]] = (
+            self._refresh_props_queue.pop_batch(
+                device_patch_len=REFRESH_PROPS_DEVICE_PATCH_LEN,
+                patch_len=REFRESH_PROPS_PATCH_LEN))
+        # Route every device to its best channel: central hub gateway,
+        # lan, then cloud
+        request_list: dict[str, dict[str, list[MIoTRefreshItem]]] = {
+            'gw': {}, 'lan': {}, 'cloud': {}}
+        for did, items in batch.items():
+            channel: Optional[str] = self.__get_refresh_channel(did=did)
+            if channel is None:
+                self.__on_refresh_props_results(
+                    channel='none', items=items, results=[])
+                continue
+            request_list[channel][did] = items
+        await asyncio.gather(
+            self.__refresh_props_from_gw(request_list['gw']),
+            self.__refresh_props_from_lan(request_list['lan']),
+            self.__refresh_props_from_cloud(request_list['cloud']))
+        _LOGGER.debug(
+            'refresh props, %s', self._refresh_props_queue.stats)
+        self._refresh_props_timer = None
+        self.__schedule_refresh_props()
+
+    @final
+    def __schedule_refresh_props(self) -> None:
+        delay: Optional[float] = self._refresh_props_queue.next_delay()
+        if delay is None:
+            return
+        self._refresh_props_timer = self._main_loop.call_later(
+            max(delay, REFRESH_PROPS_DELAY),
+            lambda: self._main_loop.create_task(
+                self.__refresh_props_handler()))
+
+    @final
+    def __get_refresh_channel(self, did: str) -> Optional[str]:
+        """Gateway, LAN, then cloud, unless get_prop_order is set."""
+        channels: list[str] = self.__get_prop_channels(
+            did=did, by_latency=False)
+        return channels[0] if channels else None
+
+    @final
+    def __get_prop_channels(
+        self, did: str, by_latency: bool = True
+    ) -> list[str]:
+        """Channels the device is reachable over, in get_prop_order,
+        fastest first or local first."""
+        channels: list[str] = []
+        if self._ctrl_mode == CtrlMode.AUTO:
+            device_gw = self._device_list_gateway.get(did, None)
+            if (
+                device_gw and device_gw.get('online', False)
+                and device_gw.get('specv2_access', False)
+                and device_gw.get('group_id', None) in self._mips_local
+            ):
+                channels.append('gw')
+            device_lan = self._device_list_lan.get(did, None)
+            if (
+                self._miot_lan.init_done
+                and device_lan and device_lan.get('online', False)
+            ):
+                channels.append('lan')
+        if self._network.network_status:
+            channels.append('cloud')
+        if self._get_prop_order:
+            return [
+                channel for channel in self._get_prop_order
+                if channel in channels]
+        if not by_latency:
+            return channels
+        now: float = self._main_loop.time()
+        return sorted(
+            channels,
+            key=lambda channel: self._get_prop_channel_stats[
+                channel].estimate(now=now))
+
+    @final
+    async def __refresh_props_from_cloud(
+        self, request_list: dict[str, list[MIoTRefreshItem]]
+    ) -> None:
+        if not request_list:
+            return
+        items: list[MIoTRefreshItem] = [
+            item for did_items in request_list.values()
+            for item in did_items]
+        results: list[dict] = []
         try:
             results = await self._http.get_props_async(
-                params=list(request_list.values()))
+                params=[item.params for item in items])
             if not results:
                 raise MIoTClientError('get_props_async failed')
-            for result in results:
-                if (
-                    'did' not in result
-                    or 'siid' not in result
-                    or 'piid' not in result
-                    or 'value' not in result
-                ):
-                    continue
-                request_list.pop(
-                    f'{result["did"]}|{result["siid"]}|{result["piid"]}',
-                    None)
-                self.__on_prop_msg(params=result, ctx=None)
-            if request_list:
-                _LOGGER.info(
-                    'refresh props failed, cloud, %s',
-                    list(request_list.keys()))
-                request_list = None
-            return True
         except Exception as err:  # pylint:disable=broad-exception-caught
             _LOGGER.error(
                 'refresh props error, cloud, %s, %s',
                 err, traceback.format_exc())
-            # Add failed request back to the list
-            self._refresh_props_list.update(request_list)
-            return False
+        self.__on_refresh_props_results(
+            channel='cloud', items=items, results=results or [])
 
     @final
-    async def __refresh_props_from_gw(self) -> bool:
-        if not self._mips_local or not self._device_list_gateway:
-            return False
-        request_list = {}
-        succeed_once = False
-        for key in list(self._refresh_props_list.keys()):
-            did = key.split('|')[0]
-            if did in request_list:
-                # NOTICE: A device only requests once a cycle, continuous
-                # acquisition of properties can cause device exceptions.
-                continue
-            params = self._refresh_props_list.pop(key)
+    async def __refresh_props_from_gw(
+        self, request_list: dict[str, list[MIoTRefreshItem]]
+    ) -> None:
+        async def get_props_async(
+            did: str, items: list[MIoTRefreshItem]
+        ) -> None:
+            results: list[dict] = []
             device_gw = self._device_list_gateway.get(did, None)
-            if not device_gw:
-                # Device not exist
-                continue
-            mips_gw = self._mips_local.get(device_gw['group_id'], None)
-            if not mips_gw:
-                _LOGGER.error('mips gateway not exist, %s', key)
-                continue
-            request_list[did] = {
-                **params,
-                'fut': mips_gw.get_prop_async(
-                    did=did, siid=params['siid'], piid=params['piid'],
-                    timeout_ms=6000)}
-        results = await asyncio.gather(
-            *[v['fut'] for v in request_list.values()])
-        for (did, param), result in zip(request_list.items(), results):
-            if result is None:
-                # Don't use "not result", it will be skipped when result
-                # is 0, false
-                continue
-            self.__on_prop_msg(
-                params={
-                    'did': did,
-                    'siid': param['siid'],
-                    'piid': param['piid'],
-                    'value': result},
-                ctx=None)
-            succeed_once = True
-        if succeed_once:
-            return True
-        _LOGGER.info(
-            'refresh props failed, gw, %s', list(request_list.keys()))
-        # Add failed request back to the list
-        self._refresh_props_list.update(request_list)
-        return False
+            mips_gw = self._mips_local.get(
+                device_gw['group_id'], None) if device_gw else None
+            if mips_gw:
+                results = await mips_gw.get_props_async(
+                    did=did, params=[item.params for item in items],
+                    timeout_ms=6000)
+            else:
+                _LOGGER.error('mips gateway not exist, %s', did)
+            self.__on_refresh_props_results(
+                channel='gw', items=items, results=results)
+        await asyncio.gather(*[
+            get_props_async(did, items)
+            for did, items in request_list.items()])
 
     @final
-    async def __refresh_props_from_lan(self) -> bool:
-        if not self._miot_lan.init_done or len(self._mips_local) > 0:
-            return False
-        request_list = {}
-        succeed_once = False
-        for key in list(self._refresh_props_list.keys()):
-            did = key.split('|')[0]
-            if did in request_list:
-                # NOTICE: A device only requests once a cycle, continuous
-                # acquisition of properties can cause device exceptions.
-                continue
-            params = self._refresh_props_list.pop(key)
-            if did not in self._device_list_lan:
-                continue
-            request_list[did] = {
-                **params,
-                'fut': self._miot_lan.get_prop_async(
-                    did=did, siid=params['siid'], piid=params['piid'],
-                    timeout_ms=6000)}
-        results = await asyncio.gather(
-            *[v['fut'] for v in request_list.values()])
-        for (did, param), result in zip(request_list.items(), results):
-            if result is None:
-                # Don't use "not result", it will be skipped when result
-                # is 0, false
+    async def __refresh_props_from_lan(
+        self, request_list: dict[str, list[MIoTRefreshItem]]
+    ) -> None:
+        async def get_props_async(
+            did: str, items: list[MIoTRefreshItem]
+        ) -> None:
+            results: list[dict] = []
+            try:
+                results = await self._miot_lan.get_props_async(
+                    did=did, params=[item.params for item in items],
+                    timeout_ms=6000)
+            except Exception as err:  # pylint:disable=broad-exception-caught
+                _LOGGER.error('refresh props error, lan, %s, %s', did, err)
+            self.__on_refresh_props_results(
+                channel='lan', items=items, results=results)
+        await asyncio.gather(*[
+            get_props_async(did, items)
+            for did, items in request_list.items()])
+
+    @final
+    def __on_refresh_props_results(
+        self, channel: str, items: list[MIoTRefreshItem], results: list[dict]
+    ) -> None:
+        values: dict[tuple, Any] = {
+            (str(result.get('did', None)), result.get('siid', None),
+             result.get('piid', None)): result['value']
+            for result in results
+            if isinstance(result, dict)
+            and result.get('code', 0) == 0 and 'value' in result}
+        failed_keys: list[str] = []
+        dropped_keys: list[str] = []
+        for item in items:
+            value_key = (item.did, item.siid, item.piid)
+            if value_key not in values:
+                failed_keys.append(item.key)
+                if not self._refresh_props_queue.retry(item):
+                    dropped_keys.append(item.key)
                 continue
+            self._refresh_props_queue.done(item)
             self.__on_prop_msg(
                 params={
-                    'did': did,
-                    'siid': param['siid'],
-                    'piid': param['piid'],
-                    'value': result},
+                    'did': item.did,
+                    'siid': item.siid,
+                    'piid': item.piid,
+                    'value': values[value_key]},
                 ctx=None)
-            succeed_once = True
-        if succeed_once:
-            return True
-        _LOGGER.info(
-            'refresh props failed, lan, %s', list(request_list.keys()))
-        # Add failed request back to the list
-        self._refresh_props_list.update(request_list)
-        return False
-
-    @final
-    async def __refresh_props_handler(self) -> None:
-        if not self._refresh_props_list:
-            return
-        # Cloud, Central hub gateway, Lan control
-        if (
-            await self.__refresh_props_from_cloud()
-            or await self.__refresh_props_from_gw()
-            or await self.__refresh_props_from_lan()
-        ):
-            self._refresh_props_retry_count = 0
-            if self._refresh_props_list:
-                self._refresh_props_timer = self._main_loop.call_later(
-                    REFRESH_PROPS_DELAY, lambda: self._main_loop.create_task(
-                        self.__refresh_props_handler()))
-            else:
-                self._refresh_props_timer = None
-            return
-
-        # Try three times, and if it fails three times, empty the list.
-        if self._refresh_props_retry_count >= 3:
-            self._refresh_props_list = {}
-            self._refresh_props_retry_count = 0
-            if self._refresh_props_timer:
-                self._refresh_props_timer.cancel()
-                self._refresh_props_timer = None
-            _LOGGER.info('refresh props failed, retry count exceed')
-            return
-        self._refresh_props_retry_count += 1
-        _LOGGER.info(
-            'refresh props failed, retry, %s', self._refresh_props_retry_count)
-        self._refresh_props_timer = self._main_loop.call_later(
-            REFRESH_PROPS_RETRY_DELAY, lambda: self._main_loop.create_task(
-                self.__refresh_props_handler()))
+        if failed_keys:
+            _LOGGER.info(
+                'refresh props failed, %s, %s', channel, failed_keys)
+        if dropped_keys:
+            _LOGGER.info(
+                'refresh props failed, retry count exceed, %s', dropped_keys)
 
     @final
     def __show_client_error_notify(
@@ -95,6 +95,7 @@ from .const import DOMAIN
 from .miot_client import MIoTClient
 from .miot_error import MIoTClientError, MIoTDeviceError
 from .miot_mips import MIoTDeviceState
+from .miot_refresh import MIoTRefreshPriority
 from .miot_spec import (
     MIoTSpecAction,
     MIoTSpecEvent,
@@ -108,6 +109,15 @@ from .miot_spec import (
 _LOGGER = logging.getLogger(__name__)
 
 
+def _refresh_priority(entity: Entity) -> MIoTRefreshPriority:
+    """Refresh hidden, diagnostic and config entities last."""
+    if entity.entity_category is not None or (
+        entity.registry_entry and entity.registry_entry.hidden_by
+    ):
+        return MIoTRefreshPriority.BACKGROUND
+    return MIoTRefreshPriority.VISIBLE
+
+
 class MIoTEntityData:
     """MIoT Entity Data."""
     platform: str
@@ -1010,6 +1020,10 @@ class MIoTServiceEntity(Entity):
         if self._attr_available:
             self.__refresh_props_value()
 
+    async def async_update(self) -> None:
+        # Not polled, only called by homeassistant.update_entity
+        self.__refresh_props_value(priority=MIoTRefreshPriority.USER)
+
     async def async_will_remove_from_hass(self) -> None:
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
@@ -1192,12 +1206,17 @@ class MIoTServiceEntity(Entity):
             return
         self.__refresh_props_value()
 
-    def __refresh_props_value(self) -> None:
+    def __refresh_props_value(
+        self, priority: Optional[MIoTRefreshPriority] = None
+    ) -> None:
+        if priority is None:
+            priority = _refresh_priority(self)
         for prop in self.entity_data.props:
             if not prop.readable:
                 continue
             self.miot_device.miot_client.request_refresh_prop(
-                did=self.miot_device.did, siid=prop.service.iid, piid=prop.iid)
+                did=self.miot_device.did, siid=prop.service.iid, piid=prop.iid,
+                priority=priority)
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
         self._pending_write_ha_state_timer = self._main_loop.call_later(
@@ -1274,6 +1293,10 @@ class MIoTPropertyEntity(Entity):
         if self._attr_available:
             self.__request_refresh_prop()
 
+    async def async_update(self) -> None:
+        # Not polled, only called by homeassistant.update_entity
+        self.__request_refresh_prop(priority=MIoTRefreshPriority.USER)
+
     async def async_will_remove_from_hass(self) -> None:
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
@@ -1345,11 +1368,15 @@ class MIoTPropertyEntity(Entity):
         # Refresh value
         self.__request_refresh_prop()
 
-    def __request_refresh_prop(self) -> None:
+    def __request_refresh_prop(
+        self, priority: Optional[MIoTRefreshPriority] = None
+    ) -> None:
+        if priority is None:
+            priority = _refresh_priority(self)
         if self.spec.readable:
             self.miot_device.miot_client.request_refresh_prop(
                 did=self.miot_device.did, siid=self.service.iid,
-                piid=self.spec.iid)
+                piid=self.spec.iid, priority=priority)
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
         self._pending_write_ha_state_timer = self._main_loop.call_later(
@@ -50,9 +50,13 @@ MIoT lan device control, only support MIoT SPEC-v2 WiFi devices.
 import json
 import time
 import asyncio
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum, auto
+import hashlib
+import ipaddress
 import logging
+import math
 import random
 import secrets
 import socket
@@ -60,7 +64,6 @@ import struct
 import threading
 from typing import Any, Callable, Coroutine, Optional, final
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 
@@ -74,6 +77,9 @@ from .common import (
 
 _LOGGER = logging.getLogger(__name__)
 
+# Reused by every send, json.dumps() builds a new encoder per call otherwise
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
 
 @dataclass
 class _MIoTLanGetDevListData:
@@ -120,6 +126,130 @@ class _MIoTLanRequestData:
     timeout: Optional[asyncio.TimerHandle]
 
 
+@dataclass
+class _MIoTLanRpcData:
+    did: str
+    msg: dict
+    handler: Callable[[dict, Any], None]
+    handler_ctx: Any
+    # Caller deadline, internal loop time
+    deadline: float
+    timeout: Optional[asyncio.TimerHandle]
+    done: bool = False
+
+
+@dataclass
+class _MIoTLanRpcFlight:
+    """One request on the wire, carrying one or more merged rpcs."""
+    did: str
+    msg: dict
+    rpcs: list[_MIoTLanRpcData]
+    sent_ts: float = 0
+    retries: int = 0
+
+
+class _MIoTLanTimer:
+    """Timer handle of _MIoTLanTimerWheel."""
+    callback: Callable[..., None]
+    args: tuple
+    rounds: int
+    cancelled: bool
+
+    def __init__(
+        self, callback: Callable[..., None], args: tuple, rounds: int
+    ) -> None:
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class _MIoTLanTimerWheel:
+    """Hashed timer wheel for keep-alive and housekeeping timers.
+
+    A single loop timer advances the wheel one slot per tick, so hundreds of
+    devices cost one heap operation per tick instead of one per timer. Delays
+    are rounded up to the tick, timers longer than a revolution wait out the
+    extra rounds in their slot, and cancelled timers are dropped lazily.
+    Tick handlers run after the timers of each tick.
+    """
+    TICK: float = 0.5
+    SLOTS: int = 128
+
+    _loop: asyncio.AbstractEventLoop
+    _slots: list[list[_MIoTLanTimer]]
+    _cursor: int
+    _next_tick: float
+    _handle: Optional[asyncio.TimerHandle]
+    _tick_handlers: list[Callable[[], None]]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._slots = [[] for _ in range(self.SLOTS)]
+        self._cursor = 0
+        self._next_tick = 0
+        self._handle = None
+        self._tick_handlers = []
+
+    def start(self) -> None:
+        if self._handle:
+            return
+        self._next_tick = self._loop.time() + self.TICK
+        self._handle = self._loop.call_at(self._next_tick, self.__on_tick)
+
+    def stop(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        for slot in self._slots:
+            slot.clear()
+
+    def add_tick_handler(self, handler: Callable[[], None]) -> None:
+        self._tick_handlers.append(handler)
+
+    def call_later(
+        self, delay: float, callback: Callable[..., None], *args: Any
+    ) -> _MIoTLanTimer:
+        ticks: int = max(1, math.ceil(delay / self.TICK))
+        timer = _MIoTLanTimer(
+            callback=callback, args=args, rounds=(ticks - 1) // self.SLOTS)
+        self._slots[(self._cursor + ticks) % self.SLOTS].append(timer)
+        return timer
+
+    def __on_tick(self) -> None:
+        self._cursor = (self._cursor + 1) % self.SLOTS
+        pending: list[_MIoTLanTimer] = []
+        due: list[_MIoTLanTimer] = []
+        for timer in self._slots[self._cursor]:
+            if timer.cancelled:
+                continue
+            if timer.rounds:
+                timer.rounds -= 1
+                pending.append(timer)
+            else:
+                due.append(timer)
+        self._slots[self._cursor] = pending
+        for timer in due:
+            # An earlier timer of this tick may have cancelled it
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('timer callback error, %s', err)
+        for handler in self._tick_handlers:
+            try:
+                handler()
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('tick handler error, %s', err)
+        # A late tick is never skipped, the next one just runs at once
+        self._next_tick += self.TICK
+        self._handle = self._loop.call_at(self._next_tick, self.__on_tick)
+
+
 class _MIoTLanDeviceState(Enum):
     FRESH = 0
     PING1 = auto()
@@ -133,6 +263,12 @@ class _MIoTLanDevice:
     # pylint: disable=unused-argument
     OT_HEADER: int = 0x2131
     OT_HEADER_LEN: int = 32
+    # magic, length, did, timestamp; the MD5 checksum follows
+    OT_HEADER_STRUCT: struct.Struct = struct.Struct('>HHQI')
+    # Outgoing header with the token as checksum placeholder
+    OT_PACKET_STRUCT: struct.Struct = struct.Struct('>HHQI16s')
+    # PKCS7 padding for each possible pad length
+    PKCS7_PADS: tuple[bytes, ...] = tuple(bytes((n,))*n for n in range(17))
     NETWORK_UNSTABLE_CNT_TH: int = 10
     NETWORK_UNSTABLE_TIME_TH: float = 120
     NETWORK_UNSTABLE_RESUME_TH: float = 300
@@ -140,6 +276,12 @@ class _MIoTLanDevice:
     CONSTRUCT_STATE_PENDING: float = 15
     KA_INTERVAL_MIN: float = 10
     KA_INTERVAL_MAX: float = 50
+    # Unanswered unicast discovery probes before falling back to broadcast
+    UNICAST_PROBE_MAX: int = 3
+    # Retransmission timeout of idempotent rpcs, from the smoothed RTT
+    RPC_RTO_INIT: float = 3
+    RPC_RTO_MIN: float = 0.5
+    RPC_RTO_MAX: float = 10
 
     did: str
     token: bytes
@@ -150,6 +292,7 @@ class _MIoTLanDevice:
     subscribed: bool
     sub_ts: int
     supported_wildcard_sub: bool
+    unicast_probes: int
 
     _manager: 'MIoTLan'
     _if_name: Optional[str]
@@ -157,11 +300,14 @@ class _MIoTLanDevice:
     _state: _MIoTLanDeviceState
     _online: bool
     _online_offline_history: list[dict[str, Any]]
-    _online_offline_timer: Optional[asyncio.TimerHandle]
+    _online_offline_timer: Optional[_MIoTLanTimer]
 
-    _ka_timer: Optional[asyncio.TimerHandle]
+    _ka_timer: Optional[_MIoTLanTimer]
     _ka_internal: float
 
+    _srtt: Optional[float]
+    _rttvar: float
+
 # All functions SHOULD be called from the internal loop
 
     def __init__(
@@ -183,6 +329,9 @@ class _MIoTLanDevice:
         self.subscribed = False
         self.sub_ts = 0
         self.supported_wildcard_sub = False
+        self.unicast_probes = 0
+        self._srtt = None
+        self._rttvar = 0
         self._if_name = None
         self._sub_locked = False
         self._state = _MIoTLanDeviceState.DEAD
@@ -193,13 +342,14 @@ class _MIoTLanDevice:
         def ka_init_handler() -> None:
             self._ka_internal = self.KA_INTERVAL_MIN
             self.__update_keep_alive(state=_MIoTLanDeviceState.DEAD)
-        self._ka_timer = self._manager.internal_loop.call_later(
+        self._ka_timer = self._manager.timer_wheel.call_later(
             randomize_float(self.CONSTRUCT_STATE_PENDING, 0.5),
             ka_init_handler,)
         _LOGGER.debug('miot lan device add, %s', self.did)
 
     def keep_alive(self, ip: str, if_name: str) -> None:
         self.ip = ip
+        self.unicast_probes = 0
         if self._if_name != if_name:
             self._if_name = if_name
             _LOGGER.info(
@@ -223,41 +373,93 @@ class _MIoTLanDevice:
     def if_name(self) -> Optional[str]:
         return self._if_name
 
+    @property
+    def discovered(self) -> bool:
+        return self._state != _MIoTLanDeviceState.DEAD
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Smoothed rpc round trip time in seconds, None before any reply."""
+        return self._srtt
+
+    @property
+    def rpc_rto(self) -> float:
+        if self._srtt is None:
+            return self.RPC_RTO_INIT
+        return min(
+            max(self._srtt + 4*self._rttvar, self.RPC_RTO_MIN),
+            self.RPC_RTO_MAX)
+
+    def update_rtt(self, rtt: float) -> None:
+        # Jacobson/Karels, as TCP does
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt/2
+            return
+        self._rttvar = 0.75*self._rttvar + 0.25*abs(self._srtt - rtt)
+        self._srtt = 0.875*self._srtt + 0.125*rtt
+
     def gen_packet(
         self, out_buffer: bytearray, clear_data: dict, did: str, offset: int
     ) -> int:
-        clear_bytes = json.dumps(clear_data, ensure_ascii=False).encode('utf-8')
-        padder = padding.PKCS7(algorithms.AES128.block_size).padder()
-        padded_data = padder.update(clear_bytes) + padder.finalize()
-        if len(padded_data) + self.OT_HEADER_LEN > len(out_buffer):
+        """Build an encrypted packet in out_buffer, return its length.
+
+        The packet is encrypted straight into out_buffer, which MUST have one
+        AES block of room beyond the packet.
+        """
+        clear_bytes: bytes = _JSON_ENCODER.encode(clear_data).encode('utf-8')
+        pad_len: int = 16 - len(clear_bytes) % 16
+        data_len: int = self.OT_HEADER_LEN + len(clear_bytes) + pad_len
+        if data_len + 16 > len(out_buffer):
             raise ValueError('rpc too long')
-        encryptor = self.cipher.encryptor()
-        encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
-        data_len: int = len(encrypted_data)+self.OT_HEADER_LEN
-        out_buffer[:32] = struct.pack(
-            '>HHQI16s', self.OT_HEADER, data_len, int(did), offset,
+        out_view = memoryview(out_buffer)
+        self.OT_PACKET_STRUCT.pack_into(
+            out_buffer, 0, self.OT_HEADER, data_len, int(did), offset,
             self.token)
-        out_buffer[32:data_len] = encrypted_data
-        msg_md5: bytes = self.__md5(out_buffer[0:data_len])
-        out_buffer[16:32] = msg_md5
+        # CBC contexts are single use, only the Cipher itself can be cached
+        encryptor = self.cipher.encryptor()
+        encryptor.update_into(
+            clear_bytes + self.PKCS7_PADS[pad_len], out_view[32:])
+        encryptor.finalize()
+        out_buffer[16:32] = hashlib.md5(out_view[:data_len]).digest()
         return data_len
 
-    def decrypt_packet(self, encrypted_data: bytearray) -> dict:
-        data_len: int = struct.unpack('>H', encrypted_data[2:4])[0]
-        md5_orig: bytes = encrypted_data[16:32]
-        encrypted_data[16:32] = self.token
-        md5_calc: bytes = self.__md5(encrypted_data[0:data_len])
-        if md5_orig != md5_calc:
-            raise ValueError(f'invalid md5, {md5_orig}, {md5_calc}')
+    def decrypt_packet(
+        self, encrypted_data: memoryview, out_buffer: bytearray
+    ) -> dict:
+        """Verify and decrypt a packet without copying it.
+
+        encrypted_data is a view of the received datagram; the plaintext is
+        decrypted into out_buffer, which MUST hold at least the packet length
+        plus one AES block.
+        """
+        data_len: int = self.OT_HEADER_STRUCT.unpack_from(encrypted_data)[1]
+        if not self.OT_HEADER_LEN < data_len <= len(encrypted_data):
+            raise ValueError(f'invalid length, {data_len}')
+        # The checksum is the MD5 of the packet with the token in its place
+        hasher = hashlib.md5(encrypted_data[:16])
+        hasher.update(self.token)
+        hasher.update(encrypted_data[32:data_len])
+        md5_calc: bytes = hasher.digest()
+        if encrypted_data[16:32] != md5_calc:
+            raise ValueError(
+                f'invalid md5, {bytes(encrypted_data[16:32])}, {md5_calc}')
         decryptor = self.cipher.decryptor()
-        decrypted_padded_data = decryptor.update(
-            encrypted_data[32:data_len]) + decryptor.finalize()
-        unpadder = padding.PKCS7(algorithms.AES128.block_size).unpadder()
-        decrypted_data = unpadder.update(
-            decrypted_padded_data) + unpadder.finalize()
+        out_len: int = decryptor.update_into(
+            encrypted_data[32:data_len], out_buffer)
+        decryptor.finalize()
+        # PKCS7 unpadding in place
+        pad_len: int = out_buffer[out_len-1]
+        if (
+            not 0 < pad_len <= 16
+            or out_buffer.count(pad_len, out_len-pad_len, out_len) != pad_len
+        ):
+            raise ValueError('invalid padding')
+        end: int = out_len - pad_len
         # Some device will add a redundant \0 at the end of JSON string
-        decrypted_data = decrypted_data.rstrip(b'\x00')
-        return json.loads(decrypted_data)
+        while end > 0 and out_buffer[end-1] == 0:
+            end -= 1
+        return json.loads(str(memoryview(out_buffer)[:end], 'utf-8'))
 
     def subscribe(self) -> None:
         if self._sub_locked:
@@ -328,6 +530,14 @@ class _MIoTLanDevice:
                 algorithms.AES128(aes_key),
                 modes.CBC(aex_iv), default_backend())
             _LOGGER.debug('update token, %s', self.did)
+        if (
+            info.get('ip')
+            and info['ip'] != self.ip
+            and not self.discovered
+        ):
+            # New cached ip, worth a few unicast probes again
+            self.ip = info['ip']
+            self.unicast_probes = 0
 
     def __subscribe_handler(self, msg: dict, sub_ts: int) -> None:
         if (
@@ -367,7 +577,7 @@ class _MIoTLanDevice:
                 if last_state == _MIoTLanDeviceState.DEAD:
                     self._ka_internal = self.KA_INTERVAL_MIN
                     self.__change_online(True)
-                self._ka_timer = self._manager.internal_loop.call_later(
+                self._ka_timer = self._manager.timer_wheel.call_later(
                     self.__get_next_ka_timeout(), self.__update_keep_alive,
                     _MIoTLanDeviceState.PING1)
             case (
@@ -376,7 +586,7 @@ class _MIoTLanDevice:
                     | _MIoTLanDeviceState.PING3
             ):
                 # Set the timer first to avoid Any early returns
-                self._ka_timer = self._manager.internal_loop.call_later(
+                self._ka_timer = self._manager.timer_wheel.call_later(
                     self.FAST_PING_INTERVAL, self.__update_keep_alive,
                     _MIoTLanDeviceState(state.value+1))
                 # Fast ping
@@ -387,10 +597,13 @@ class _MIoTLanDevice:
                 if self.ip is None:
                     _LOGGER.error('ip is Not set for device, %s', self.did)
                     return
-                self._manager.ping(if_name=self._if_name, target_ip=self.ip)
+                self._manager.queue_ping(
+                    if_name=self._if_name, target_ip=self.ip)
             case _MIoTLanDeviceState.DEAD:
                 if last_state == _MIoTLanDeviceState.PING3:
                     self._ka_internal = self.KA_INTERVAL_MIN
+                    # The fast pings already went to the last known ip
+                    self.unicast_probes = self.UNICAST_PROBE_MAX
                     self.__change_online(False)
             case _:
                 _LOGGER.error('invalid state, %s', state)
@@ -421,7 +634,7 @@ class _MIoTLanDevice:
             else:
                 _LOGGER.info('unstable device detected, %s', self.did)
                 self._online_offline_timer = (
-                    self._manager.internal_loop.call_later(
+                    self._manager.timer_wheel.call_later(
                         self.NETWORK_UNSTABLE_RESUME_TH,
                         self.__online_resume_handler))
 
@@ -447,6 +660,14 @@ class MIoTLan:
 
     OT_PROBE_INTERVAL_MIN: float = 5
     OT_PROBE_INTERVAL_MAX: float = 45
+    # Keep-alive probes queued in one tick for more than half of the devices
+    # on an interface (and at least this many) go out as one broadcast
+    OT_PROBE_COALESCE_MIN: int = 4
+    DUP_FILTER_TTL: float = 5
+    # Requests in flight per device; queued get_properties are merged into
+    # one request of at most OT_RPC_MERGE_MAX_PROPS properties
+    OT_RPC_WINDOW: int = 2
+    OT_RPC_MERGE_MAX_PROPS: int = 16
 
     PROFILE_MODELS_FILE: str = 'lan/profile_models.yaml'
 
@@ -459,7 +680,10 @@ class MIoTLan:
     _virtual_did: str
     _probe_msg: bytes
     _write_buffer: bytearray
+    _write_view: memoryview
     _read_buffer: bytearray
+    _read_view: memoryview
+    _decrypt_buffer: bytearray
 
     _internal_loop: asyncio.AbstractEventLoop
     _thread: threading.Thread
@@ -469,11 +693,21 @@ class MIoTLan:
     _local_port: Optional[int]
     _scan_timer: Optional[asyncio.TimerHandle]
     _last_scan_interval: Optional[float]
+    # Undiscovered devices at the last scan, and whether the next scan
+    # MUST broadcast (startup, network changes)
+    _last_undiscovered: int
+    _scan_broadcast: bool
+    _timer_wheel: _MIoTLanTimerWheel
+    _pending_pings: dict[str, set[str]]
     _msg_id_counter: int
     _pending_requests: dict[int, _MIoTLanRequestData]
+    _rpc_window: int
+    _rpc_queues: dict[str, deque[_MIoTLanRpcData]]
+    _rpc_in_flight: dict[str, int]
     _device_msg_matcher: MIoTMatcher
     _device_state_sub_map: dict[str, _MIoTLanSubDeviceData]
-    _reply_msg_buffer: dict[str, asyncio.TimerHandle]
+    # filter id -> expiry, in insertion (and so expiry) order
+    _reply_msg_buffer: dict[str, float]
 
     _lan_state_sub_map: dict[str, Callable[[bool], Coroutine]]
     _lan_ctrl_vote_map: dict[str, bool]
@@ -492,7 +726,8 @@ class MIoTLan:
         mips_service: MipsService,
         enable_subscribe: bool = False,
         virtual_did: Optional[int] = None,
-        loop: Optional[asyncio.AbstractEventLoop] = None
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        rpc_window: Optional[int] = None
     ) -> None:
         if not network:
             raise ValueError('network is required')
@@ -509,6 +744,7 @@ class MIoTLan:
             key='miot_lan', group_id='*',
             handler=self.__on_mips_service_change)
         self._enable_subscribe = enable_subscribe
+        self._rpc_window = max(1, rpc_window or self.OT_RPC_WINDOW)
         self._virtual_did = (
             str(virtual_did) if (virtual_did is not None)
             else str(secrets.randbits(64)))
@@ -519,8 +755,13 @@ class MIoTLan:
         probe_bytes[20:28] = struct.pack('>Q', int(self._virtual_did))
         probe_bytes[28:32] = b'\x00\x00\x00\x00'
         self._probe_msg = bytes(probe_bytes)
+        # Reused for every packet; the receive path only passes views of them
         self._read_buffer = bytearray(self.OT_MSG_LEN)
-        self._write_buffer = bytearray(self.OT_MSG_LEN)
+        self._read_view = memoryview(self._read_buffer)
+        self._decrypt_buffer = bytearray(self.OT_MSG_LEN + 16)
+        # One extra AES block for update_into
+        self._write_buffer = bytearray(self.OT_MSG_LEN + 16)
+        self._write_view = memoryview(self._write_buffer)
 
         self._lan_devices = {}
         self._available_net_ifs = set()
@@ -528,8 +769,13 @@ class MIoTLan:
         self._local_port = None
         self._scan_timer = None
         self._last_scan_interval = None
+        self._last_undiscovered = 0
+        self._scan_broadcast = True
+        self._pending_pings = {}
         self._msg_id_counter = int(random.random()*0x7FFFFFFF)
         self._pending_requests = {}
+        self._rpc_queues = {}
+        self._rpc_in_flight = {}
         self._device_msg_matcher = MIoTMatcher()
         self._device_state_sub_map = {}
         self._reply_msg_buffer = {}
@@ -563,6 +809,10 @@ class MIoTLan:
     def internal_loop(self) -> asyncio.AbstractEventLoop:
         return self._internal_loop
 
+    @property
+    def timer_wheel(self) -> _MIoTLanTimerWheel:
+        return self._timer_wheel
+
     @property
     def init_done(self) -> bool:
         return self._init_done
@@ -611,6 +861,9 @@ class MIoTLan:
 
     def __internal_loop_thread(self) -> None:
         _LOGGER.info('miot lan thread start')
+        self._timer_wheel = _MIoTLanTimerWheel(self._internal_loop)
+        self._timer_wheel.add_tick_handler(self.__on_timer_tick)
+        self._timer_wheel.start()
         self.__init_socket()
         self._scan_timer = self._internal_loop.call_later(
             int(3*random.random()), self.__scan_devices)
@@ -632,8 +885,13 @@ class MIoTLan:
         self._local_port = None
         self._scan_timer = None
         self._last_scan_interval = None
+        self._last_undiscovered = 0
+        self._scan_broadcast = True
+        self._pending_pings = {}
         self._msg_id_counter = int(random.random()*0x7FFFFFFF)
         self._pending_requests = {}
+        self._rpc_queues = {}
+        self._rpc_in_flight = {}
         self._device_msg_matcher = MIoTMatcher()
         self._device_state_sub_map = {}
         self._reply_msg_buffer = {}
@@ -832,6 +1090,29 @@ class MIoTLan:
             return result_obj['result'][0].get('value', None)
         return None
 
+    @final
+    async def get_props_async(
+        self, did: str, params: list[dict], timeout_ms: int = 10000
+    ) -> list[dict]:
+        """Get several properties of a device with one get_properties.
+
+        params items MUST contain siid and piid. Return the result items
+        (did, siid, piid, code, value) the device answered.
+        """
+        self.__assert_service_ready()
+        result_obj = await self.__call_api_async(
+            did=did, msg={
+                'method': 'get_properties',
+                'params': [
+                    {'did': did, 'siid': param['siid'], 'piid': param['piid']}
+                    for param in params]
+            }, timeout_ms=timeout_ms)
+        if not result_obj or not isinstance(result_obj.get('result'), list):
+            return []
+        return [
+            item for item in result_obj['result']
+            if isinstance(item, dict) and item.get('did', None) == did]
+
     @final
     async def set_prop_async(
         self, did: str, siid: int, piid: int, value: Any,
@@ -956,6 +1237,12 @@ class MIoTLan:
             if_name=if_name, data=self._probe_msg, address=target_ip,
             port=self.OT_PORT)
 
+    def queue_ping(self, if_name: str, target_ip: str) -> None:
+        """Ping at the end of the current timer tick, coalesced per if."""
+        if not target_ip:
+            return
+        self._pending_pings.setdefault(if_name, set()).add(target_ip)
+
     def send2device(
         self, did: str,
         msg: dict,
@@ -983,7 +1270,7 @@ class MIoTLan:
 
         return self.__make_request(
             msg_id=in_msg['id'],
-            msg=self._write_buffer[0: msg_len],
+            msg=self._write_view[:msg_len],
             if_name=device.if_name,
             ip=device.ip,
             handler=handler,
@@ -993,7 +1280,7 @@ class MIoTLan:
     def __make_request(
         self,
         msg_id: int,
-        msg: bytearray,
+        msg: memoryview,
         if_name: str,
         ip: str,
         handler: Optional[Callable[[dict, Any], None]],
@@ -1043,19 +1330,142 @@ class MIoTLan:
         handler_ctx: Any,
         timeout_ms: int = 10000
     ) -> None:
+        if did not in self._lan_devices:
+            handler({
+                'code': MIoTErrorCode.CODE_INTERNAL_ERROR.value,
+                'error': 'invalid device'},
+                handler_ctx)
+            return
+        rpc = _MIoTLanRpcData(
+            did=did,
+            msg=msg,
+            handler=handler,
+            handler_ctx=handler_ctx,
+            deadline=self._internal_loop.time() + timeout_ms/1000,
+            timeout=None)
+        rpc.timeout = self._internal_loop.call_later(
+            timeout_ms/1000, self.__on_rpc_timeout, rpc)
+        self._rpc_queues.setdefault(did, deque()).append(rpc)
+        self.__rpc_dispatch(did)
+
+    def __rpc_dispatch(self, did: str) -> None:
+        """Send queued rpcs of a device while its window has room.
+
+        Consecutive get_properties at the head of the queue go out as one
+        request, later ones are not merged ahead of a set or an action.
+        """
+        queue = self._rpc_queues.get(did, None)
+        while queue and self._rpc_in_flight.get(did, 0) < self._rpc_window:
+            rpcs: list[_MIoTLanRpcData] = [queue.popleft()]
+            msg: dict = rpcs[0].msg
+            if msg.get('method', None) == 'get_properties':
+                params: dict[tuple, dict] = {
+                    (param['siid'], param['piid']): param
+                    for param in msg['params']}
+                while (
+                    queue
+                    and queue[0].msg.get('method', None) == 'get_properties'
+                    and len(params) + len(queue[0].msg['params'])
+                    <= self.OT_RPC_MERGE_MAX_PROPS
+                ):
+                    rpc = queue.popleft()
+                    for param in rpc.msg['params']:
+                        params.setdefault((param['siid'], param['piid']), param)
+                    rpcs.append(rpc)
+                if len(rpcs) > 1:
+                    msg = {
+                        'method': 'get_properties',
+                        'params': list(params.values())}
+            if not queue:
+                self._rpc_queues.pop(did, None)
+            self._rpc_in_flight[did] = self._rpc_in_flight.get(did, 0) + 1
+            self.__rpc_send(_MIoTLanRpcFlight(did=did, msg=msg, rpcs=rpcs))
+
+    def __rpc_send(self, flight: _MIoTLanRpcFlight) -> None:
+        now: float = self._internal_loop.time()
+        remaining: float = max(
+            (rpc.deadline for rpc in flight.rpcs if not rpc.done),
+            default=now) - now
+        device: Optional[_MIoTLanDevice] = self._lan_devices.get(flight.did)
+        timeout: float = remaining
+        if device and flight.msg['method'] == 'get_properties':
+            # Reads are safe to resend, do not wait out the caller timeout
+            timeout = min(device.rpc_rto * 2**flight.retries, remaining)
+        flight.sent_ts = now
         try:
             self.send2device(
-                did=did,
-                msg={'from': 'ha.xiaomi_home', **msg},
-                handler=handler,
-                handler_ctx=handler_ctx,
-                timeout_ms=timeout_ms)
+                did=flight.did,
+                msg={'from': 'ha.xiaomi_home', **flight.msg},
+                handler=self.__on_rpc_reply,
+                handler_ctx=flight,
+                timeout_ms=max(1, int(timeout*1000)))
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('send2device error, %s', err)
-            handler({
+            self.__rpc_finish(flight, {
                 'code': MIoTErrorCode.CODE_INTERNAL_ERROR.value,
-                'error': str(err)},
-                handler_ctx)
+                'error': str(err)})
+
+    def __on_rpc_reply(self, msg: dict, flight: _MIoTLanRpcFlight) -> None:
+        now: float = self._internal_loop.time()
+        device: Optional[_MIoTLanDevice] = self._lan_devices.get(flight.did)
+        if 'id' not in msg:
+            # Local timeout, resend reads while any caller still waits
+            if (
+                flight.msg['method'] == 'get_properties'
+                and any(
+                    not rpc.done and rpc.deadline > now
+                    for rpc in flight.rpcs)
+            ):
+                flight.retries += 1
+                self.__rpc_send(flight)
+                return
+        elif device and flight.retries == 0:
+            # Karn's algorithm, retransmitted requests are ambiguous
+            device.update_rtt(now - flight.sent_ts)
+        self.__rpc_finish(flight, msg)
+        self.__rpc_dispatch(flight.did)
+
+    def __rpc_finish(self, flight: _MIoTLanRpcFlight, msg: dict) -> None:
+        in_flight: int = self._rpc_in_flight.get(flight.did, 0) - 1
+        if in_flight > 0:
+            self._rpc_in_flight[flight.did] = in_flight
+        else:
+            self._rpc_in_flight.pop(flight.did, None)
+        results: Optional[dict[tuple, dict]] = None
+        if len(flight.rpcs) > 1 and isinstance(msg.get('result', None), list):
+            results = {
+                (item.get('siid', None), item.get('piid', None)): item
+                for item in msg['result'] if isinstance(item, dict)}
+        for rpc in flight.rpcs:
+            if rpc.done:
+                continue
+            rpc.done = True
+            if rpc.timeout:
+                rpc.timeout.cancel()
+                rpc.timeout = None
+            rpc_msg: dict = msg
+            if results is not None:
+                # Split the merged reply back per caller
+                rpc_msg = {**msg, 'result': [
+                    results[(param['siid'], param['piid'])]
+                    for param in rpc.msg['params']
+                    if (param['siid'], param['piid']) in results]}
+            rpc.handler(rpc_msg, rpc.handler_ctx)
+
+    def __on_rpc_timeout(self, rpc: _MIoTLanRpcData) -> None:
+        rpc.timeout = None
+        if rpc.done:
+            return
+        rpc.done = True
+        queue = self._rpc_queues.get(rpc.did, None)
+        if queue and rpc in queue:
+            queue.remove(rpc)
+            if not queue:
+                self._rpc_queues.pop(rpc.did, None)
+        rpc.handler({
+            'code': MIoTErrorCode.CODE_TIMEOUT.value,
+            'error': 'timeout'},
+            rpc.handler_ctx)
 
     def __sub_device_state(self, data: _MIoTLanSubDeviceData) -> None:
         self._device_state_sub_map[data.key] = data
@@ -1084,6 +1494,7 @@ class MIoTLan:
             dev_list, data.handler_ctx)
 
     def __update_devices(self, devices: dict[str, dict]) -> None:
+        added: bool = False
         for did, info in devices.items():
             # did MUST be digit(UINT64)
             if not did.isdigit():
@@ -1110,8 +1521,12 @@ class MIoTLan:
                 self._lan_devices[did] = _MIoTLanDevice(
                     manager=self, did=did, token=info['token'],
                     ip=info.get('ip', None))
+                added = True
             else:
                 self._lan_devices[did].update_info(info)
+        if added:
+            # Probe the new devices now rather than at the next backoff
+            self.__reset_scan(broadcast=False)
 
     def __delete_devices(self, devices: list[str]) -> None:
         for did in devices:
@@ -1119,12 +1534,22 @@ class MIoTLan:
             if not lan_device:
                 continue
             lan_device.on_delete()
+            for rpc in self._rpc_queues.pop(did, ()):
+                rpc.done = True
+                if rpc.timeout:
+                    rpc.timeout.cancel()
+                    rpc.timeout = None
+                rpc.handler({
+                    'code': MIoTErrorCode.CODE_INTERNAL_ERROR.value,
+                    'error': 'invalid device'},
+                    rpc.handler_ctx)
 
     def __on_network_info_change(self, data: _MIoTLanNetworkUpdateData) -> None:
         if data.status == InterfaceStatus.ADD:
             self._available_net_ifs.add(data.if_name)
             if data.if_name in self._net_ifs:
                 self.__create_socket(if_name=data.if_name)
+                self.__reset_scan(broadcast=True)
         elif data.status == InterfaceStatus.REMOVE:
             self._available_net_ifs.remove(data.if_name)
             self.__destroy_socket(if_name=data.if_name)
@@ -1137,6 +1562,7 @@ class MIoTLan:
             for if_name in list(self._broadcast_socks.keys()):
                 if if_name not in self._net_ifs:
                     self.__destroy_socket(if_name=if_name)
+            self.__reset_scan(broadcast=True)
 
     def __update_subscribe_option(self, options: dict) -> None:
         if 'enable_subscribe' in options:
@@ -1160,9 +1586,16 @@ class MIoTLan:
                 req_data.timeout.cancel()
                 req_data.timeout = None
         self._pending_requests.clear()
-        for timer in self._reply_msg_buffer.values():
-            timer.cancel()
+        for queue in self._rpc_queues.values():
+            for rpc in queue:
+                if rpc.timeout:
+                    rpc.timeout.cancel()
+                    rpc.timeout = None
+        self._rpc_queues.clear()
+        self._rpc_in_flight.clear()
         self._reply_msg_buffer.clear()
+        self._pending_pings.clear()
+        self._timer_wheel.stop()
         self._device_msg_matcher = MIoTMatcher()
         self.__deinit_socket()
         self._internal_loop.stop()
@@ -1222,21 +1655,22 @@ class MIoTLan:
                 # Not ot msg
                 return
             self.__raw_message_handler(
-                self._read_buffer[:data_len], data_len, addr[0], ctx[0])
+                self._read_view[:data_len], data_len, addr[0], ctx[0])
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('socket read handler error, %s', err)
 
     def __raw_message_handler(
-        self, data: bytearray, data_len: int, ip: str, if_name: str
+        self, data: memoryview, data_len: int, ip: str, if_name: str
     ) -> None:
-        if data[:2] != self.OT_HEADER:
+        if data_len < self.OT_PROBE_LEN or data[:2] != self.OT_HEADER:
             return
         # Keep alive message
-        did: str = str(struct.unpack('>Q', data[4:12])[0])
+        _, _, did_int, timestamp = (
+            _MIoTLanDevice.OT_HEADER_STRUCT.unpack_from(data))
+        did: str = str(did_int)
         device: Optional[_MIoTLanDevice] = self._lan_devices.get(did)
         if not device:
             return
-        timestamp: int = struct.unpack('>I', data[12:16])[0]
         device.offset = int(time.time()) - timestamp
         # Keep alive if this is a probe
         if data_len == self.OT_PROBE_LEN or device.subscribed:
@@ -1250,7 +1684,7 @@ class MIoTLan:
         ):
             device.supported_wildcard_sub = (
                 int(data[28]) == self.OT_SUPPORT_WILDCARD_SUB)
-            sub_ts = struct.unpack('>I', data[20:24])[0]
+            sub_ts = int.from_bytes(data[20:24], 'big')
             sub_type = int(data[27])
             if (
                 device.supported_wildcard_sub
@@ -1262,7 +1696,8 @@ class MIoTLan:
         if data_len > self.OT_PROBE_LEN:
             # handle device message
             try:
-                decrypted_data = device.decrypt_packet(data)
+                decrypted_data = device.decrypt_packet(
+                    data, self._decrypt_buffer)
                 self.__message_handler(did, decrypted_data)
             except Exception as err:   # pylint: disable=broad-exception-caught
                 _LOGGER.error('decrypt packet error, %s, %s', did, err)
@@ -1279,9 +1714,9 @@ class MIoTLan:
             if req.timeout:
                 req.timeout.cancel()
                 req.timeout = None
+            # Called in the internal loop, as on timeout
             if req.handler is not None:
-                self._main_loop.call_soon_threadsafe(
-                    req.handler, msg, req.handler_ctx)
+                req.handler(msg, req.handler_ctx)
             return
         # Handle up link message
         if 'method' not in msg or 'params' not in msg:
@@ -1328,14 +1763,43 @@ class MIoTLan:
         filter_id = f'{did}.{msg_id}'
         if filter_id in self._reply_msg_buffer:
             return True
-        self._reply_msg_buffer[filter_id] = self._internal_loop.call_later(
-            5,
-            lambda filter_id: self._reply_msg_buffer.pop(filter_id, None),
-            filter_id)
+        self._reply_msg_buffer[filter_id] = (
+            self._internal_loop.time() + self.DUP_FILTER_TTL)
         return False
 
+    def __on_timer_tick(self) -> None:
+        # Expire dup filter entries, all share one TTL so the oldest go first
+        now: float = self._internal_loop.time()
+        expired: list[str] = []
+        for filter_id, expire_ts in self._reply_msg_buffer.items():
+            if expire_ts > now:
+                break
+            expired.append(filter_id)
+        for filter_id in expired:
+            del self._reply_msg_buffer[filter_id]
+        if self._pending_pings:
+            self.__flush_pings()
+
+    def __flush_pings(self) -> None:
+        pings: list[tuple[str, str]] = []
+        for if_name, target_ips in self._pending_pings.items():
+            if len(target_ips) >= self.OT_PROBE_COALESCE_MIN:
+                if_devices: int = sum(
+                    1 for device in self._lan_devices.values()
+                    if device.if_name == if_name)
+                if len(target_ips) * 2 > if_devices:
+                    target_ips = {'255.255.255.255'}
+            pings.extend((if_name, target_ip) for target_ip in target_ips)
+        self._pending_pings.clear()
+        for if_name, target_ip in pings:
+            try:
+                self.ping(if_name=if_name, target_ip=target_ip)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('ping device error, %s, %s', target_ip, err)
+
     def __sendto(
-        self, if_name: Optional[str], data: bytes, address: str, port: int
+        self, if_name: Optional[str], data: bytes | memoryview, address: str,
+        port: int
     ) -> None:
         if if_name is None:
             # Broadcast
@@ -1351,24 +1815,90 @@ class MIoTLan:
             sock.sendto(data, socket.MSG_DONTWAIT, (address, port))
 
     def __scan_devices(self) -> None:
+        """Probe the devices that are not yet discovered.
+
+        Devices with a cached ip get unicast probes on their interface, a
+        broadcast only goes out for devices without an ip, after
+        UNICAST_PROBE_MAX unanswered probes, when most devices are missing
+        anyway, or when forced by a network change.
+        """
         if self._scan_timer:
             self._scan_timer.cancel()
             self._scan_timer = None
-        try:
-            # Scan devices
-            self.ping(if_name=None, target_ip='255.255.255.255')
-        except Exception as err:  # pylint: disable=broad-exception-caught
-            # Ignore any exceptions to avoid blocking the loop
-            _LOGGER.error('ping device error, %s', err)
-            pass
-        scan_time = self.__get_next_scan_time()
+        undiscovered: list[_MIoTLanDevice] = [
+            device for device in self._lan_devices.values()
+            if not device.discovered]
+        broadcast: bool = self._scan_broadcast
+        self._scan_broadcast = False
+        pings: list[tuple[Optional[str], str]] = []
+        for device in undiscovered:
+            if (
+                not device.ip
+                or device.unicast_probes >= device.UNICAST_PROBE_MAX
+            ):
+                broadcast = True
+                continue
+            device.unicast_probes += 1
+            pings.extend(
+                (if_name, device.ip)
+                for if_name in self.__get_probe_if_names(device))
+        if (
+            len(pings) >= self.OT_PROBE_COALESCE_MIN
+            and len(pings) * 2 > len(self._lan_devices)
+        ):
+            broadcast = True
+        if broadcast:
+            pings = [(None, '255.255.255.255')]
+        for if_name, target_ip in pings:
+            try:
+                self.ping(if_name=if_name, target_ip=target_ip)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                # Ignore any exceptions to avoid blocking the loop
+                _LOGGER.error('ping device error, %s, %s', target_ip, err)
+        scan_time = self.__get_next_scan_time(undiscovered=len(undiscovered))
         self._scan_timer = self._internal_loop.call_later(
             scan_time, self.__scan_devices)
-        _LOGGER.debug('next scan time: %ss', scan_time)
+        _LOGGER.debug(
+            'scan devices, undiscovered %s, broadcast %s, next scan: %ss',
+            len(undiscovered), broadcast, scan_time)
+
+    def __get_probe_if_names(self, device: _MIoTLanDevice) -> list[str]:
+        if device.if_name in self._broadcast_socks:
+            return [device.if_name]
+        # Never heard from, pick the interfaces whose subnet holds the ip
+        if_names: list[str] = []
+        for if_name in self._broadcast_socks:
+            info = self._network.network_info.get(if_name, None)
+            if not info:
+                continue
+            try:
+                net = ipaddress.ip_network(
+                    f'{info.ip}/{info.netmask}', strict=False)
+                if ipaddress.ip_address(device.ip) in net:
+                    if_names.append(if_name)
+            except ValueError:
+                continue
+        return if_names or list(self._broadcast_socks.keys())
 
-    def __get_next_scan_time(self) -> float:
-        if not self._last_scan_interval:
+    def __get_next_scan_time(self, undiscovered: int) -> float:
+        if undiscovered == 0:
+            # Discovered devices are kept fresh by their own keep-alive
+            self._last_scan_interval = None
+        elif (
+            not self._last_scan_interval
+            or undiscovered > self._last_undiscovered
+        ):
             self._last_scan_interval = self.OT_PROBE_INTERVAL_MIN
-        self._last_scan_interval = min(
-            self._last_scan_interval*2, self.OT_PROBE_INTERVAL_MAX)
-        return self._last_scan_interval
+        else:
+            self._last_scan_interval = min(
+                self._last_scan_interval*2, self.OT_PROBE_INTERVAL_MAX)
+        self._last_undiscovered = undiscovered
+        return self._last_scan_interval or self.OT_PROBE_INTERVAL_MAX
+
+    def __reset_scan(self, broadcast: bool) -> None:
+        self._scan_broadcast = self._scan_broadcast or broadcast
+        self._last_scan_interval = None
+        if self._scan_timer:
+            self._scan_timer.cancel()
+        self._scan_timer = self._internal_loop.call_later(
+            random.random(), self.__scan_devices)
@@ -88,39 +88,64 @@ class _MipsMsgTypeOptions(Enum):
 
 
 class _MipsMessage:
-    """MIoT Pub/Sub message."""
-    mid: int = 0
-    msg_from: Optional[str] = None
-    ret_topic: Optional[str] = None
-    payload: Optional[str] = None
+    """MIoT Pub/Sub message.
+
+    A message is a list of <len u32><type u8><value> records, strings end
+    with \\x00. unpack() only takes views of the packet, the strings are
+    decoded when first read, so fields no handler looks at cost nothing.
+    """
+    RECORD_HEADER: struct.Struct = struct.Struct('<IB')
+    ID_RECORD: struct.Struct = struct.Struct('<IBI')
+    TYPE_ID: int = _MipsMsgTypeOptions.ID.value
+    TYPE_RET_TOPIC: int = _MipsMsgTypeOptions.RET_TOPIC.value
+    TYPE_PAYLOAD: int = _MipsMsgTypeOptions.PAYLOAD.value
+    TYPE_FROM: int = _MipsMsgTypeOptions.FROM.value
+
+    mid: int
+    _raw: dict[int, memoryview]
+    _decoded: dict[int, str]
+
+    def __init__(self) -> None:
+        self.mid = 0
+        self._raw = {}
+        self._decoded = {}
+
+    @property
+    def msg_from(self) -> Optional[str]:
+        return self.__get_str(self.TYPE_FROM)
+
+    @property
+    def ret_topic(self) -> Optional[str]:
+        return self.__get_str(self.TYPE_RET_TOPIC)
+
+    @property
+    def payload(self) -> Optional[str]:
+        return self.__get_str(self.TYPE_PAYLOAD)
 
     @staticmethod
     def unpack(data: bytes) -> '_MipsMessage':
         mips_msg = _MipsMessage()
-        data_len = len(data)
+        view = memoryview(data)
+        header = _MipsMessage.RECORD_HEADER
+        data_len = len(view)
         data_start = 0
-        data_end = 0
-        while data_start < data_len:
-            data_end = data_start+5
-            unpack_len, unpack_type = struct.unpack(
-                '<IB', data[data_start:data_end])
-            unpack_data = data[data_end:data_end+unpack_len]
-            #  string end with \x00
+        while data_start + header.size <= data_len:
+            unpack_len, unpack_type = header.unpack_from(view, data_start)
+            data_start += header.size
+            unpack_data = view[data_start:data_start+unpack_len]
+            data_start += unpack_len
             match unpack_type:
-                case _MipsMsgTypeOptions.ID.value:
+                case _MipsMessage.TYPE_ID:
                     mips_msg.mid = int.from_bytes(
                         unpack_data, byteorder='little')
-                case _MipsMsgTypeOptions.RET_TOPIC.value:
-                    mips_msg.ret_topic = str(
-                        unpack_data.strip(b'\x00'), 'utf-8')
-                case _MipsMsgTypeOptions.PAYLOAD.value:
-                    mips_msg.payload = str(unpack_data.strip(b'\x00'), 'utf-8')
-                case _MipsMsgTypeOptions.FROM.value:
-                    mips_msg.msg_from = str(
-                        unpack_data.strip(b'\x00'), 'utf-8')
+                case (
+                    _MipsMessage.TYPE_RET_TOPIC
+                    | _MipsMessage.TYPE_PAYLOAD
+                    | _MipsMessage.TYPE_FROM
+                ):
+                    mips_msg._raw[unpack_type] = unpack_data
                 case _:
                     pass
-            data_start = data_end+unpack_len
         return mips_msg
 
     @staticmethod
@@ -132,27 +157,40 @@ class _MipsMessage:
     ) -> bytes:
         if mid is None or payload is None:
             raise MIoTMipsError('invalid mid or payload')
-        pack_msg: bytes = b''
-        # mid
-        pack_msg += struct.pack('<IBI', 4, _MipsMsgTypeOptions.ID.value, mid)
-        # msg_from
-        if msg_from:
-            pack_len = len(msg_from)
-            pack_msg += struct.pack(
-                f'<IB{pack_len}sx', pack_len+1,
-                _MipsMsgTypeOptions.FROM.value, msg_from.encode('utf-8'))
-        # ret_topic
-        if ret_topic:
-            pack_len = len(ret_topic)
-            pack_msg += struct.pack(
-                f'<IB{pack_len}sx', pack_len+1,
-                _MipsMsgTypeOptions.RET_TOPIC.value, ret_topic.encode('utf-8'))
-        # payload
-        pack_len = len(payload)
-        pack_msg += struct.pack(
-            f'<IB{pack_len}sx', pack_len+1,
-            _MipsMsgTypeOptions.PAYLOAD.value, payload.encode('utf-8'))
-        return pack_msg
+        header = _MipsMessage.RECORD_HEADER
+        parts: list[bytes] = [_MipsMessage.ID_RECORD.pack(
+            4, _MipsMessage.TYPE_ID, mid)]
+        for pack_type, value in (
+            (_MipsMessage.TYPE_FROM, msg_from),
+            (_MipsMessage.TYPE_RET_TOPIC, ret_topic),
+            (_MipsMessage.TYPE_PAYLOAD, payload)
+        ):
+            if not value and pack_type != _MipsMessage.TYPE_PAYLOAD:
+                continue
+            # Length in bytes, not characters, plus the trailing \x00
+            value_bytes = value.encode('utf-8')
+            parts.append(header.pack(len(value_bytes)+1, pack_type))
+            parts.append(value_bytes)
+            parts.append(b'\x00')
+        return b''.join(parts)
+
+    def __get_str(self, field_type: int) -> Optional[str]:
+        value: Optional[str] = self._decoded.get(field_type, None)
+        if value is not None:
+            return value
+        raw: Optional[memoryview] = self._raw.get(field_type, None)
+        if raw is None:
+            return None
+        # Strings end with \x00, strip like bytes.strip(b'\x00')
+        start: int = 0
+        end: int = len(raw)
+        while end > start and raw[end-1] == 0:
+            end -= 1
+        while start < end and raw[start] == 0:
+            start += 1
+        value = str(raw[start:end], 'utf-8')
+        self._decoded[field_type] = value
+        return value
 
     def __str__(self) -> str:
         return f'{self.mid}, {self.msg_from}, {self.ret_topic}, {self.payload}'
@@ -1305,6 +1343,41 @@ class MipsLocalClient(_MipsClient):
             return None
         return result_obj['value']
 
+    @final
+    async def get_props_async(
+        self, did: str, params: list[dict], timeout_ms: int = 10000
+    ) -> list[dict]:
+        """Get several properties of a device with one get_properties rpc.
+
+        proxy/get only takes a single property, so this goes through
+        proxy/rpcReq like set_prop_async. params items MUST contain siid and
+        piid. Return the result items (did, siid, piid, code, value).
+        """
+        payload_obj: dict = {
+            'did': did,
+            'rpc': {
+                'id': self.__gen_mips_id,
+                'method': 'get_properties',
+                'params': [{
+                    'did': did,
+                    'siid': param['siid'],
+                    'piid': param['piid']
+                } for param in params]
+            }
+        }
+        result_obj = await self.__request_async(
+            topic='proxy/rpcReq',
+            payload=json.dumps(payload_obj),
+            timeout_ms=timeout_ms)
+        if (
+            not isinstance(result_obj, dict)
+            or not isinstance(result_obj.get('result', None), list)
+        ):
+            return []
+        return [
+            item for item in result_obj['result']
+            if isinstance(item, dict) and item.get('did', None) == did]
+
     @final
     async def set_prop_async(
         self, did: str, siid: int, piid: int, value: Any,
@@ -1521,7 +1594,7 @@ class MipsLocalClient(_MipsClient):
         #     f"mips local client, on_message, {topic} -> {mips_msg}")
         # Reply
         if topic == self._reply_topic:
-            self.log_debug(f'on request reply, {mips_msg}')
+            self.log_debug('on request reply, %s', mips_msg)
             req: Optional[_MipsRequest] = self._request_map.pop(
                 str(mips_msg.mid), None)
             if req:
@@ -1537,7 +1610,7 @@ class MipsLocalClient(_MipsClient):
         bc_list: list[_MipsBroadcast] = list(self._msg_matcher.iter_match(
             topic=topic))
         if bc_list:
-            self.log_debug(f'on broadcast, {topic}, {mips_msg}')
+            self.log_debug('on broadcast, %s, %s', topic, mips_msg)
             for item in bc_list or []:
                 if item.handler is None:
                     continue
@@ -1563,7 +1636,7 @@ class MipsLocalClient(_MipsClient):
             return
 
         self.log_debug(
-            f'mips local client, recv unknown msg, {topic} -> {mips_msg}')
+            'mips local client, recv unknown msg, %s -> %s', topic, mips_msg)
 
     @property
     def __gen_mips_id(self) -> int:
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2024 Xiaomi Corporation.
+
+The ownership and intellectual property rights of Xiaomi Home Assistant
+Integration and related Xiaomi cloud service API interface provided under this
+license, including source code and object code (collectively, "Licensed Work"),
+are owned by Xiaomi. Subject to the terms and conditions of this License, Xiaomi
+hereby grants you a personal, limited, non-exclusive, non-transferable,
+non-sublicensable, and royalty-free license to reproduce, use, modify, and
+distribute the Licensed Work only for your use of Home Assistant for
+non-commercial purposes. For the avoidance of doubt, Xiaomi does not authorize
+you to use the Licensed Work for any other purpose, including but not limited
+to use Licensed Work to develop applications (APP), Web services, and other
+forms of software.
+
+You may reproduce and distribute copies of the Licensed Work, with or without
+modifications, whether in source or object form, provided that you must give
+any other recipients of the Licensed Work a copy of this License and retain all
+copyright and disclaimers.
+
+Xiaomi provides the Licensed Work on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+CONDITIONS OF ANY KIND, either express or implied, including, without
+limitation, any warranties, undertakes, or conditions of TITLE, NO ERROR OR
+OMISSION, CONTINUITY, RELIABILITY, NON-INFRINGEMENT, MERCHANTABILITY, or
+FITNESS FOR A PARTICULAR PURPOSE. In any event, you are solely responsible
+for any direct, indirect, special, incidental, or consequential damages or
+losses arising from the use or inability to use the Licensed Work.
+
+Xiaomi reserves all rights not expressly granted to you in this License.
+Except for the rights expressly granted by Xiaomi under this License, Xiaomi
+does not authorize you in any form to use the trademarks, copyrights, or other
+forms of intellectual property rights of Xiaomi and its affiliates, including,
+without limitation, without obtaining other written permission from Xiaomi, you
+shall not use "Xiaomi", "Mijia" and other words related to Xiaomi or words that
+may make the public associate with Xiaomi in any form to publicize or promote
+the software or hardware devices that use the Licensed Work.
+
+Xiaomi has the right to immediately terminate all your authorization under this
+License in the event:
+1. You assert patent invalidation, litigation, or other claims against patents
+or other intellectual property rights of Xiaomi or its affiliates; or,
+2. You make, have made, manufacture, sell, or offer to sell products that knock
+off Xiaomi or its affiliates' products.
+
+MIoT property refresh scheduler.
+"""
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Optional
+import time
+
+
+class MIoTRefreshPriority(IntEnum):
+    """Property refresh priority, lower values are refreshed first."""
+    # Requested by the user, e.g. homeassistant.update_entity
+    USER = 0
+    # Backs an entity shown on the dashboards
+    VISIBLE = 1
+    # Hidden, diagnostic and config entities
+    BACKGROUND = 2
+
+
+@dataclass
+class MIoTRefreshItem:
+    """One property waiting for a refresh."""
+    did: str
+    siid: int
+    piid: int
+    priority: MIoTRefreshPriority
+    # First request, kept across retries
+    enqueue_ts: float
+    attempts: int = 0
+    # Not refreshed before this time, set by the retry backoff
+    retry_ts: float = 0
+
+    @property
+    def key(self) -> str:
+        return f'{self.did}|{self.siid}|{self.piid}'
+
+    @property
+    def params(self) -> dict:
+        return {'did': self.did, 'siid': self.siid, 'piid': self.piid}
+
+
+class MIoTRefreshScheduler:
+    """Pending property refreshes.
+
+    Items are handed out most urgent first (priority, then age) in batches
+    of at most a few properties per device. A failed item is retried on its
+    own with an exponential backoff and dropped after RETRY_MAX failures,
+    the rest of the queue is not affected.
+    """
+    RETRY_DELAY_MIN: float = 3
+    RETRY_DELAY_MAX: float = 60
+    RETRY_MAX: int = 3
+
+    _items: dict[str, MIoTRefreshItem]
+    _time_func: Callable[[], float]
+    _refreshed: int
+    _retried: int
+    _dropped: int
+
+    def __init__(
+        self, time_func: Optional[Callable[[], float]] = None
+    ) -> None:
+        self._items = {}
+        self._time_func = time_func or time.monotonic
+        self._refreshed = 0
+        self._retried = 0
+        self._dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(
+        self, did: str, siid: int, piid: int, priority: MIoTRefreshPriority
+    ) -> None:
+        key: str = f'{did}|{siid}|{piid}'
+        item: Optional[MIoTRefreshItem] = self._items.get(key, None)
+        if item:
+            item.priority = min(item.priority, priority)
+            if priority == MIoTRefreshPriority.USER:
+                # Asked for again, skip the rest of the backoff
+                item.retry_ts = 0
+            return
+        self._items[key] = MIoTRefreshItem(
+            did=did, siid=siid, piid=piid, priority=priority,
+            enqueue_ts=self._time_func())
+
+    def pop_batch(
+        self, device_patch_len: int, patch_len: int
+    ) -> dict[str, list[MIoTRefreshItem]]:
+        """Pop the items due, at most device_patch_len per device and
+        patch_len in total, grouped by device."""
+        now: float = self._time_func()
+        ready: list[MIoTRefreshItem] = sorted(
+            (item for item in self._items.values() if item.retry_ts <= now),
+            key=lambda item: (item.priority, item.enqueue_ts))
+        batch: dict[str, list[MIoTRefreshItem]] = {}
+        count: int = 0
+        for item in ready:
+            if count >= patch_len:
+                break
+            items = batch.setdefault(item.did, [])
+            if len(items) >= device_patch_len:
+                continue
+            items.append(self._items.pop(item.key))
+            count += 1
+        return batch
+
+    def done(self, item: MIoTRefreshItem) -> None:
+        self._refreshed += 1
+
+    def retry(self, item: MIoTRefreshItem) -> bool:
+        """Queue a failed item again after its backoff, False if dropped."""
+        item.attempts += 1
+        if item.attempts > self.RETRY_MAX:
+            self._dropped += 1
+            return False
+        self._retried += 1
+        if item.key in self._items:
+            # Requested again while in flight
+            return True
+        item.retry_ts = self._time_func() + min(
+            self.RETRY_DELAY_MIN * 2**(item.attempts-1),
+            self.RETRY_DELAY_MAX)
+        self._items[item.key] = item
+        return True
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds until the next item is due, None if the queue is empty."""
+        if not self._items:
+            return None
+        return max(
+            0, min(item.retry_ts for item in self._items.values())
+            - self._time_func())
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """Queue depth and age, for diagnostics."""
+        now: float = self._time_func()
+        depth: dict[str, int] = {
+            priority.name.lower(): 0 for priority in MIoTRefreshPriority}
+        for item in self._items.values():
+            depth[item.priority.name.lower()] += 1
+        return {
+            'depth': len(self._items),
+            'depth_by_priority': depth,
+            'retrying': sum(
+                1 for item in self._items.values() if item.attempts > 0),
+            'oldest_age': round(max(
+                (now - item.enqueue_ts for item in self._items.values()),
+                default=0), 1),
+            'refreshed': self._refreshed,
+            'retried': self._retried,
+            'dropped': self._dropped,
+        }
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Packet-path micro-benchmark for the vendored Xiaomi MIoT LAN client (miot_lan.py).
+
+Creates --devices virtual devices with random tokens, encrypts one
+properties_changed push per device with the device's own gen_packet, then times
+on one core:
+
+  recv  copy a packet into the shared read buffer (what recvfrom_into does) and
+        run the receive path: header parse, MD5 check, AES-CBC decrypt, JSON
+  send  gen_packet for a get_properties request into the shared write buffer
+  timers  keep-alive rescheduling (cancel + schedule 10-50 s out) per packet,
+        on asyncio's timer heap (one handle per device) and on the LAN timer wheel
+
+Prints one JSON object with packets/second for each path and timer ops/second.
+
+Example:
+  pip install -r scripts/requirements-miot.txt
+  python scripts/miot-lan-bench.py --devices 200 --rounds 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any
+
+from miot_bench_lib import (
+    BenchLanManager,
+    import_miot,
+    properties_changed,
+    random_did,
+    random_token,
+    summarize_rate,
+)
+
+miot_lan = import_miot("miot_lan")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the MIoT LAN packet path.")
+    parser.add_argument("--devices", type=int, default=128)
+    parser.add_argument("--packets-per-device", type=int, default=50)
+    parser.add_argument("--props", type=int, default=4, help="Properties per pushed message")
+    parser.add_argument("--rounds", type=int, default=5)
+    return parser.parse_args()
+
+
+def make_devices(manager: BenchLanManager, count: int) -> list[Any]:
+    # pylint: disable=protected-access
+    return [
+        miot_lan._MIoTLanDevice(manager=manager, did=random_did(), token=random_token())
+        for _ in range(count)
+    ]
+
+
+def bench_recv(devices: list[Any], args: argparse.Namespace) -> dict[str, Any]:
+    msg_len = miot_lan.MIoTLan.OT_MSG_LEN
+    out_buffer = bytearray(msg_len + 16)
+    packets: list[tuple[Any, bytes]] = []
+    for index, device in enumerate(devices):
+        msg = properties_changed(device.did, index + 1, args.props)
+        data_len = device.gen_packet(out_buffer, msg, device.did, 0)
+        packets.append((device, bytes(out_buffer[:data_len])))
+
+    read_buffer = bytearray(msg_len)
+    read_view = memoryview(read_buffer)
+    decrypt_buffer = bytearray(msg_len + 16)
+    header = devices[0].OT_HEADER_STRUCT
+    by_did = {device.did: device for device in devices}
+    samples: list[float] = []
+    count = len(packets) * args.packets_per_device
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        for _ in range(args.packets_per_device):
+            for _, packet in packets:
+                data_len = len(packet)
+                read_buffer[:data_len] = packet
+                data = read_view[:data_len]
+                _, _, did_int, _ = header.unpack_from(data)
+                by_did[str(did_int)].decrypt_packet(data, decrypt_buffer)
+        samples.append(time.perf_counter() - started)
+    return {"packet_bytes": len(packets[0][1]), **summarize_rate(count, samples)}
+
+
+def bench_send(devices: list[Any], args: argparse.Namespace) -> dict[str, Any]:
+    write_buffer = bytearray(miot_lan.MIoTLan.OT_MSG_LEN + 16)
+    piids = range(1, args.props + 1)
+    requests = [
+        {
+            "id": index + 1,
+            "from": "ha.xiaomi_home",
+            "method": "get_properties",
+            "params": [{"did": device.did, "siid": 2, "piid": piid} for piid in piids],
+        }
+        for index, device in enumerate(devices)
+    ]
+    samples: list[float] = []
+    count = len(devices) * args.packets_per_device
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        for _ in range(args.packets_per_device):
+            for device, msg in zip(devices, requests):
+                device.gen_packet(write_buffer, msg, device.did, 0)
+        samples.append(time.perf_counter() - started)
+    return summarize_rate(count, samples)
+
+
+def bench_timers(devices: list[Any], args: argparse.Namespace) -> dict[str, Any]:
+    delays = [random.uniform(10.0, 50.0) for _ in range(1024)]
+    count = len(devices) * args.packets_per_device
+    report: dict[str, Any] = {}
+    for name in ("loop", "wheel"):
+        samples: list[float] = []
+        for _ in range(args.rounds):
+            loop = asyncio.new_event_loop()
+            # pylint: disable=protected-access
+            scheduler = loop if name == "loop" else miot_lan._MIoTLanTimerWheel(loop)
+            handles: list[Any] = [None] * len(devices)
+            started = time.perf_counter()
+            for step in range(args.packets_per_device):
+                for index in range(len(devices)):
+                    if handles[index] is not None:
+                        handles[index].cancel()
+                    delay = delays[(step + index) % len(delays)]
+                    handles[index] = scheduler.call_later(delay, int)
+            samples.append(time.perf_counter() - started)
+            loop.close()
+        report[name] = summarize_rate(count, samples)
+    return report
+
+
+def main() -> int:
+    args = parse_args()
+    manager = BenchLanManager()
+    try:
+        devices = make_devices(manager, max(1, args.devices))
+        report = {
+            "devices": len(devices),
+            "props_per_message": args.props,
+            "recv": bench_recv(devices, args),
+            "send": bench_send(devices, args),
+            "timers": bench_timers(devices, args),
+        }
+    finally:
+        manager.close()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
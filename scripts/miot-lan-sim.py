@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Run simulated Xiaomi LAN devices and benchmark the vendored MIoTLan against them.
+
+By default starts --devices virtual devices on 127.0.1.x (miot_lan_sim.py), runs
+a real MIoTLan bound to the loopback interface and prints one JSON object with:
+
+  discover   seconds until every device is online (probe scan + hello)
+  subscribe  seconds until every device accepted the push subscription
+  refresh    seconds to read every property of every device at once, as after
+             a reconnect, and the most requests any one device had in flight
+  requests   get_properties throughput and latency at --concurrency
+  idle       LAN thread CPU seconds over --idle-seconds of keep-alive and pushes
+
+--serve-only just runs the devices and prints their did/token/ip list, e.g. to
+point a Home Assistant dev instance at them. Linux only (per-device loopback
+addresses and SO_BINDTODEVICE); root or CAP_NET_RAW is needed for the latter.
+
+Example:
+  pip install -r scripts/requirements-miot.txt
+  python scripts/miot-lan-sim.py --devices 300 --latency-ms 5 --jitter-ms 10 --loss 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from dataclasses import asdict
+from typing import Any
+
+import psutil
+
+from miot_bench_lib import BenchMipsService, BenchNetwork, import_miot
+from miot_lan_sim import LanSimulator, SimConfig
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Simulated MIoT LAN devices and MIoTLan benchmark."
+    )
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--base-ip", type=str, default="127.0.1.1")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0, help="Drop probability per packet")
+    parser.add_argument("--props", type=int, default=8, help="Readable properties per device")
+    parser.add_argument("--push-interval", type=float, default=10.0, help="0 disables pushes")
+    parser.add_argument("--no-subscribe", action="store_true")
+    parser.add_argument("--serve-only", action="store_true")
+    parser.add_argument("--if-name", type=str, default="lo")
+    parser.add_argument("--discover-timeout", type=float, default=90.0)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout-ms", type=int, default=3000)
+    parser.add_argument("--idle-seconds", type=float, default=30.0)
+    parser.add_argument("--verbose", action="store_true", help="Show MIoTLan log output")
+    return parser.parse_args()
+
+
+def start_simulator(
+    args: argparse.Namespace,
+) -> tuple[LanSimulator, asyncio.AbstractEventLoop]:
+    config = SimConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        loss=args.loss,
+        props=max(1, args.props),
+        push_interval=args.push_interval,
+        subscribe=not args.no_subscribe,
+    )
+    simulator = LanSimulator(max(1, args.devices), config, base_ip=args.base_ip)
+    # Devices get their own thread so their CPU does not count against MIoTLan's
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="miot_lan_sim", daemon=True).start()
+    asyncio.run_coroutine_threadsafe(simulator.start(), loop).result()
+    return simulator, loop
+
+
+def stop_simulator(simulator: LanSimulator, loop: asyncio.AbstractEventLoop) -> None:
+    loop.call_soon_threadsafe(simulator.close)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def thread_cpu_seconds(native_id: int | None) -> float:
+    for thread in psutil.Process().threads():
+        if thread.id == native_id:
+            return thread.user_time + thread.system_time
+    return 0.0
+
+
+async def wait_until(
+    check: Any, expected: int, started: float, timeout: float, poll: float = 0.2
+) -> tuple[float | None, int]:
+    """Seconds from `started` (monotonic) until check() reaches `expected`."""
+    while True:
+        seen = await check()
+        if seen >= expected:
+            return round(time.monotonic() - started, 2), seen
+        if time.monotonic() - started >= timeout:
+            return None, seen
+        await asyncio.sleep(poll)
+
+
+async def bench_refresh(
+    lan: Any, dids: list[str], simulator: LanSimulator, args: argparse.Namespace
+) -> dict[str, Any]:
+    simulator.stats.peak_in_flight = 0
+    requests_started = simulator.stats.requests
+    props = max(1, args.props)
+    started = time.perf_counter()
+    values = await asyncio.gather(*(
+        lan.get_prop_async(did, 2, piid, timeout_ms=args.timeout_ms)
+        for did in dids
+        for piid in range(1, props + 1)
+    ))
+    return {
+        "properties": len(values),
+        "ok": sum(1 for value in values if value is not None),
+        "seconds": round(time.perf_counter() - started, 3),
+        "device_requests": simulator.stats.requests - requests_started,
+        "peak_device_in_flight": simulator.stats.peak_in_flight,
+    }
+
+
+async def bench_requests(
+    lan: Any, dids: list[str], args: argparse.Namespace
+) -> dict[str, Any]:
+    latencies: list[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def one() -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            value = await lan.get_prop_async(
+                random.choice(dids), 2, random.randint(1, max(1, args.props)),
+                timeout_ms=args.timeout_ms,
+            )
+            if value is None:
+                failures += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(max(0, args.requests))))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": len(latencies),
+        "failed": failures,
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else None,
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2) if ordered else None,
+        "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2) if ordered else None,
+    }
+
+
+async def run_bench(args: argparse.Namespace, simulator: LanSimulator) -> dict[str, Any]:
+    miot_lan = import_miot("miot_lan")
+    subscribe = not args.no_subscribe
+    lan = miot_lan.MIoTLan(
+        net_ifs=[args.if_name],
+        network=BenchNetwork([args.if_name]),
+        mips_service=BenchMipsService(),
+        enable_subscribe=subscribe,
+        loop=asyncio.get_running_loop(),
+    )
+    await lan.vote_for_lan_ctrl_async("bench", True)
+    if not lan.init_done:
+        raise RuntimeError("MIoTLan did not start")
+    devices = simulator.device_info()
+    dids = list(devices)
+    started = time.monotonic()
+    lan.update_devices(devices)
+    pushes = 0
+
+    def on_prop(params: dict, ctx: Any) -> None:
+        nonlocal pushes
+        pushes += 1
+
+    for did in dids:
+        lan.sub_prop(did, on_prop)
+
+    async def online() -> int:
+        return len(await lan.get_dev_list_async())
+
+    async def push_available() -> int:
+        dev_list = await lan.get_dev_list_async()
+        return sum(1 for info in dev_list.values() if info.get("push_available"))
+
+    report: dict[str, Any] = {"devices": len(dids)}
+    try:
+        timeout = args.discover_timeout
+        seconds, seen = await wait_until(online, len(dids), started, timeout)
+        report["discover"] = {"seconds": seconds, "online": seen}
+        if subscribe:
+            seconds, seen = await wait_until(push_available, len(dids), started, timeout)
+            report["subscribe"] = {"seconds": seconds, "subscribed": seen}
+        report["refresh"] = await bench_refresh(lan, dids, simulator, args)
+        report["requests"] = await bench_requests(lan, dids, args)
+
+        # pylint: disable=protected-access
+        native_id = lan._thread.native_id
+        cpu_started = thread_cpu_seconds(native_id)
+        pushes_started = pushes
+        probes_started = simulator.stats.probes
+        await asyncio.sleep(max(0.0, args.idle_seconds))
+        report["idle"] = {
+            "seconds": args.idle_seconds,
+            "lan_thread_cpu_seconds": round(
+                thread_cpu_seconds(native_id) - cpu_started, 3
+            ),
+            "pushes_received": pushes - pushes_started,
+            "probes_answered": simulator.stats.probes - probes_started,
+        }
+    finally:
+        await lan.deinit_async()
+    report["simulator"] = asdict(simulator.stats)
+    return report
+
+
+def main() -> int:
+    args = parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    simulator, loop = start_simulator(args)
+    try:
+        if args.serve_only:
+            print(json.dumps(simulator.device_info(), indent=2), flush=True)
+            threading.Event().wait()
+            return 0
+        report = asyncio.run(run_bench(args, simulator))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        stop_simulator(simulator, loop)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Codec micro-benchmark for the vendored Xiaomi central hub gateway client (miot_mips.py).
+
+Every message to and from the gateway's MQTT broker goes through _MipsMessage.
+Times on one core, for a small property push and a getDevList reply with
+--devices devices:
+
+  pack            build the record list for a request (id, from, ret topic, payload)
+  unpack          parse a message without reading its strings (dropped messages)
+  unpack_payload  parse and read the payload (what a reply or broadcast handler does)
+
+Prints one JSON object with messages/second for each.
+
+Example:
+  pip install -r scripts/requirements-miot.txt
+  python scripts/miot-mips-bench.py --devices 100 --rounds 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+from miot_bench_lib import import_miot, random_did, summarize_rate
+
+miot_mips = import_miot("miot_mips")
+# pylint: disable=protected-access
+MipsMessage = miot_mips._MipsMessage
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the MIPS message codec.")
+    parser.add_argument("--devices", type=int, default=100, help="Devices in the getDevList reply")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    return parser.parse_args()
+
+
+def sample_payloads(devices: int) -> dict[str, str]:
+    did = random_did()
+    dev_list = {
+        random_did(): {
+            "name": f"设备 {index}",
+            "model": "xiaomi.sim.v1",
+            "online": True,
+            "specV2Access": True,
+            "pushAvailable": True,
+        }
+        for index in range(devices)
+    }
+    return {
+        "prop": json.dumps({"did": did, "siid": 2, "piid": 1, "value": 23.5}),
+        "dev_list": json.dumps({"devList": dev_list}, ensure_ascii=False),
+    }
+
+
+def time_rounds(count: int, rounds: int, func: Callable[[], None]) -> dict[str, Any]:
+    samples: list[float] = []
+    for _ in range(max(1, rounds)):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize_rate(count, samples)
+
+
+def bench_payload(payload: str, args: argparse.Namespace) -> dict[str, Any]:
+    count = max(1, args.messages)
+    packed = MipsMessage.pack(
+        mid=123456, payload=payload, msg_from="local", ret_topic="master/proxy/rpcReq"
+    )
+    decoded = MipsMessage.unpack(packed).payload
+    if decoded != payload:
+        raise RuntimeError("codec round trip changed the payload")
+
+    def pack() -> None:
+        for mid in range(count):
+            MipsMessage.pack(
+                mid=mid, payload=payload, msg_from="local", ret_topic="master/proxy/rpcReq"
+            )
+
+    def unpack() -> None:
+        for _ in range(count):
+            MipsMessage.unpack(packed)
+
+    def unpack_payload() -> None:
+        for _ in range(count):
+            _ = MipsMessage.unpack(packed).payload
+
+    return {
+        "message_bytes": len(packed),
+        "pack": time_rounds(count, args.rounds, pack),
+        "unpack": time_rounds(count, args.rounds, unpack),
+        "unpack_payload": time_rounds(count, args.rounds, unpack_payload),
+    }
+
+
+def main() -> int:
+    args = parse_args()
+    report = {
+        name: bench_payload(payload, args)
+        for name, payload in sample_payloads(max(1, args.devices)).items()
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+"""
+Helpers for benchmarking the vendored Xiaomi Home integration outside Home Assistant.
+
+The integration lives in ha/config/custom_components/xiaomi_home. Its `miot`
+directory only depends on third-party libraries (scripts/requirements-miot.txt),
+but the integration directory itself cannot go on sys.path because its
+`select.py` platform shadows the stdlib module. import_miot() registers `miot` as
+a package pointing at that directory instead, so `import miot.miot_lan` works.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import importlib.machinery
+import importlib.util
+import secrets
+import statistics
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+MIOT_DIR = (
+    Path(__file__).resolve().parents[1]
+    / "ha"
+    / "config"
+    / "custom_components"
+    / "xiaomi_home"
+    / "miot"
+)
+
+
+def import_miot(module: str) -> ModuleType:
+    """Import `miot.<module>` from the vendored integration."""
+    if "miot" not in sys.modules:
+        spec = importlib.machinery.ModuleSpec("miot", None, is_package=True)
+        spec.submodule_search_locations = [str(MIOT_DIR)]
+        sys.modules["miot"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"miot.{module}")
+
+
+def random_did() -> str:
+    return str(secrets.randbits(40) + 10_000_000)
+
+
+def random_token() -> str:
+    return secrets.token_hex(16)
+
+
+class BenchLanManager:
+    """The subset of MIoTLan that a _MIoTLanDevice touches, for device-level benches."""
+
+    def __init__(self) -> None:
+        self.internal_loop = asyncio.new_event_loop()
+        # The loop's call_later has the timer wheel's signature
+        self.timer_wheel = self.internal_loop
+        self.virtual_did = str(secrets.randbits(63))
+        self.state_changes = 0
+
+    def broadcast_device_state(self, did: str, state: dict) -> None:
+        self.state_changes += 1
+
+    def queue_ping(self, if_name: str, target_ip: str) -> None:
+        pass
+
+    def close(self) -> None:
+        for handle in list(getattr(self.internal_loop, "_scheduled", [])):
+            handle.cancel()
+        self.internal_loop.close()
+
+
+class BenchNetwork:
+    """Stand-in for MIoTNetwork that reports a fixed set of interfaces."""
+
+    def __init__(self, if_names: list[str]) -> None:
+        self.network_info = {name: None for name in if_names}
+
+    def sub_network_info(self, key: str, handler: Any) -> None:
+        pass
+
+
+class BenchMipsService:
+    """Stand-in for MipsService with no central gateway, so MIoTLan stays enabled."""
+
+    def get_services(self, group_id: str | None = None) -> dict[str, dict]:
+        return {}
+
+    def sub_service_change(self, key: str, group_id: str, handler: Any) -> None:
+        pass
+
+
+def properties_changed(did: str, msg_id: int, props: int = 4) -> dict[str, Any]:
+    """A typical device push: a handful of property values in one message."""
+    return {
+        "id": msg_id,
+        "method": "properties_changed",
+        "params": [
+            {"did": did, "siid": 2, "piid": piid, "value": piid * 7 % 100}
+            for piid in range(1, props + 1)
+        ],
+    }
+
+
+def summarize_rate(count: int, samples: list[float]) -> dict[str, Any]:
+    """Best/median rate over repeated timed rounds of `count` operations."""
+    ordered = sorted(samples)
+    return {
+        "ops": count,
+        "rounds": len(samples),
+        "best_per_second": round(count / ordered[0]) if ordered[0] > 0 else None,
+        "median_per_second": round(count / statistics.median(ordered)),
+        "best_us_per_op": round(ordered[0] / count * 1e6, 2),
+    }
@@ -0,0 +1,371 @@
+"""
+Simulated Xiaomi MIoT WiFi devices speaking the OT LAN protocol over UDP.
+
+Every virtual device binds its own loopback address (127.0.1.1, 127.0.1.2, ...)
+on port 54321, so Linux is required. The simulator implements the protocol
+independently of miot_lan.py, so it can also catch codec regressions:
+
+  probe    32-byte `0x2131` hello whose payload starts with 0xFF*12 "MDID"; the
+           reply carries the did, the device clock and, when subscriptions are
+           enabled, "MSUB" <sub_ts> "PUB" <sub_type> <0xFE wildcard flag>
+  rpc      AES-128-CBC (key = md5(token), iv = md5(key + token)) JSON-RPC with
+           an MD5 checksum computed over the packet with the token in its place:
+           get_properties, set_properties, action, miIO.sub, miIO.unsub
+  push     subscribed devices send properties_changed every --push-interval
+
+Broadcast probes are caught by one extra socket bound to 0.0.0.0:54321 and
+answered from every device's own address. Each device can delay (latency +
+jitter) and drop (loss) both requests and replies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import ipaddress
+import json
+import random
+import secrets
+import socket
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+OT_PORT = 54321
+OT_MAGIC = 0x2131
+OT_HEADER = struct.Struct(">HHQI")
+OT_PROBE_PREFIX = b"\x21\x31\x00\x20" + b"\xff" * 12
+SUPPORT_WILDCARD_SUB = 0xFE
+SIM_MODEL = "xiaomi.sim.v1"
+
+
+@dataclass
+class SimConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    loss: float = 0.0
+    props: int = 8
+    push_interval: float = 0.0
+    subscribe: bool = True
+
+
+@dataclass
+class SimStats:
+    probes: int = 0
+    requests: int = 0
+    replies: int = 0
+    pushes: int = 0
+    acks: int = 0
+    dropped: int = 0
+    bad_packets: int = 0
+    # Most requests one device had received but not yet answered
+    peak_in_flight: int = 0
+    methods: dict[str, int] = field(default_factory=dict)
+
+
+class OtCodec:
+    """Encrypts and decrypts OT packets for one device token."""
+
+    def __init__(self, did: int, token: bytes) -> None:
+        self.did = did
+        self.token = token
+        key = hashlib.md5(token).digest()
+        iv = hashlib.md5(key + token).digest()
+        self.cipher = Cipher(algorithms.AES128(key), modes.CBC(iv))
+
+    def encode(self, msg: dict[str, Any], stamp: int) -> bytes:
+        clear = json.dumps(msg, separators=(",", ":")).encode("utf-8")
+        pad = 16 - len(clear) % 16
+        encryptor = self.cipher.encryptor()
+        body = encryptor.update(clear + bytes((pad,)) * pad) + encryptor.finalize()
+        header = OT_HEADER.pack(OT_MAGIC, 32 + len(body), self.did, stamp)
+        checksum = hashlib.md5(header + self.token + body).digest()
+        return header + checksum + body
+
+    def decode(self, packet: bytes) -> dict[str, Any] | None:
+        if len(packet) <= 32:
+            return None
+        magic, length, _, _ = OT_HEADER.unpack_from(packet)
+        if magic != OT_MAGIC or length != len(packet) or (length - 32) % 16:
+            return None
+        if hashlib.md5(packet[:16] + self.token + packet[32:]).digest() != packet[16:32]:
+            return None
+        decryptor = self.cipher.decryptor()
+        clear = decryptor.update(packet[32:]) + decryptor.finalize()
+        pad = clear[-1]
+        if not 0 < pad <= 16:
+            return None
+        try:
+            msg = json.loads(clear[:-pad].rstrip(b"\x00"))
+        except ValueError:
+            return None
+        return msg if isinstance(msg, dict) else None
+
+
+class SimDevice(asyncio.DatagramProtocol):
+    """One virtual device bound to its own address."""
+
+    def __init__(
+        self,
+        simulator: "LanSimulator",
+        loop: asyncio.AbstractEventLoop,
+        did: int,
+        ip: str,
+    ) -> None:
+        self.loop = loop
+        self.config = simulator.config
+        self.stats = simulator.stats
+        self.did = did
+        self.ip = ip
+        self.token = secrets.token_bytes(16)
+        self.codec = OtCodec(did, self.token)
+        self.boot_ts = int(time.time()) - random.randint(1000, 100000)
+        self.props: dict[tuple[int, int], Any] = {
+            (2, piid): piid for piid in range(1, self.config.props + 1)
+        }
+        self.subscriber: tuple[str, int] | None = None
+        self.sub_ts = 0
+        self.msg_id = random.randint(1, 1000)
+        self.in_flight = 0
+        self.transport: asyncio.DatagramTransport | None = None
+        self._push_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def info(self) -> dict[str, Any]:
+        """Device entry in the shape MIoTLan.update_devices() expects."""
+        return {"token": self.token.hex(), "model": SIM_MODEL, "ip": self.ip}
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def stamp(self) -> int:
+        return int(time.time()) - self.boot_ts
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if random.random() < self.config.loss:
+            self.stats.dropped += 1
+            return
+        if len(data) == 32 and data.startswith(OT_PROBE_PREFIX):
+            self.on_probe(addr)
+            return
+        msg = self.codec.decode(data)
+        if msg is None:
+            self.stats.bad_packets += 1
+            return
+        if "method" not in msg:
+            # Ack for one of our pushes
+            self.stats.acks += 1
+            return
+        self.on_request(msg, addr)
+
+    def send(self, data: bytes, addr: tuple[str, int]) -> float:
+        """Send after the configured latency, return that delay in seconds."""
+        if self.transport is None:
+            return 0.0
+        delay = (self.config.latency_ms + random.uniform(0.0, self.config.jitter_ms)) / 1000.0
+        if random.random() < self.config.loss:
+            self.stats.dropped += 1
+        elif delay > 0:
+            self.loop.call_later(delay, self.transport.sendto, data, addr)
+        else:
+            self.transport.sendto(data, addr)
+        return delay
+
+    def on_probe(self, addr: tuple[str, int]) -> None:
+        self.stats.probes += 1
+        tail = b"\x00" * 16
+        if self.config.subscribe:
+            # Unsubscribed devices report their boot time so the client subscribes
+            sub_ts = self.sub_ts or self.boot_ts
+            tail = (
+                b"MSUB"
+                + struct.pack(">I", sub_ts)
+                + b"PUB"
+                + bytes((1, SUPPORT_WILDCARD_SUB))
+                + b"\x00" * 3
+            )
+        self.send(OT_HEADER.pack(OT_MAGIC, 32, self.did, self.stamp()) + tail, addr)
+
+    def on_request(self, msg: dict[str, Any], addr: tuple[str, int]) -> None:
+        self.stats.requests += 1
+        self.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.in_flight)
+        method = str(msg.get("method", ""))
+        self.stats.methods[method] = self.stats.methods.get(method, 0) + 1
+        params = msg.get("params")
+        result: Any
+        if method == "get_properties" and isinstance(params, list):
+            result = [self.get_prop(p) for p in params]
+        elif method == "set_properties" and isinstance(params, list):
+            result = [self.set_prop(p) for p in params]
+        elif method == "action" and isinstance(params, dict):
+            result = {
+                "did": str(self.did),
+                "siid": params.get("siid"),
+                "aiid": params.get("aiid"),
+                "code": 0,
+                "out": [],
+            }
+        elif method == "miIO.sub" and isinstance(params, dict):
+            self.subscriber = addr
+            self.sub_ts = int(params.get("update_ts", 0) or 0)
+            self.schedule_push()
+            result = {"code": 0}
+        elif method == "miIO.unsub":
+            self.subscriber = None
+            self.sub_ts = 0
+            result = {"code": 0}
+        else:
+            error = {"code": -32601, "message": "method not found"}
+            self.reply(msg.get("id"), None, addr, error=error)
+            return
+        self.reply(msg.get("id"), result, addr)
+
+    def reply(
+        self,
+        msg_id: Any,
+        result: Any,
+        addr: tuple[str, int],
+        error: dict[str, Any] | None = None,
+    ) -> None:
+        body: dict[str, Any] = {"id": msg_id}
+        if error is not None:
+            body["error"] = error
+        else:
+            body["result"] = result
+        self.stats.replies += 1
+        delay = self.send(self.codec.encode(body, self.stamp()), addr)
+        if delay > 0:
+            self.loop.call_later(delay, self.request_done)
+        else:
+            self.request_done()
+
+    def request_done(self) -> None:
+        self.in_flight -= 1
+
+    def get_prop(self, param: dict[str, Any]) -> dict[str, Any]:
+        key = (int(param.get("siid", 0)), int(param.get("piid", 0)))
+        item = {"did": str(self.did), "siid": key[0], "piid": key[1]}
+        if key not in self.props:
+            return {**item, "code": -4003}
+        return {**item, "code": 0, "value": self.props[key]}
+
+    def set_prop(self, param: dict[str, Any]) -> dict[str, Any]:
+        key = (int(param.get("siid", 0)), int(param.get("piid", 0)))
+        item = {"did": str(self.did), "siid": key[0], "piid": key[1]}
+        if key not in self.props:
+            return {**item, "code": -4003}
+        self.props[key] = param.get("value")
+        self.push([key])
+        return {**item, "code": 0}
+
+    def push(self, keys: list[tuple[int, int]]) -> None:
+        if self.subscriber is None:
+            return
+        self.msg_id += 1
+        self.stats.pushes += 1
+        msg = {
+            "id": self.msg_id,
+            "method": "properties_changed",
+            "params": [
+                {
+                    "did": str(self.did),
+                    "siid": siid,
+                    "piid": piid,
+                    "value": self.props[(siid, piid)],
+                }
+                for siid, piid in keys
+            ],
+        }
+        self.send(self.codec.encode(msg, self.stamp()), self.subscriber)
+
+    def schedule_push(self) -> None:
+        if self._push_handle is not None or self.config.push_interval <= 0:
+            return
+        delay = self.config.push_interval * random.uniform(0.5, 1.5)
+        self._push_handle = self.loop.call_later(delay, self.periodic_push)
+
+    def periodic_push(self) -> None:
+        self._push_handle = None
+        if self.subscriber is None:
+            return
+        key = (2, random.randint(1, self.config.props))
+        value = self.props[key]
+        self.props[key] = value + 1 if isinstance(value, int) else value
+        self.push([key])
+        self.schedule_push()
+
+    def close(self) -> None:
+        if self._push_handle is not None:
+            self._push_handle.cancel()
+            self._push_handle = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class _BroadcastListener(asyncio.DatagramProtocol):
+    def __init__(self, simulator: "LanSimulator") -> None:
+        self.simulator = simulator
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if len(data) == 32 and data.startswith(OT_PROBE_PREFIX):
+            if not ipaddress.IPv4Address(addr[0]).is_loopback:
+                # A broadcast bound to lo can leave with the host's LAN address;
+                # replies from 127.x to it would be dropped, so answer on loopback
+                addr = ("127.0.0.1", addr[1])
+            for device in self.simulator.devices:
+                device.datagram_received(data, addr)
+
+
+class LanSimulator:
+    """A LAN of SimDevice instances on consecutive loopback addresses."""
+
+    def __init__(
+        self,
+        count: int,
+        config: SimConfig | None = None,
+        base_ip: str = "127.0.1.1",
+        port: int = OT_PORT,
+    ) -> None:
+        self.count = count
+        self.config = config or SimConfig()
+        self.base_ip = ipaddress.IPv4Address(base_ip)
+        self.port = port
+        self.stats = SimStats()
+        self.devices: list[SimDevice] = []
+        self._broadcast: asyncio.DatagramTransport | None = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        broadcast_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        broadcast_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        broadcast_sock.bind(("", self.port))
+        self._broadcast, _ = await loop.create_datagram_endpoint(
+            lambda: _BroadcastListener(self), sock=broadcast_sock
+        )
+        for index in range(self.count):
+            ip = str(self.base_ip + index)
+            device = SimDevice(self, loop, did=100_000_000 + index, ip=ip)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, self.port))
+            await loop.create_datagram_endpoint(lambda device=device: device, sock=sock)
+            self.devices.append(device)
+
+    def device_info(self) -> dict[str, dict[str, Any]]:
+        return {str(device.did): device.info for device in self.devices}
+
+    def subscribed(self) -> int:
+        return sum(1 for device in self.devices if device.subscriber is not None)
+
+    def close(self) -> None:
+        for device in self.devices:
+            device.close()
+        self.devices.clear()
+        if self._broadcast is not None:
+            self._broadcast.close()
+            self._broadcast = None
@@ -324,8 +324,33 @@ function Get-VoiceCapture {
     [Parameter(Mandatory = $true)] [string]$Languages,
     [Parameter(Mandatory = $true)] [bool]$WindowsSpeechAvailable,
     $WindowsRecognizer,
-    [Parameter(Mandatory = $true)] [string]$PythonCommand
+    [Parameter(Mandatory = $true)] [string]$PythonCommand,
+    [string]$ServerUrl = ""
   )
+  if ($SttEngine -eq "whisper" -and $ServerUrl) {
+    Write-Host ("Listening (Whisper server) for up to {0}s..." -f $TimeoutSeconds)
+    try {
+      $obj = Invoke-RestMethod -Method Post -Uri ("{0}/listen?timeout_seconds={1}" -f $ServerUrl.TrimEnd("/"), $TimeoutSeconds) -TimeoutSec ($TimeoutSeconds + 60)
+      if ($obj.ok -and -not [string]::IsNullOrWhiteSpace([string]$obj.text)) {
+        return @{
+          ok   = $true
+          text = [string]$obj.text
+          lang = [string]$obj.lang
+          stt  = "whisper-server"
+        }
+      }
+      if ($obj.error) {
+        # The server answered; a one-shot retry would record a second utterance.
+        return @{
+          ok    = $false
+          error = ("Whisper server: {0}" -f $obj.error)
+        }
+      }
+    }
+    catch {
+      Write-Warning ("Whisper STT server at {0} unavailable: {1}. Falling back to one-shot helper." -f $ServerUrl, $_.Exception.Message)
+    }
+  }
   if ($SttEngine -eq "whisper") {
     if (-not $PythonCommand) {
       Write-Warning "Whisper STT requested but Python is unavailable. Falling back to Windows speech."
@@ -500,6 +525,7 @@ $whisperModel = Get-EnvVar -Name "VOICE_WHISPER_MODEL" -Default "small"
 $whisperDevice = Get-EnvVar -Name "VOICE_WHISPER_DEVICE" -Default "cpu"
 $whisperComputeType = Get-EnvVar -Name "VOICE_WHISPER_COMPUTE_TYPE" -Default "int8"
 $voiceLanguages = Get-EnvVar -Name "VOICE_LANGUAGES" -Default "en,ms,zh"
+$sttServerUrl = Get-EnvVar -Name "VOICE_STT_SERVER_URL" -Default ""
 $timeoutRaw = Get-EnvVar -Name "VOICE_PUSH_TO_TALK_TIMEOUT_SECONDS" -Default "5"
 $resultTimeoutRaw = Get-EnvVar -Name "VOICE_RESULT_TIMEOUT_SECONDS" -Default "20"
 $voiceTtsEnabledRaw = Get-EnvVar -Name "VOICE_TTS_ENABLED" -Default "true"
@@ -548,6 +574,9 @@ Write-Host ("STT engine priority: {0}" -f $sttEngine)
 if ($sttEngine -eq "whisper") {
   if ($pythonCommand) {
     Write-Host ("Whisper backend available via '{0}'. Model={1}, Device={2}, Compute={3}" -f $pythonCommand, $whisperModel, $whisperDevice, $whisperComputeType)
+    if ($sttServerUrl) {
+      Write-Host ("Persistent Whisper server: {0} (one-shot helper is the fallback)" -f $sttServerUrl)
+    }
     if ($whisperDevice -eq "cpu" -and $whisperModel -match "large") {
       Write-Warning "Large Whisper model on CPU can take a long time to transcribe per command. Use small/medium for lower latency."
     }
@@ -578,7 +607,8 @@ while ($true) {
       -Languages $voiceLanguages `
       -WindowsSpeechAvailable $speechAvailable `
       -WindowsRecognizer $recognizer `
-      -PythonCommand $pythonCommand
+      -PythonCommand $pythonCommand `
+      -ServerUrl $sttServerUrl
 
     if (-not $capture.ok) {
       Write-Host ([string]$capture.error)
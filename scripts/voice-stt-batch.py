@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Offline batch transcription for collected voice samples.
+
+Transcribes every WAV file in --dir (recursively) or listed in --manifest with
+one loaded faster-whisper model, --workers files at a time, and writes one JSON
+line per file:
+{"path": "...", "ok": true, "text": "...", "lang": "en", "duration": 2.1,
+ "command": "turn on plug 2", "transcribe_seconds": 0.84}
+
+`command` is the bridge-normalized command text (voice_mqtt.py). Manifest rows
+are JSON lines with a "path" (relative to the manifest) plus optional labels such
+as "expected_text" and "expected_steps", which are copied to the output so it can
+be fed straight to the agent's parser benchmark:
+
+  python scripts/voice-stt-batch.py --dir samples --output results.jsonl --workers 2
+  python -m agent.parse_bench --input results.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator
+
+from voice_mqtt import normalize_voice_command, parse_confirm_intent
+from voice_stt_lib import error_result, load_model, read_wav, transcribe
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Transcribe a directory or manifest of WAV files.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", type=str, help="Directory searched recursively for *.wav")
+    source.add_argument("--manifest", type=str, help="JSONL with {path, ...labels} rows")
+    parser.add_argument("--output", type=str, default="-", help="JSONL output file ('-' = stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="Files transcribed concurrently")
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=0,
+        help="CTranslate2 threads per worker (0 = library default)",
+    )
+    parser.add_argument("--model", type=str, default="small")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--compute-type", type=str, default="int8")
+    return parser.parse_args()
+
+
+def iter_jobs(args: argparse.Namespace) -> Iterator[dict[str, Any]]:
+    if args.dir:
+        for path in sorted(Path(args.dir).rglob("*.wav")):
+            yield {"path": str(path)}
+        return
+    base = Path(args.manifest).resolve().parent
+    with open(args.manifest, "r", encoding="utf-8-sig") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(row, dict) or not row.get("path"):
+                continue
+            path = Path(str(row["path"]))
+            row["path"] = str(path if path.is_absolute() else base / path)
+            yield row
+
+
+def transcribe_job(model: Any, job: dict[str, Any]) -> dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        audio, sample_rate = read_wav(job["path"])
+        result = transcribe(model, audio, sample_rate)
+    except Exception as exc:
+        result = error_result(f"read failed: {exc}")
+    row = {**job, **result, "transcribe_seconds": round(time.perf_counter() - started, 3)}
+    if result.get("ok"):
+        _, stripped = parse_confirm_intent(result["text"])
+        row["command"] = normalize_voice_command(stripped or result["text"])
+    return row
+
+
+def main() -> int:
+    args = parse_args()
+    jobs = list(iter_jobs(args))
+    if not jobs:
+        print(json.dumps(error_result("no WAV files found"), ensure_ascii=True), file=sys.stderr)
+        return 2
+    workers = max(1, int(args.workers))
+    try:
+        model = load_model(
+            args.model,
+            args.device,
+            args.compute_type,
+            cpu_threads=max(0, int(args.cpu_threads)),
+            num_workers=workers,
+        )
+    except Exception as exc:
+        message = error_result(f"failed to load whisper model: {exc}")
+        print(json.dumps(message, ensure_ascii=True), file=sys.stderr)
+        return 1
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    ok = 0
+    audio_seconds = 0.0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # map keeps input order in the output file.
+            for row in pool.map(lambda job: transcribe_job(model, job), jobs):
+                if row.get("ok"):
+                    ok += 1
+                    audio_seconds += float(row.get("duration", 0.0))
+                output.write(json.dumps(row, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    wall_seconds = time.perf_counter() - started
+    summary = {
+        "files": len(jobs),
+        "ok": ok,
+        "workers": workers,
+        "cpu_threads": args.cpu_threads,
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "realtime_factor": round(wall_seconds / audio_seconds, 3) if audio_seconds else None,
+    }
+    print(json.dumps(summary, ensure_ascii=True), file=sys.stderr)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: one-shot voice-stt.py vs the persistent voice-stt-server.py.
+
+Both paths transcribe the same 16-bit WAV file. The one-shot path runs a new
+Python process per utterance (process start + model load + transcription), the
+server path POSTs the file to /transcribe. Prints one JSON object with per-path
+latency stats.
+
+Example:
+  python scripts/voice-stt-bench.py --wav sample.wav --runs 5
+  python scripts/voice-stt-bench.py --wav sample.wav --server-url http://127.0.0.1:8765
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare one-shot and server STT latency.")
+    parser.add_argument("--wav", type=str, required=True)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--model", type=str, default="small")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--compute-type", type=str, default="int8")
+    parser.add_argument(
+        "--server-url",
+        type=str,
+        default="",
+        help="Use an already running server; otherwise one is started on --port.",
+    )
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--skip-oneshot", action="store_true")
+    return parser.parse_args()
+
+
+def summarize(samples: list[float]) -> dict[str, Any]:
+    if not samples:
+        return {"runs": 0}
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000.0, 1),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000.0, 1),
+        "min_ms": round(ordered[0] * 1000.0, 1),
+        "max_ms": round(ordered[-1] * 1000.0, 1),
+    }
+
+
+def model_args(args: argparse.Namespace) -> list[str]:
+    return ["--model", args.model, "--device", args.device, "--compute-type", args.compute_type]
+
+
+def bench_oneshot(args: argparse.Namespace) -> tuple[list[float], dict[str, Any]]:
+    samples: list[float] = []
+    last: dict[str, Any] = {}
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [
+                sys.executable,
+                str(SCRIPT_DIR / "voice-stt.py"),
+                "--wav",
+                args.wav,
+                "--capture",
+                "fixed",
+                *model_args(args),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        samples.append(time.perf_counter() - started)
+        lines = completed.stdout.strip().splitlines()
+        last = json.loads(lines[-1]) if lines else {"ok": False, "error": completed.stderr[-500:]}
+    return samples, last
+
+
+def post_wav(url: str, body: bytes) -> dict[str, Any]:
+    request = urllib.request.Request(
+        f"{url}/transcribe",
+        data=body,
+        headers={"Content-Type": "audio/wav"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def wait_for_server(url: str, timeout_seconds: float) -> dict[str, Any]:
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except Exception:
+            time.sleep(0.25)
+    raise RuntimeError(f"STT server at {url} did not become healthy")
+
+
+def bench_server(args: argparse.Namespace, body: bytes) -> tuple[list[float], dict[str, Any], dict[str, Any]]:
+    process = None
+    url = args.server_url.rstrip("/")
+    startup_seconds = None
+    if not url:
+        url = f"http://127.0.0.1:{args.port}"
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPT_DIR / "voice-stt-server.py"), "--port", str(args.port), *model_args(args)],
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        health = wait_for_server(url, timeout_seconds=600)
+        if process is not None:
+            startup_seconds = round(time.perf_counter() - started, 3)
+        post_wav(url, body)  # warm-up, not counted
+        samples: list[float] = []
+        last: dict[str, Any] = {}
+        for _ in range(args.runs):
+            started_run = time.perf_counter()
+            last = post_wav(url, body)
+            samples.append(time.perf_counter() - started_run)
+        health["startup_seconds"] = startup_seconds
+        return samples, last, health
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def main() -> int:
+    args = parse_args()
+    body = Path(args.wav).read_bytes()
+    report: dict[str, Any] = {"wav": args.wav, "model": args.model, "device": args.device}
+
+    server_samples, server_result, health = bench_server(args, body)
+    report["server"] = summarize(server_samples)
+    report["server"]["health"] = health
+    report["server"]["result"] = server_result
+
+    if not args.skip_oneshot:
+        oneshot_samples, oneshot_result = bench_oneshot(args)
+        report["oneshot"] = summarize(oneshot_samples)
+        report["oneshot"]["result"] = oneshot_result
+        if server_samples and oneshot_samples:
+            report["speedup_p50"] = round(
+                report["oneshot"]["p50_ms"] / max(report["server"]["p50_ms"], 0.001),
+                1,
+            )
+
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
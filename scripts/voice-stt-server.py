@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Persistent Whisper STT server for AI Home Lab voice bridge.
+
+Loads the faster-whisper model once and serves transcriptions over local HTTP,
+returning the same JSON contract as voice-stt.py:
+{"ok": true, "text": "...", "lang": "en", "duration": 5}
+or
+{"ok": false, "error": "..."}
+
+Endpoints:
+  GET  /health                          model and uptime info
+  POST /listen?timeout_seconds=5        record from this machine's mic and transcribe;
+       [&capture=stream|fixed]          stream stops at end of speech (default --capture)
+  POST /transcribe[?sample_rate=16000]  body is a 16-bit WAV file (audio/wav) or raw
+                                        little-endian int16 mono PCM (application/octet-stream)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from voice_stream import (
+    EnergyEndpointer,
+    StreamingTranscriber,
+    microphone_chunks,
+    model_segment_transcriber,
+    stream_transcribe,
+)
+from voice_stt_lib import (
+    capture_microphone,
+    error_result,
+    load_model,
+    pcm16_to_float32,
+    read_wav,
+    transcribe,
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve faster-whisper transcription over local HTTP.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--model", type=str, default="small")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--compute-type", type=str, default="int8")
+    parser.add_argument("--max-body-bytes", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--capture", choices=["stream", "fixed"], default="stream")
+    parser.add_argument("--end-silence-ms", type=int, default=800)
+    parser.add_argument("--start-threshold", type=float, default=0.015)
+    return parser.parse_args()
+
+
+class SttService:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        started = time.perf_counter()
+        self.model = load_model(args.model, args.device, args.compute_type)
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        self.started_at = time.time()
+        # One transcription at a time keeps CPU inference from thrashing.
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._segment_transcriber = model_segment_transcriber(lambda: self.model)
+
+    def transcribe(self, audio: Any, sample_rate: int, duration: float | None = None) -> dict[str, Any]:
+        with self.lock:
+            self.requests += 1
+            return transcribe(self.model, audio, sample_rate, duration=duration)
+
+    def _transcribe_segment(self, segment: Any) -> tuple[str, str]:
+        with self.lock:
+            return self._segment_transcriber(segment)
+
+    def listen_stream(self, timeout_seconds: float) -> dict[str, Any]:
+        endpointer = EnergyEndpointer(
+            start_threshold=self.args.start_threshold,
+            end_silence_ms=self.args.end_silence_ms,
+            max_seconds=timeout_seconds,
+            no_speech_timeout_seconds=timeout_seconds,
+        )
+        self.requests += 1
+        transcriber = StreamingTranscriber(self._transcribe_segment)
+        return stream_transcribe(microphone_chunks(self.args.sample_rate), endpointer, transcriber)
+
+    def health(self) -> dict[str, Any]:
+        return {
+            "ok": True,
+            "model": self.args.model,
+            "device": self.args.device,
+            "compute_type": self.args.compute_type,
+            "capture": self.args.capture,
+            "load_seconds": self.load_seconds,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "requests": self.requests,
+        }
+
+
+def make_handler(service: SttService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt: str, *args: Any) -> None:
+            return
+
+        def _send(self, status: int, body: dict[str, Any]) -> None:
+            raw = json.dumps(body, ensure_ascii=True).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self) -> None:
+            if urlparse(self.path).path == "/health":
+                self._send(200, service.health())
+            else:
+                self._send(404, error_result("not found"))
+
+        def do_POST(self) -> None:
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            try:
+                if parsed.path == "/listen":
+                    timeout_seconds = float(query.get("timeout_seconds", ["5"])[0])
+                    timeout_seconds = max(1.0, min(15.0, timeout_seconds))
+                    capture = query.get("capture", [service.args.capture])[0]
+                    if capture == "stream":
+                        try:
+                            result = service.listen_stream(timeout_seconds)
+                        except Exception as exc:
+                            result = error_result(f"audio capture failed: {exc}")
+                        self._send(200, result)
+                        return
+                    sample_rate = service.args.sample_rate
+                    try:
+                        pcm = capture_microphone(timeout_seconds, sample_rate)
+                    except Exception as exc:
+                        self._send(200, error_result(f"audio capture failed: {exc}"))
+                        return
+                    result = service.transcribe(pcm16_to_float32(pcm), sample_rate, timeout_seconds)
+                    self._send(200, result)
+                elif parsed.path == "/transcribe":
+                    length = int(self.headers.get("Content-Length", "0"))
+                    if length <= 0 or length > service.args.max_body_bytes:
+                        self._send(413, error_result(f"body must be 1..{service.args.max_body_bytes} bytes"))
+                        return
+                    body = self.rfile.read(length)
+                    content_type = self.headers.get("Content-Type", "")
+                    if "wav" in content_type or body[:4] == b"RIFF":
+                        audio, sample_rate = read_wav(body)
+                    else:
+                        sample_rate = int(query.get("sample_rate", [str(service.args.sample_rate)])[0])
+                        audio = pcm16_to_float32(memoryview(body))
+                    self._send(200, service.transcribe(audio, sample_rate))
+                else:
+                    self._send(404, error_result("not found"))
+            except Exception as exc:
+                self._send(400, error_result(f"bad request: {exc}"))
+
+    return Handler
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        service = SttService(args)
+    except Exception as exc:
+        print(json.dumps(error_result(f"failed to load whisper model: {exc}"), ensure_ascii=True))
+        return 1
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(
+        f"voice STT server on http://{args.host}:{args.port} "
+        f"(model={args.model}, loaded in {service.load_seconds}s)",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,23 +2,42 @@
 """
 Local Whisper STT helper for AI Home Lab voice bridge.
 
-Records short microphone audio and returns one JSON line:
+Records microphone audio (or reads --wav) and returns one JSON line:
 {"ok": true, "text": "...", "lang": "en", "duration": 5}
 or
 {"ok": false, "error": "..."}
+
+With --capture stream (default) recording stops at end of speech and pauses
+are transcribed while the speaker continues; --capture fixed records the whole
+--timeout-seconds window. This one-shot helper loads the model on every run;
+voice-stt-server.py keeps it loaded and returns the same contract.
+
+With --mqtt the helper keeps the model loaded, loops on push-to-talk and
+publishes partial transcripts to home/ai/voice/partial and the final command
+to home/ai/command itself (see voice_mqtt.py); each JSON line then also carries
+the published payload and, unless --result-timeout-seconds is 0, the agent's
+action_result.
 """
 
 from __future__ import annotations
 
 import argparse
 import json
-import tempfile
-import wave
-from pathlib import Path
+import sys
 
 import numpy as np
-import sounddevice as sd
-from faster_whisper import WhisperModel
+
+from voice_stream import (
+    BackgroundModel,
+    EnergyEndpointer,
+    StreamingTranscriber,
+    microphone_chunks,
+    model_segment_transcriber,
+    stream_transcribe,
+    wav_chunks,
+)
+from voice_mqtt import VoicePublisher, read_env
+from voice_stt_lib import capture_microphone, load_model, pcm16_to_float32, read_wav, transcribe
 
 
 def parse_args() -> argparse.Namespace:
@@ -29,91 +48,139 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--device", type=str, default="cpu")
     parser.add_argument("--compute-type", type=str, default="int8")
     parser.add_argument("--languages", type=str, default="en,ms,zh")
+    parser.add_argument("--wav", type=str, default="", help="Transcribe a 16-bit WAV file instead of the mic.")
+    parser.add_argument("--capture", choices=["stream", "fixed"], default="stream")
+    parser.add_argument("--end-silence-ms", type=int, default=800)
+    parser.add_argument("--start-threshold", type=float, default=0.015)
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Pace --wav input like a live microphone (stream capture only).",
+    )
+    parser.add_argument(
+        "--endpoint-only",
+        action="store_true",
+        help="Run endpointing without loading a model (stream capture only).",
+    )
+    parser.add_argument(
+        "--mqtt",
+        action="store_true",
+        help="Publish partials and the final command to MQTT (stream capture only).",
+    )
+    parser.add_argument("--mqtt-host", type=str, default="")
+    parser.add_argument("--mqtt-port", type=int, default=0)
+    parser.add_argument("--result-timeout-seconds", type=float, default=20.0)
     return parser.parse_args()
 
 
-def write_wav(path: Path, pcm: np.ndarray, sample_rate: int) -> None:
-    with wave.open(str(path), "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)  # int16
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm.tobytes())
+def make_endpointer(args: argparse.Namespace, timeout_seconds: float) -> EnergyEndpointer:
+    return EnergyEndpointer(
+        start_threshold=args.start_threshold,
+        end_silence_ms=args.end_silence_ms,
+        max_seconds=timeout_seconds if not args.wav else 600.0,
+        no_speech_timeout_seconds=timeout_seconds if not args.wav else 600.0,
+    )
+
+
+def run_stream(args: argparse.Namespace, timeout_seconds: float) -> int:
+    endpointer = make_endpointer(args, timeout_seconds)
+    transcriber = None
+    if not args.endpoint_only:
+        # The mic opens right away; the first segment waits for the model if needed.
+        model = BackgroundModel(lambda: load_model(args.model, args.device, args.compute_type))
+        transcriber = StreamingTranscriber(model_segment_transcriber(model.get))
+    try:
+        if args.wav:
+            chunks = wav_chunks(args.wav, realtime=args.realtime)
+        else:
+            chunks = microphone_chunks(int(args.sample_rate))
+        return emit(stream_transcribe(chunks, endpointer, transcriber))
+    except Exception as exc:
+        return emit({"ok": False, "error": f"audio capture failed: {exc}"})
+
+
+def run_mqtt(args: argparse.Namespace, timeout_seconds: float) -> int:
+    if args.capture != "stream" or args.endpoint_only:
+        return emit({"ok": False, "error": "--mqtt needs --capture stream and a model"})
+    try:
+        publisher = VoicePublisher(
+            host=args.mqtt_host or read_env("MQTT_HOST", "127.0.0.1"),
+            port=args.mqtt_port or int(read_env("MQTT_PORT", "1883")),
+            user=read_env("MQTT_USER"),
+            password=read_env("MQTT_PASSWORD"),
+        )
+    except Exception as exc:
+        return emit({"ok": False, "error": f"mqtt connect failed: {exc}"})
+
+    model = BackgroundModel(lambda: load_model(args.model, args.device, args.compute_type))
+    status = 0
+    try:
+        while True:
+            if not args.wav:
+                print("Press Enter to speak, or type q to quit.", file=sys.stderr, flush=True)
+                line = sys.stdin.readline()
+                if not line or line.strip().lower() == "q":
+                    break
+            utterance = publisher.new_utterance()
+            transcriber = StreamingTranscriber(
+                model_segment_transcriber(model.get),
+                on_partial=utterance.publish_partial,
+            )
+            try:
+                if args.wav:
+                    chunks = wav_chunks(args.wav, realtime=args.realtime)
+                else:
+                    chunks = microphone_chunks(int(args.sample_rate))
+                result = stream_transcribe(chunks, make_endpointer(args, timeout_seconds), transcriber)
+            except Exception as exc:
+                result = {"ok": False, "error": f"audio capture failed: {exc}"}
+            if result.get("ok"):
+                payload = utterance.publish_command(result["text"], result["lang"])
+                result["published"] = payload
+                if payload is not None and args.result_timeout_seconds > 0:
+                    result["action_result"] = publisher.wait_result(
+                        utterance.utterance_id,
+                        args.result_timeout_seconds,
+                    )
+            status = emit(result)
+            if args.wav:
+                break
+    finally:
+        publisher.close()
+    return status
+
+
+def emit(result: dict) -> int:
+    print(json.dumps(result, ensure_ascii=True))
+    return 0 if result.get("ok") else 1
 
 
 def main() -> int:
     args = parse_args()
     timeout_seconds = max(1.0, min(15.0, float(args.timeout_seconds)))
     sample_rate = int(args.sample_rate)
-    language_hints = [p.strip().lower() for p in str(args.languages).split(",") if p.strip()]
+    if args.mqtt:
+        return run_mqtt(args, timeout_seconds)
+    if args.capture == "stream":
+        return run_stream(args, timeout_seconds)
 
     try:
-        frames = int(timeout_seconds * sample_rate)
-        audio = sd.rec(
-            frames,
-            samplerate=sample_rate,
-            channels=1,
-            dtype="int16",
-            blocking=True,
-        )
-        audio = np.asarray(audio).reshape(-1)
+        if args.wav:
+            audio, sample_rate = read_wav(args.wav)
+            duration = round(audio.size / float(sample_rate), 2)
+        else:
+            audio = pcm16_to_float32(capture_microphone(timeout_seconds, sample_rate))
+            duration = timeout_seconds
     except Exception as exc:
-        print(json.dumps({"ok": False, "error": f"audio capture failed: {exc}"}, ensure_ascii=True))
-        return 1
+        return emit({"ok": False, "error": f"audio capture failed: {exc}"})
 
     try:
-        model = WhisperModel(
-            args.model,
-            device=args.device,
-            compute_type=args.compute_type,
-        )
+        model = load_model(args.model, args.device, args.compute_type)
     except Exception as exc:
-        print(json.dumps({"ok": False, "error": f"failed to load whisper model: {exc}"}, ensure_ascii=True))
-        return 1
+        return emit({"ok": False, "error": f"failed to load whisper model: {exc}"})
 
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        wav_path = Path(tmp.name)
-    try:
-        write_wav(wav_path, audio, sample_rate)
-        segments, info = model.transcribe(
-            str(wav_path),
-            beam_size=1,
-            vad_filter=True,
-            language=None,
-        )
-        text = " ".join(seg.text.strip() for seg in segments if seg.text).strip()
-        lang = (getattr(info, "language", "") or "").lower().strip()
-        if not lang:
-            lang = "en"
-        if language_hints and lang not in language_hints:
-            # Keep detected language but mark unknown language family as-is.
-            pass
-
-        if not text:
-            print(json.dumps({"ok": False, "error": "no speech recognized"}, ensure_ascii=True))
-            return 1
-
-        print(
-            json.dumps(
-                {
-                    "ok": True,
-                    "text": text,
-                    "lang": lang,
-                    "duration": timeout_seconds,
-                },
-                ensure_ascii=True,
-            )
-        )
-        return 0
-    except Exception as exc:
-        print(json.dumps({"ok": False, "error": f"transcription failed: {exc}"}, ensure_ascii=True))
-        return 1
-    finally:
-        try:
-            wav_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+    return emit(transcribe(model, np.asarray(audio), sample_rate, duration=duration))
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
@@ -0,0 +1,267 @@
+"""
+Direct MQTT publishing for the voice STT helper.
+
+Mirrors what voice-bridge.ps1 does after a capture (confirm phrase, command
+normalization, ask-mode confirm) so voice-stt.py --mqtt can publish without the
+PowerShell hop:
+
+  home/ai/voice/partial  {"utterance_id", "seq", "text", "command", "lang", "source": "voice"}
+  home/ai/command        {"command", "source": "voice", "confirm", "raw_command", "lang", "request_id"}
+
+The final command's request_id is the utterance id, so the agent can match it
+to parses it warmed from the partials.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+ENV_PATH = Path(__file__).resolve().parents[1] / "docker" / ".env"
+COMMAND_TOPIC = "home/ai/command"
+PARTIAL_TOPIC = "home/ai/voice/partial"
+MODE_TOPIC = "home/ai/mode"
+RESULT_TOPIC = "home/ai/action_result"
+
+CONFIRM_PHRASES = (
+    "confirm",
+    "yes execute",
+    "go ahead",
+    "proceed",
+    "do it",
+    "sahkan",
+    "ya jalankan",
+    "teruskan",
+    "确认",
+    "確認",
+    "请执行",
+    "請執行",
+)
+
+FAN = "(fan|xiaomi fan|kipas|风扇|風扇)"
+ON = "(turn on|switch on|power on|hidupkan|buka|打开|打開|開啟|开启|開|开)"
+OFF = (
+    "(turn off|switch off|power off|shut off|tutup|padam|matikan|"
+    "关闭|關閉|关|關|關掉|关掉)"
+)
+UP = "(increase|faster|up|kuatkan|naikkan|tambah laju|加快|调高|調高)"
+DOWN = (
+    "(decrease|slower|down|perlahan|kurangkan|turunkan|"
+    "减速|減速|调低|調低)"
+)
+SWING = "(oscillat|swing|left right|kiri kanan|ayun|摇头|搖頭)"
+SWING_OFF = "(off|stop|disable|tutup|henti|关闭|關閉|关|關)"
+SWING_ON = "(on|start|enable|hidupkan|buka|打开|開啟|开启|开)"
+
+DEVICE_LIST_PATTERNS = (
+    "what devices do you control",
+    "what can you control",
+    "device list",
+    "senarai peranti",
+    "peranti apa",
+    "你可以控制什么",
+    "你能控制什么",
+    "设备列表",
+    "裝置列表",
+)
+FAN_QUERY_PATTERNS = (
+    "what can xiaomi fan do",
+    "what can the fan do",
+    "apa kipas xiaomi boleh",
+    "kipas xiaomi boleh buat apa",
+    "小米风扇.*能.*做什么",
+    "小米風扇.*能.*做什麼",
+    "风扇.*可以.*做什么",
+    "風扇.*可以.*做什麼",
+)
+PLUG_ON_PATTERNS = (
+    r"\b(turn on|switch on|power on)\b.*\b(plug|outlet)\s*([1-4])\b",
+    r"\b(on|hidupkan|buka)\b.*\b(plug|soket|outlet)\s*([1-4])\b",
+    "(打开|打開|開啟|开启|開|开)\\s*"
+    "(插座|插头|插頭|插蘇)\\s*([1-4])",
+)
+PLUG_OFF_PATTERNS = (
+    r"\b(turn off|switch off|power off|shut off)\b.*\b(plug|outlet)\s*([1-4])\b",
+    r"\b(off|tutup|padam|matikan)\b.*\b(plug|soket|outlet)\s*([1-4])\b",
+    "(关闭|關閉|关|關)\\s*(插座|插头|插頭|插蘇)\\s*([1-4])",
+)
+# Ordered like Normalize-VoiceCommand in voice-bridge.ps1: first match wins.
+FAN_COMMANDS = (
+    ((f"{ON}.*{FAN}", f"{FAN}.*{ON}"), "turn on xiaomi fan"),
+    ((f"{OFF}.*{FAN}", f"{FAN}.*{OFF}"), "turn off xiaomi fan"),
+    ((f"{UP}.*{FAN}", f"{FAN}.*{UP}"), "increase xiaomi fan speed"),
+    ((f"{DOWN}.*{FAN}", f"{FAN}.*{DOWN}"), "decrease xiaomi fan speed"),
+    ((f"{SWING}.*{SWING_OFF}", f"{SWING_OFF}.*{SWING}"), "turn off xiaomi fan oscillation"),
+    ((f"{SWING}.*{SWING_ON}", f"{SWING_ON}.*{SWING}"), "turn on xiaomi fan oscillation"),
+    ((f"(turn|set|make).*{FAN}.*(a bit|a little|sedikit|sikit|一点|一點)",), "turn the fan a bit"),
+)
+CHINESE_DIGITS = {"一": "1", "二": "2", "两": "2", "三": "3", "四": "4"}
+XIAOMI_FAN_ZH = ("小米风扇", "小米風扇")
+
+
+def parse_confirm_intent(text: str) -> tuple[bool, str]:
+    normalized = " ".join(text.lower().split())
+    for phrase in CONFIRM_PHRASES:
+        if normalized.startswith(phrase):
+            return True, normalized[len(phrase) :].strip()
+    return False, normalized
+
+
+def normalize_voice_command(raw_command: str) -> str:
+    """Python port of Normalize-VoiceCommand (en/ms/zh to the agent's phrasing)."""
+    normalized = raw_command.strip().lower()
+    for digit, value in CHINESE_DIGITS.items():
+        normalized = normalized.replace(digit, value)
+    normalized = re.sub(r"[^\w\s\u4e00-\u9fff]", " ", normalized)
+    normalized = " ".join(normalized.split())
+
+    # Common Cantonese/Whisper variants for "plug/socket".
+    normalized = re.sub("叉头|叉頭", "插头", normalized)
+    normalized = re.sub("插苏|插蘇", "插座", normalized)
+    normalized = re.sub("x做|xzuo", "插座", normalized)
+    if not normalized:
+        return ""
+
+    if any(re.search(p, normalized) for p in DEVICE_LIST_PATTERNS):
+        return "what devices do you control"
+    if any(re.search(p, normalized) for p in FAN_QUERY_PATTERNS):
+        return "what can xiaomi fan do"
+
+    normalized = normalized.replace("xiao mi fan", "xiaomi fan").replace("kipas xiaomi", "xiaomi fan")
+    for variant in XIAOMI_FAN_ZH:
+        normalized = normalized.replace(variant, "xiaomi fan")
+    # Bare fan mention is treated as a capability query to avoid accidental actions.
+    if normalized == "xiaomi fan":
+        return "what can xiaomi fan do"
+
+    for patterns, action in ((PLUG_ON_PATTERNS, "turn on"), (PLUG_OFF_PATTERNS, "turn off")):
+        for pattern in patterns:
+            match = re.search(pattern, normalized)
+            if match:
+                return f"{action} plug {match.group(match.lastindex)}"
+    for patterns, command in FAN_COMMANDS:
+        if any(re.search(p, normalized) for p in patterns):
+            return command
+    return normalized
+
+
+def read_env(name: str, default: str = "") -> str:
+    """Process environment first, then docker/.env like voice-bridge.ps1."""
+    if os.getenv(name):
+        return os.environ[name]
+    if ENV_PATH.exists():
+        for line in ENV_PATH.read_text(encoding="utf-8-sig").splitlines():
+            if line.startswith(f"{name}="):
+                return line.split("=", 1)[1].strip()
+    return default
+
+
+class VoicePublisher:
+    """Publishes partial transcripts and final voice commands straight to MQTT."""
+
+    def __init__(self, host: str, port: int, user: str, password: str) -> None:
+        import paho.mqtt.client as mqtt
+
+        self.mode = "auto"
+        self._pending: set[str] = set()
+        self._results: dict[str, dict[str, Any]] = {}
+        self._result_ready = threading.Condition()
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=f"voice-stt-{uuid.uuid4().hex[:8]}",
+        )
+        if user:
+            self.client.username_pw_set(user, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect(host, port, keepalive=30)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None) -> None:
+        client.subscribe([(MODE_TOPIC, 0), (RESULT_TOPIC, 0)])
+
+    def _on_message(self, client, userdata, msg) -> None:
+        try:
+            body = json.loads(msg.payload.decode("utf-8", errors="replace"))
+        except json.JSONDecodeError:
+            return
+        if not isinstance(body, dict):
+            return
+        if msg.topic == MODE_TOPIC:
+            mode = str(body.get("mode", "")).strip().lower()
+            if mode in {"suggest", "ask", "auto"}:
+                self.mode = mode
+            return
+        request_id = str(body.get("request_id", "")).strip()
+        if request_id in self._pending:
+            with self._result_ready:
+                self._results[request_id] = body
+                self._result_ready.notify_all()
+
+    def expect(self, request_id: str) -> None:
+        with self._result_ready:
+            self._pending.add(request_id)
+
+    def new_utterance(self) -> "Utterance":
+        return Utterance(self)
+
+    def wait_result(self, request_id: str, timeout_seconds: float) -> dict[str, Any] | None:
+        deadline = time.monotonic() + timeout_seconds
+        with self._result_ready:
+            while request_id not in self._results:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._pending.discard(request_id)
+                    return None
+                self._result_ready.wait(remaining)
+            self._pending.discard(request_id)
+            return self._results.pop(request_id)
+
+    def close(self) -> None:
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class Utterance:
+    def __init__(self, publisher: VoicePublisher) -> None:
+        self.publisher = publisher
+        self.utterance_id = f"voice-{uuid.uuid4().hex[:12]}"
+        self.seq = 0
+
+    def publish_partial(self, text: str, lang: str) -> None:
+        self.seq += 1
+        _, stripped = parse_confirm_intent(text)
+        payload = {
+            "utterance_id": self.utterance_id,
+            "seq": self.seq,
+            "text": text,
+            "command": normalize_voice_command(stripped),
+            "lang": lang,
+            "source": "voice",
+        }
+        self.publisher.client.publish(PARTIAL_TOPIC, json.dumps(payload, ensure_ascii=True), qos=0)
+
+    def publish_command(self, text: str, lang: str) -> dict[str, Any] | None:
+        """Publish the final command; returns the payload, or None if it normalizes to nothing."""
+        explicit_confirm, stripped = parse_confirm_intent(text)
+        command = normalize_voice_command(stripped or text)
+        if not command:
+            return None
+        payload = {
+            "command": command,
+            "source": "voice",
+            "confirm": self.publisher.mode == "ask" and explicit_confirm,
+            "raw_command": text,
+            "lang": lang,
+            "request_id": self.utterance_id,
+        }
+        self.publisher.expect(self.utterance_id)
+        info = self.publisher.client.publish(COMMAND_TOPIC, json.dumps(payload, ensure_ascii=True), qos=1)
+        info.wait_for_publish(timeout=5)
+        return payload
@@ -0,0 +1,324 @@
+"""
+Streaming, energy-endpointed capture for the voice STT scripts.
+
+Audio arrives in small chunks (microphone or WAV file), an energy endpointer
+decides when speech starts, where short pauses split it into segments and when
+the utterance has ended. Completed segments are transcribed on a background
+thread while capture continues, so only the tail is left to transcribe once the
+speaker stops and time-to-text follows utterance length, not the timeout.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+
+from voice_stt_lib import WHISPER_SAMPLE_RATE, error_result, read_wav, resample
+
+SegmentTranscriber = Callable[[np.ndarray], tuple[str, str]]
+
+
+class EnergyEndpointer:
+    """Frame-energy endpointing with an adaptive noise floor.
+
+    `feed` takes float32 chunks at `sample_rate` and returns the list of events
+    it produced: ("segment", samples) when a pause closes a segment of at least
+    `min_segment_seconds`, and ("end", samples) with the remaining speech once the
+    utterance ends (silence, max duration, or no speech before the timeout).
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = WHISPER_SAMPLE_RATE,
+        frame_ms: int = 30,
+        start_threshold: float = 0.015,
+        noise_ratio: float = 3.0,
+        start_frames: int = 3,
+        pause_ms: int = 300,
+        end_silence_ms: int = 800,
+        min_segment_seconds: float = 1.5,
+        max_seconds: float = 15.0,
+        no_speech_timeout_seconds: float = 5.0,
+        pre_roll_ms: int = 200,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.frame_size = max(1, int(sample_rate * frame_ms / 1000))
+        self.start_threshold = start_threshold
+        self.noise_ratio = noise_ratio
+        self.start_frames = start_frames
+        self.pause_frames = max(1, pause_ms // frame_ms)
+        self.end_frames = max(self.pause_frames, end_silence_ms // frame_ms)
+        self.min_segment_samples = int(min_segment_seconds * sample_rate)
+        self.max_samples = int(max_seconds * sample_rate)
+        self.no_speech_samples = int(no_speech_timeout_seconds * sample_rate)
+        self.pre_roll_frames = max(0, pre_roll_ms // frame_ms)
+
+        self.noise_floor = 0.0
+        self.speech_started = False
+        self.done = False
+        self.reason = ""
+        self.samples_seen = 0
+        self.speech_start_sample: int | None = None
+        self.speech_end_sample: int | None = None
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._pre_roll: list[np.ndarray] = []
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._segment: list[np.ndarray] = []
+        self._segment_samples = 0
+
+    def _threshold(self) -> float:
+        return max(self.start_threshold, self.noise_floor * self.noise_ratio)
+
+    def _take_segment(self, drop_frames: int = 0) -> np.ndarray:
+        frames = self._segment[: max(0, len(self._segment) - drop_frames)]
+        audio = np.concatenate(frames) if frames else np.zeros(0, dtype=np.float32)
+        self._segment = []
+        self._segment_samples = 0
+        return audio
+
+    def _finish(self, reason: str, events: list[tuple[str, np.ndarray]]) -> None:
+        self.done = True
+        self.reason = reason
+        # Trailing silence frames carry no speech; keep a short tail for the decoder.
+        drop = max(0, self._silent_run - self.pause_frames) if self.speech_started else 0
+        events.append(("end", self._take_segment(drop)))
+
+    def feed(self, chunk: np.ndarray) -> list[tuple[str, np.ndarray]]:
+        events: list[tuple[str, np.ndarray]] = []
+        if self.done:
+            return events
+        data = np.concatenate([self._remainder, np.asarray(chunk, dtype=np.float32).reshape(-1)])
+        usable = (data.size // self.frame_size) * self.frame_size
+        self._remainder = data[usable:]
+        for start in range(0, usable, self.frame_size):
+            frame = data[start : start + self.frame_size]
+            self.samples_seen += frame.size
+            energy = float(np.sqrt(np.mean(frame * frame)))
+            voiced = energy >= self._threshold()
+            if not self.speech_started:
+                if not voiced:
+                    # Slow-moving floor so a brief click does not raise it much.
+                    if self.noise_floor == 0.0:
+                        self.noise_floor = energy
+                    else:
+                        self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+                self._pre_roll.append(frame)
+                if len(self._pre_roll) > self.pre_roll_frames + self.start_frames:
+                    self._pre_roll.pop(0)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.start_frames:
+                    self.speech_started = True
+                    self.speech_start_sample = self.samples_seen - self.frame_size * len(self._pre_roll)
+                    self._segment = list(self._pre_roll)
+                    self._segment_samples = sum(f.size for f in self._segment)
+                    self._pre_roll = []
+                elif self.samples_seen >= self.no_speech_samples:
+                    self._finish("no_speech", events)
+                    return events
+                continue
+
+            self._segment.append(frame)
+            self._segment_samples += frame.size
+            if voiced:
+                self._silent_run = 0
+                self.speech_end_sample = self.samples_seen
+            else:
+                self._silent_run += 1
+            if self._silent_run >= self.end_frames:
+                self._finish("end_of_speech", events)
+                return events
+            if self._silent_run == self.pause_frames and self._segment_samples >= self.min_segment_samples:
+                events.append(("segment", self._take_segment()))
+            if self.samples_seen >= self.max_samples:
+                self._finish("max_duration", events)
+                return events
+        return events
+
+    def flush(self) -> list[tuple[str, np.ndarray]]:
+        """Close the utterance when the input ends before the endpointer did."""
+        events: list[tuple[str, np.ndarray]] = []
+        if not self.done:
+            self._finish("input_ended" if self.speech_started else "no_speech", events)
+        return events
+
+
+class StreamingTranscriber:
+    """Transcribes committed segments on a worker thread while capture continues."""
+
+    def __init__(
+        self,
+        transcribe_segment: SegmentTranscriber,
+        on_partial: Callable[[str, str], None] | None = None,
+    ) -> None:
+        self.transcribe_segment = transcribe_segment
+        self.on_partial = on_partial
+        self.texts: list[str] = []
+        self.lang = ""
+        self.errors: list[str] = []
+        self._queue: queue.Queue[np.ndarray | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                return
+            try:
+                text, lang = self.transcribe_segment(segment)
+            except Exception as exc:
+                self.errors.append(str(exc))
+                continue
+            if text:
+                self.texts.append(text)
+                if not self.lang and lang:
+                    self.lang = lang
+                if self.on_partial is not None:
+                    self.on_partial(" ".join(self.texts), self.lang)
+
+    def submit(self, segment: np.ndarray) -> None:
+        if segment.size:
+            self._queue.put(segment)
+
+    def finish(self, tail: np.ndarray) -> tuple[str, str]:
+        self.submit(tail)
+        self._queue.put(None)
+        self._thread.join()
+        return " ".join(self.texts).strip(), self.lang
+
+
+class BackgroundModel:
+    """Loads the model on a thread so the microphone can open immediately."""
+
+    def __init__(self, loader: Callable[[], Any]) -> None:
+        self._loader = loader
+        self._model: Any = None
+        self._error: Exception | None = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            self._model = self._loader()
+        except Exception as exc:
+            self._error = exc
+        finally:
+            self._ready.set()
+
+    def get(self) -> Any:
+        self._ready.wait()
+        if self._error is not None:
+            raise RuntimeError(f"failed to load whisper model: {self._error}")
+        return self._model
+
+
+def model_segment_transcriber(get_model: Callable[[], Any]) -> SegmentTranscriber:
+    def transcribe_segment(segment: np.ndarray) -> tuple[str, str]:
+        segments, info = get_model().transcribe(segment, beam_size=1, vad_filter=False, language=None)
+        text = " ".join(seg.text.strip() for seg in segments if seg.text).strip()
+        return text, (getattr(info, "language", "") or "").lower().strip()
+
+    return transcribe_segment
+
+
+def wav_chunks(path: str | Path, chunk_ms: int = 30, realtime: bool = False) -> Iterator[np.ndarray]:
+    """Yield a WAV file as 16 kHz float32 chunks, optionally paced like a live mic."""
+    audio, sample_rate = read_wav(path)
+    audio = resample(audio, sample_rate)
+    chunk_size = max(1, int(WHISPER_SAMPLE_RATE * chunk_ms / 1000))
+    started = time.perf_counter()
+    for index, start in enumerate(range(0, audio.size, chunk_size)):
+        if realtime:
+            delay = started + index * chunk_ms / 1000.0 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield audio[start : start + chunk_size]
+
+
+def microphone_chunks(sample_rate: int = WHISPER_SAMPLE_RATE, chunk_ms: int = 30) -> Iterator[np.ndarray]:
+    import sounddevice as sd
+
+    chunks: queue.Queue[np.ndarray] = queue.Queue()
+
+    def callback(indata: np.ndarray, frames: int, time_info: Any, status: Any) -> None:
+        chunks.put(indata[:, 0].astype(np.float32) / 32768.0)
+
+    blocksize = max(1, int(sample_rate * chunk_ms / 1000))
+    with sd.InputStream(
+        samplerate=sample_rate,
+        channels=1,
+        dtype="int16",
+        blocksize=blocksize,
+        callback=callback,
+    ):
+        while True:
+            chunk = chunks.get()
+            yield chunk if sample_rate == WHISPER_SAMPLE_RATE else resample(chunk, sample_rate)
+
+
+def stream_transcribe(
+    chunks: Iterable[np.ndarray],
+    endpointer: EnergyEndpointer,
+    transcriber: StreamingTranscriber | None,
+) -> dict[str, Any]:
+    """Run capture until the endpointer stops; returns the STT JSON contract.
+
+    With `transcriber=None` only endpointing runs, which is handy for tuning the
+    thresholds against recorded WAV files without loading a model. A generator
+    source is closed once capture stops, so the microphone stream does not keep
+    buffering audio between push-to-talk turns.
+    """
+    started = time.perf_counter()
+    segments = 0
+    end_audio = None
+    try:
+        for chunk in chunks:
+            for kind, audio in endpointer.feed(chunk):
+                if kind == "segment":
+                    segments += 1
+                    if transcriber is not None:
+                        transcriber.submit(audio)
+                else:
+                    end_audio = audio
+            if endpointer.done:
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    if not endpointer.done:
+        end_audio = endpointer.flush()[0][1]
+    capture_seconds = round(time.perf_counter() - started, 3)
+    duration = round(endpointer.samples_seen / float(endpointer.sample_rate), 2)
+    timing = {
+        "endpoint": endpointer.reason,
+        "segments": segments + (1 if end_audio is not None and end_audio.size else 0),
+        "speech_start": None
+        if endpointer.speech_start_sample is None
+        else round(endpointer.speech_start_sample / float(endpointer.sample_rate), 2),
+        "speech_end": None
+        if endpointer.speech_end_sample is None
+        else round(endpointer.speech_end_sample / float(endpointer.sample_rate), 2),
+    }
+    if not endpointer.speech_started:
+        if transcriber is not None:
+            transcriber.finish(np.zeros(0, dtype=np.float32))
+        return {**error_result("no speech recognized"), **timing}
+    if transcriber is None:
+        return {"ok": True, "text": "", "lang": "", "duration": duration, **timing}
+
+    tail_started = time.perf_counter()
+    text, lang = transcriber.finish(end_audio if end_audio is not None else np.zeros(0, dtype=np.float32))
+    timing["capture_seconds"] = capture_seconds
+    timing["tail_seconds"] = round(time.perf_counter() - tail_started, 3)
+    if transcriber.errors and not text:
+        return {**error_result(f"transcription failed: {transcriber.errors[-1]}"), **timing}
+    if not text:
+        return {**error_result("no speech recognized"), **timing}
+    return {"ok": True, "text": text, "lang": lang or "en", "duration": duration, **timing}
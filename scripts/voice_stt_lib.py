@@ -0,0 +1,128 @@
+"""
+Shared Whisper STT helpers for the voice scripts.
+
+Audio stays in memory as numpy arrays; nothing is written to temp files.
+Results follow the voice-stt.py JSON contract:
+{"ok": true, "text": "...", "lang": "en", "duration": 5}
+or
+{"ok": false, "error": "..."}
+"""
+
+from __future__ import annotations
+
+import io
+import wave
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def error_result(message: str) -> dict[str, Any]:
+    return {"ok": False, "error": message}
+
+
+def parse_language_hints(languages: str) -> list[str]:
+    return [p.strip().lower() for p in str(languages).split(",") if p.strip()]
+
+
+def pcm16_to_float32(pcm: bytes | bytearray | memoryview | np.ndarray) -> np.ndarray:
+    if isinstance(pcm, np.ndarray):
+        samples = pcm.reshape(-1).astype(np.int16, copy=False)
+    else:
+        samples = np.frombuffer(pcm, dtype=np.int16)
+    return samples.astype(np.float32) / 32768.0
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    if src_rate == dst_rate or audio.size == 0:
+        return audio
+    duration = audio.size / float(src_rate)
+    dst_size = max(1, int(round(duration * dst_rate)))
+    src_times = np.arange(audio.size, dtype=np.float64) / src_rate
+    dst_times = np.arange(dst_size, dtype=np.float64) / dst_rate
+    return np.interp(dst_times, src_times, audio).astype(np.float32)
+
+
+def read_wav(source: str | Path | bytes) -> tuple[np.ndarray, int]:
+    """Return mono float32 samples and the file's sample rate (16-bit PCM only)."""
+    handle = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else str(source)
+    with wave.open(handle, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"unsupported sample width {wf.getsampwidth() * 8} bit, expected 16")
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    audio = pcm16_to_float32(frames)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1).astype(np.float32)
+    return audio, sample_rate
+
+
+def write_wav(path: str | Path, pcm: np.ndarray, sample_rate: int) -> None:
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)  # int16
+        wf.setframerate(sample_rate)
+        wf.writeframes(np.asarray(pcm, dtype=np.int16).tobytes())
+
+
+def capture_microphone(timeout_seconds: float, sample_rate: int) -> np.ndarray:
+    import sounddevice as sd
+
+    frames = int(timeout_seconds * sample_rate)
+    audio = sd.rec(
+        frames,
+        samplerate=sample_rate,
+        channels=1,
+        dtype="int16",
+        blocking=True,
+    )
+    return np.asarray(audio).reshape(-1)
+
+
+def load_model(
+    model: str,
+    device: str,
+    compute_type: str,
+    cpu_threads: int = 0,
+    num_workers: int = 1,
+) -> Any:
+    """`num_workers` > 1 lets that many threads call `transcribe` concurrently."""
+    from faster_whisper import WhisperModel
+
+    return WhisperModel(
+        model,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers,
+    )
+
+
+def transcribe(
+    model: Any,
+    audio: np.ndarray,
+    sample_rate: int = WHISPER_SAMPLE_RATE,
+    duration: float | None = None,
+) -> dict[str, Any]:
+    """Transcribe float32 mono samples; returns the JSON contract as a dict."""
+    audio = resample(np.asarray(audio, dtype=np.float32).reshape(-1), sample_rate)
+    if duration is None:
+        duration = round(audio.size / float(WHISPER_SAMPLE_RATE), 2)
+    try:
+        segments, info = model.transcribe(
+            audio,
+            beam_size=1,
+            vad_filter=True,
+            language=None,
+        )
+        text = " ".join(seg.text.strip() for seg in segments if seg.text).strip()
+    except Exception as exc:
+        return error_result(f"transcription failed: {exc}")
+    lang = (getattr(info, "language", "") or "").lower().strip() or "en"
+    if not text:
+        return error_result("no speech recognized")
+    return {"ok": True, "text": text, "lang": lang, "duration": duration}
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from typing import Callable
+
+DEFAULT_SOURCE_RATE_LIMITS: dict[str, tuple[float, float]] = {
+    "voice": (1.0, 5.0),
+    "manual": (1.0, 5.0),
+    "node_red": (1.0, 5.0),
+    "api": (0.5, 10.0),
+}
+DEFAULT_SOURCE_PRIORITIES: dict[str, int] = {
+    "voice": 0,
+    "manual": 1,
+    "node_red": 1,
+    "api": 2,
+}
+# Control-plane items (mode changes) always sort ahead of commands.
+CONTROL_PRIORITY = -1
+
+
+def parse_source_rate_limits(raw_json: str) -> dict[str, tuple[float, float]]:
+    limits = dict(DEFAULT_SOURCE_RATE_LIMITS)
+    if not raw_json.strip():
+        return limits
+    try:
+        parsed = json.loads(raw_json)
+    except json.JSONDecodeError:
+        return limits
+    if not isinstance(parsed, dict):
+        return limits
+    for source_raw, spec in parsed.items():
+        source = str(source_raw).strip().lower()
+        if not source or not isinstance(spec, dict):
+            continue
+        try:
+            rate = float(spec.get("rate", 0))
+            burst = float(spec.get("burst", 0))
+        except (TypeError, ValueError):
+            continue
+        if rate <= 0 or burst < 1:
+            continue
+        limits[source] = (rate, burst)
+    return limits
+
+
+def parse_source_priorities(raw_json: str) -> dict[str, int]:
+    priorities = dict(DEFAULT_SOURCE_PRIORITIES)
+    if not raw_json.strip():
+        return priorities
+    try:
+        parsed = json.loads(raw_json)
+    except json.JSONDecodeError:
+        return priorities
+    if not isinstance(parsed, dict):
+        return priorities
+    for source_raw, value in parsed.items():
+        source = str(source_raw).strip().lower()
+        try:
+            priority = int(value)
+        except (TypeError, ValueError):
+            continue
+        if source and priority >= 0:
+            priorities[source] = priority
+    return priorities
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_take(self, amount: float = 1.0) -> bool:
+        with self._lock:
+            now = self._clock()
+            elapsed = max(0.0, now - self._updated)
+            self._updated = now
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate_per_second)
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+
+class AdmissionController:
+    """Decides at enqueue time whether a command may enter the action queue.
+
+    Each source has its own token bucket. Lower-priority sources (higher number)
+    are also shed early as the queue fills: every priority level gives up
+    `headroom_per_priority` of the queue so voice keeps room when bulk API
+    traffic backs up.
+    """
+
+    def __init__(
+        self,
+        rate_limits: dict[str, tuple[float, float]],
+        priorities: dict[str, int],
+        headroom_per_priority: float = 0.25,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.priorities = dict(priorities)
+        self.headroom_per_priority = max(0.0, min(1.0, headroom_per_priority))
+        self.buckets = {
+            source: TokenBucket(rate, burst, clock=clock)
+            for source, (rate, burst) in rate_limits.items()
+        }
+
+    def priority_for(self, source: str) -> int:
+        return self.priorities.get(source, max(self.priorities.values(), default=0))
+
+    def admit(self, source: str, queue_depth: int, queue_max: int) -> tuple[bool, str]:
+        priority = self.priority_for(source)
+        if queue_max > 0:
+            allowed_fraction = max(0.0, 1.0 - priority * self.headroom_per_priority)
+            allowed_depth = int(queue_max * allowed_fraction)
+            if queue_depth >= allowed_depth:
+                return False, (
+                    f"overloaded: action queue at {queue_depth}/{queue_max}, "
+                    f"source '{source}' (priority {priority}) limited to {allowed_depth}"
+                )
+        bucket = self.buckets.get(source)
+        if bucket is not None and not bucket.try_take():
+            return False, (
+                f"overloaded: source '{source}' exceeded {bucket.rate_per_second:g} cmd/s "
+                f"(burst {bucket.burst:g})"
+            )
+        return True, "admitted"
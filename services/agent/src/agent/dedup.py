@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+DedupKey = tuple[str, str, str]
+
+
+class DedupEntry:
+    __slots__ = ("key", "expires_at", "result", "waiters")
+
+    def __init__(self, key: DedupKey, expires_at: float) -> None:
+        self.key = key
+        self.expires_at = expires_at
+        self.result: dict[str, Any] | None = None
+        self.waiters = 0
+
+
+class CommandDeduplicator:
+    """Short-window idempotency cache for repeated commands.
+
+    Commands are keyed on source + normalized command text, or on source + the
+    client-supplied `request_id` when present. A duplicate that arrives while the
+    original is still queued waits for its result; one that arrives after it
+    finished gets the cached result straight away.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        request_id_window_seconds: float,
+        max_entries: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.request_id_window_seconds = request_id_window_seconds
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._entries: OrderedDict[DedupKey, DedupEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        command_text: str,
+        source: str,
+        request_id: str = "",
+        confirm: bool = False,
+    ) -> DedupKey:
+        if request_id:
+            return "request_id", source, request_id
+        normalized = " ".join(command_text.lower().split())
+        # A confirmed resend must not be answered with the unconfirmed result.
+        if normalized and confirm:
+            normalized = f"confirm {normalized}"
+        return "command", source, normalized
+
+    def _window_for(self, key: DedupKey) -> float:
+        return self.request_id_window_seconds if key[0] == "request_id" else self.window_seconds
+
+    def check(self, key: DedupKey) -> tuple[DedupEntry | None, dict[str, Any] | None]:
+        """Return `(entry, None)` for a new command, `(None, result)` for a cached
+        duplicate, or `(None, None)` for a duplicate that waits on the original."""
+        window = self._window_for(key)
+        if window <= 0 or not key[2]:
+            return DedupEntry(key, 0.0), None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                if entry.result is None:
+                    entry.waiters += 1
+                    return None, None
+                return None, entry.result
+            entry = DedupEntry(key, now + window)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry, None
+
+    def complete(self, entry: DedupEntry, result: dict[str, Any]) -> int:
+        """Store the result and return how many duplicates were waiting on it."""
+        with self._lock:
+            entry.result = result
+            waiters = entry.waiters
+            entry.waiters = 0
+            return waiters
+
+    def abort(self, entry: DedupEntry) -> None:
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+
+
+def replayed_result(result: dict[str, Any]) -> dict[str, Any]:
+    replay = dict(result)
+    replay["duplicate"] = True
+    replay["original_time"] = result.get("time")
+    replay["time"] = time.time()
+    return replay
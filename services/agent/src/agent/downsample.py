@@ -0,0 +1,138 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from influxdb_client import Point, WritePrecision
+
+QuerySql = Callable[[str], list[dict[str, Any]]]
+
+HOUR_SECONDS = 3600
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def hourly_query(hour_start: int, measurement: str = "mqtt_event") -> str:
+    """Per-topic aggregates for one hour; numeric stats only cover payloads that parse as numbers."""
+    return (
+        "SELECT topic, "
+        "COUNT(*) AS event_count, "
+        "last_value(payload ORDER BY time) AS last_payload, "
+        "MAX(time) AS last_time, "
+        "COUNT(TRY_CAST(payload AS DOUBLE)) AS numeric_count, "
+        "MIN(TRY_CAST(payload AS DOUBLE)) AS value_min, "
+        "MAX(TRY_CAST(payload AS DOUBLE)) AS value_max, "
+        "AVG(TRY_CAST(payload AS DOUBLE)) AS value_mean "
+        f"FROM {measurement} "
+        f"WHERE time >= '{_iso(hour_start)}' AND time < '{_iso(hour_start + HOUR_SECONDS)}' "
+        "GROUP BY topic"
+    )
+
+
+def hourly_points(
+    rows: list[dict[str, Any]],
+    hour_start: int,
+    measurement: str = "mqtt_event_hourly",
+) -> list[Point]:
+    points: list[Point] = []
+    for row in rows:
+        topic = str(row.get("topic", "")).strip()
+        if not topic:
+            continue
+        point = (
+            Point(measurement)
+            .tag("topic", topic)
+            .field("count", int(row.get("event_count") or 0))
+            .field("last_payload", str(row.get("last_payload") or "")[:5000])
+            .field("last_time", str(row.get("last_time") or ""))
+            .time(hour_start * 1_000_000_000, WritePrecision.NS)
+        )
+        numeric_count = int(row.get("numeric_count") or 0)
+        if numeric_count:
+            point = (
+                point.field("numeric_count", numeric_count)
+                .field("min", float(row["value_min"]))
+                .field("max", float(row["value_max"]))
+                .field("mean", float(row["value_mean"]))
+            )
+        points.append(point)
+    return points
+
+
+class EventDownsampler:
+    """Compacts raw mqtt_event history into hourly per-topic aggregates.
+
+    Each run handles the completed hours that are at least `after_hours` old and
+    have not been compacted yet, oldest first and at most `max_hours_per_run`, and
+    records the last finished hour in `state_path` so restarts resume where they
+    stopped. On the first run it starts `backfill_hours` back.
+
+    Deleting raw rows is left to the raw database's retention period, because
+    InfluxDB 3 Core has no row-level delete.
+    """
+
+    def __init__(
+        self,
+        query_sql: QuerySql,
+        write_api: Any,
+        bucket: str,
+        state_path: str = "",
+        after_hours: int = 1,
+        backfill_hours: int = 168,
+        max_hours_per_run: int = 24,
+    ) -> None:
+        self.query_sql = query_sql
+        self.write_api = write_api
+        self.bucket = bucket
+        self.state_path = state_path
+        self.after_hours = max(1, after_hours)
+        self.backfill_hours = max(0, backfill_hours)
+        self.max_hours_per_run = max(1, max_hours_per_run)
+        self.last_hour = self._load_state()
+
+    def _load_state(self) -> int | None:
+        if not self.state_path:
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as handle:
+                return int(json.load(handle)["last_hour"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save_state(self) -> None:
+        if not self.state_path or self.last_hour is None:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump({"last_hour": self.last_hour, "last_hour_utc": _iso(self.last_hour)}, handle)
+        os.replace(tmp_path, self.state_path)
+
+    def pending_hours(self, now: float) -> list[int]:
+        newest = int(now // HOUR_SECONDS) * HOUR_SECONDS - self.after_hours * HOUR_SECONDS
+        if self.last_hour is None:
+            first = newest - self.backfill_hours * HOUR_SECONDS
+        else:
+            first = self.last_hour + HOUR_SECONDS
+        hours = list(range(first, newest + 1, HOUR_SECONDS))
+        return hours[: self.max_hours_per_run]
+
+    def run_once(self, now: float) -> dict[str, Any]:
+        hours = 0
+        points_written = 0
+        for hour_start in self.pending_hours(now):
+            rows = self.query_sql(hourly_query(hour_start))
+            points = hourly_points(rows, hour_start)
+            if points:
+                self.write_api.write(bucket=self.bucket, record=points)
+            self.last_hour = hour_start
+            self._save_state()
+            hours += 1
+            points_written += len(points)
+        return {
+            "hours": hours,
+            "points": points_written,
+            "last_hour": _iso(self.last_hour) if self.last_hour is not None else "",
+        }
@@ -0,0 +1,141 @@
+import base64
+import json
+import threading
+import zlib
+from typing import Any
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+CAPABILITIES_ENCODING = "zlib+base64"
+COMPACT_DETAIL_CHARS = 200
+
+
+class TopicAliasRegistry:
+    """Assigns MQTT v5 topic aliases for frequently published topics.
+
+    Aliases live for one connection, so `reset` must be called from on_connect with
+    the broker's TopicAliasMaximum. Callers must serialize `resolve` together with
+    the publish it guards: the first publish carries the full topic and registers
+    the alias, later ones send an empty topic.
+    """
+
+    def __init__(self) -> None:
+        self.maximum = 0
+        self._aliases: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def reset(self, maximum: int) -> None:
+        with self._lock:
+            self.maximum = max(0, int(maximum))
+            self._aliases = {}
+
+    def resolve(self, topic: str) -> tuple[str, Properties | None]:
+        with self._lock:
+            alias = self._aliases.get(topic)
+            if alias is None:
+                if len(self._aliases) >= self.maximum:
+                    return topic, None
+                alias = len(self._aliases) + 1
+                self._aliases[topic] = alias
+                publish_topic = topic
+            else:
+                publish_topic = ""
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.TopicAlias = alias
+        return publish_topic, properties
+
+
+def topic_alias_maximum(properties: Any) -> int:
+    if properties is None:
+        return 0
+    try:
+        return int(getattr(properties, "TopicAliasMaximum", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def encode_result_payload(result: dict[str, Any], compress_min_bytes: int) -> str:
+    capabilities = result.get("capabilities")
+    if compress_min_bytes > 0 and isinstance(capabilities, list) and capabilities:
+        raw = json.dumps(capabilities, ensure_ascii=True, separators=(",", ":")).encode("ascii")
+        if len(raw) >= compress_min_bytes:
+            result = dict(result)
+            del result["capabilities"]
+            result["capabilities_count"] = len(capabilities)
+            result["capabilities_encoding"] = CAPABILITIES_ENCODING
+            result["capabilities_z"] = base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+    return json.dumps(result, ensure_ascii=True)
+
+
+def decode_result_capabilities(result: dict[str, Any]) -> list[dict[str, Any]]:
+    if result.get("capabilities_encoding") == CAPABILITIES_ENCODING:
+        raw = zlib.decompress(base64.b64decode(str(result.get("capabilities_z", ""))))
+        parsed = json.loads(raw.decode("ascii"))
+        return parsed if isinstance(parsed, list) else []
+    capabilities = result.get("capabilities")
+    return capabilities if isinstance(capabilities, list) else []
+
+
+def entity_state_topic(prefix: str, entity_id: str) -> str:
+    return f"{prefix.rstrip('/')}/{entity_id}/last_action"
+
+
+def compact_entity_results(result: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """Per-entity last-action records derived from one action result."""
+    base = {
+        "source": result.get("source", "manual"),
+        "mode": result.get("mode", ""),
+        "time": result.get("time"),
+    }
+    if result.get("request_id"):
+        base["request_id"] = result["request_id"]
+
+    compact: dict[str, dict[str, Any]] = {}
+    steps = result.get("steps") or []
+    for step in steps:
+        entity_id = str(step.get("entity_id", ""))
+        if "." not in entity_id:
+            continue
+        record = dict(base)
+        record.update(
+            {
+                "status": step.get("status", ""),
+                "action": step.get("action", ""),
+                "detail": str(step.get("detail", ""))[:COMPACT_DETAIL_CHARS],
+            }
+        )
+        compact[entity_id] = record
+    if not steps:
+        entity_id = str(result.get("entity_id", ""))
+        if "." in entity_id:
+            record = dict(base)
+            record.update(
+                {
+                    "status": result.get("status", ""),
+                    "action": result.get("action", ""),
+                    "detail": str(result.get("detail", ""))[:COMPACT_DETAIL_CHARS],
+                }
+            )
+            compact[entity_id] = record
+    return compact
+
+
+def summarize_result(result: dict[str, Any]) -> dict[str, Any]:
+    steps = result.get("steps") or []
+    summary = {
+        "status": result.get("status", ""),
+        "action": result.get("action", ""),
+        "entity_id": result.get("entity_id", ""),
+        "source": result.get("source", ""),
+        "mode": result.get("mode", ""),
+        "time": result.get("time"),
+        "steps": len(steps),
+        "executed": sum(1 for step in steps if step.get("status") == "executed"),
+        "capabilities": len(result.get("capabilities") or []),
+    }
+    if result.get("request_id"):
+        summary["request_id"] = result["request_id"]
+    if result.get("duplicate"):
+        summary["duplicate"] = True
+    return summary
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Any
+
+from agent.main import capabilities_for_domain
+
+
+def capability_row(target: str, entity_id: str, allowed: bool) -> dict[str, Any]:
+    domain = entity_id.split(".", 1)[0]
+    return {
+        "target": target,
+        "entity_id": entity_id,
+        "domain": domain,
+        "allowed": allowed,
+        "supported_actions": capabilities_for_domain(domain),
+    }
+
+
+class CapabilityInventory:
+    """Materialized capability rows for every controllable target.
+
+    Rows are rebuilt from scratch only on `rebuild`; approvals are applied with
+    `add_alias`, which bumps `version`. The full listing is materialized once per
+    version, so inventory queries return a cached list instead of walking the
+    alias maps. Returned rows and maps are shared and must not be mutated.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.version = 0
+        self._plug_rows: list[dict[str, Any]] = []
+        self._alias_rows: dict[str, dict[str, Any]] = {}
+        self._plug_entities: set[str] = set()
+        self._alias_map: dict[str, str] = {}
+        self._by_entity: dict[str, dict[str, Any]] = {}
+        self._rows: list[dict[str, Any]] | None = None
+        self.updated_at = 0.0
+
+    def rebuild(
+        self,
+        outlet_entity_map: dict[int, str],
+        alias_map: dict[str, str],
+        allowed_entity_ids: set[str],
+    ) -> None:
+        plug_rows: list[dict[str, Any]] = []
+        plug_entities: set[str] = set()
+        by_entity: dict[str, dict[str, Any]] = {}
+        for outlet, entity_id in sorted(outlet_entity_map.items()):
+            if not entity_id:
+                continue
+            row = capability_row(f"plug {outlet}", entity_id, entity_id in allowed_entity_ids)
+            plug_rows.append(row)
+            plug_entities.add(entity_id)
+            by_entity.setdefault(entity_id, row)
+        alias_rows: dict[str, dict[str, Any]] = {}
+        for alias, entity_id in alias_map.items():
+            row = capability_row(alias, entity_id, entity_id in allowed_entity_ids)
+            by_entity.setdefault(entity_id, row)
+            if entity_id not in plug_entities:
+                alias_rows[alias] = row
+        with self._lock:
+            self._plug_rows = plug_rows
+            self._plug_entities = plug_entities
+            self._alias_rows = alias_rows
+            self._alias_map = dict(alias_map)
+            self._by_entity = by_entity
+            self._rows = None
+            self.version += 1
+            self.updated_at = time.time()
+
+    def add_alias(self, alias: str, entity_id: str) -> int:
+        """Apply an approved alias without rebuilding; returns the new version."""
+        with self._lock:
+            alias_map = dict(self._alias_map)
+            alias_map[alias] = entity_id
+            self._alias_map = alias_map
+            row = capability_row(alias, entity_id, True)
+            self._by_entity.setdefault(entity_id, row)
+            if entity_id not in self._plug_entities:
+                self._alias_rows[alias] = row
+            self._rows = None
+            self.version += 1
+            self.updated_at = time.time()
+            return self.version
+
+    def alias_map(self) -> dict[str, str]:
+        with self._lock:
+            return self._alias_map
+
+    def rows(self) -> list[dict[str, Any]]:
+        with self._lock:
+            if self._rows is None:
+                self._rows = self._plug_rows + [
+                    self._alias_rows[alias] for alias in sorted(self._alias_rows)
+                ]
+            return self._rows
+
+    def row_for(self, target: str, entity_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._by_entity.get(entity_id)
+        if row is None:
+            return None
+        if row["target"] == target:
+            return row
+        return {**row, "target": target}
+
+    def document(self) -> dict[str, Any]:
+        rows = self.rows()
+        return {
+            "version": self.version,
+            "count": len(rows),
+            "capabilities": rows,
+            "time": self.updated_at,
+        }
@@ -1,14 +1,12 @@
 import json
 import os
-import queue
 import re
-import threading
 import time
 from typing import Any
 
 import paho.mqtt.client as mqtt
 import requests
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS
 
 TOPIC = "home/#"
@@ -87,6 +85,22 @@ def parse_command_payload(raw_payload: str) -> tuple[str, str, bool, str]:
     return payload, source, confirm, detail
 
 
+def parse_command_request_id(raw_payload: str) -> str:
+    payload = raw_payload.strip()
+    if not (payload.startswith("{") and payload.endswith("}")):
+        return ""
+    try:
+        parsed = json.loads(payload)
+    except json.JSONDecodeError:
+        return ""
+    if not isinstance(parsed, dict):
+        return ""
+    request_id = parsed.get("request_id")
+    if request_id is None:
+        return ""
+    return str(request_id).strip()[:128]
+
+
 def _normalize_spaces(text: str) -> str:
     return " ".join(text.lower().split())
 
@@ -938,776 +952,71 @@ def ollama_suggest(ollama_url: str, model: str, timeout: int, text: str) -> str:
         return f"(ollama error: {exc})"
 
 
-def main() -> None:
-    mqtt_host = os.getenv("MQTT_HOST", "mosquitto")
-    mqtt_port = int(os.getenv("MQTT_PORT", "1883"))
-    mqtt_user = os.getenv("MQTT_USER", "")
-    mqtt_password = os.getenv("MQTT_PASSWORD", "")
-    mqtt_keepalive = int(os.getenv("MQTT_KEEPALIVE", "120"))
-
-    ollama_url = os.getenv("OLLAMA_URL", "http://ollama:11434")
-    ollama_default_model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-    action_parse_ollama_model = os.getenv(
-        "ACTION_PARSE_OLLAMA_MODEL",
-        ollama_default_model,
-    )
-    suggestion_ollama_model = os.getenv(
-        "SUGGESTION_OLLAMA_MODEL",
-        ollama_default_model,
-    )
-    influx_url = os.getenv("INFLUX_URL", "http://influxdb:8181")
-    influx_token = os.getenv("INFLUX_TOKEN", "")
-    influx_org = os.getenv("INFLUX_ORG", "homelab")
-    influx_bucket = os.getenv("INFLUX_BUCKET", "home")
-
-    suggestion_queue_max = int(os.getenv("SUGGESTION_QUEUE_MAX", "1000"))
-    suggestion_http_timeout = int(os.getenv("SUGGESTION_HTTP_TIMEOUT", "120"))
-
-    action_bridge_enabled = os.getenv("ACTION_BRIDGE_ENABLED", "false").lower() == "true"
-    action_parse_with_ollama = os.getenv("ACTION_PARSE_WITH_OLLAMA", "true").lower() == "true"
-    action_command_topic = os.getenv("ACTION_COMMAND_TOPIC", "home/ai/command")
-    action_result_topic = os.getenv("ACTION_RESULT_TOPIC", "home/ai/action_result")
-    action_device_suggestion_topic = os.getenv(
-        "ACTION_DEVICE_SUGGESTION_TOPIC",
-        "home/ai/device_suggestion",
-    )
-    action_mode_topic = os.getenv("ACTION_MODE_TOPIC", "home/ai/mode")
-    action_mode_set_topic = os.getenv("ACTION_MODE_SET_TOPIC", "home/ai/mode/set")
-    action_mode_default = os.getenv("ACTION_MODE_DEFAULT", "auto").lower()
-    action_queue_max = int(os.getenv("ACTION_QUEUE_MAX", "100"))
-    action_device_discovery_enabled = (
-        os.getenv("ACTION_DEVICE_DISCOVERY_ENABLED", "true").lower() == "true"
-    )
-    action_device_discovery_cooldown_seconds = float(
-        os.getenv("ACTION_DEVICE_DISCOVERY_COOLDOWN_SECONDS", "600")
-    )
-    action_device_discovery_ignore_regex = os.getenv(
-        "ACTION_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX",
-        DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX,
-    )
-    action_dynamic_alias_store_path = os.getenv(
-        "ACTION_DYNAMIC_ALIAS_STORE_PATH",
-        "/app/runtime/dynamic_aliases.json",
-    )
-    action_http_timeout = int(os.getenv("ACTION_HTTP_TIMEOUT", "20"))
-    action_parse_timeout = int(
-        os.getenv("ACTION_PARSE_TIMEOUT", str(suggestion_http_timeout))
+def ollama_embed(ollama_url: str, model: str, timeout: int, texts: list[str]) -> list[list[float]]:
+    response = requests.post(
+        f"{ollama_url}/api/embed",
+        json={"model": model, "input": texts},
+        timeout=timeout,
     )
-    action_rate_limit_seconds = float(os.getenv("ACTION_RATE_LIMIT_SECONDS", "2"))
-    action_flip_cooldown_seconds = float(os.getenv("ACTION_FLIP_COOLDOWN_SECONDS", "3"))
-
-    ha_url = os.getenv("HA_URL", "http://homeassistant:8123")
-    ha_token = os.getenv("HA_TOKEN", "")
-    outlet_entity_map = {
-        1: os.getenv("ACTION_ENTITY_PLUG_1", "switch.p304m_tapo_p304m_1"),
-        2: os.getenv("ACTION_ENTITY_PLUG_2", "switch.p304m_tapo_p304m_2"),
-        3: os.getenv("ACTION_ENTITY_PLUG_3", "switch.p304m_tapo_p304m_3"),
-        4: os.getenv("ACTION_ENTITY_PLUG_4", "switch.p304m_tapo_p304m_4"),
-    }
-    extra_entity_alias_map = parse_extra_entity_alias_map(
-        os.getenv("ACTION_EXTRA_ENTITY_MAP_JSON", "")
+    response.raise_for_status()
+    embeddings = response.json().get("embeddings")
+    if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+        raise ValueError("ollama embed response did not match input length")
+    return embeddings
+
+
+def influx_query_sql(
+    influx_url: str,
+    influx_token: str,
+    database: str,
+    query: str,
+    timeout: int = 60,
+) -> list[dict[str, Any]]:
+    response = requests.post(
+        f"{influx_url.rstrip('/')}/api/v3/query_sql",
+        headers={"Authorization": f"Bearer {influx_token}"},
+        json={"db": database, "q": query, "format": "json"},
+        timeout=timeout,
     )
-    dynamic_entity_alias_map = load_dynamic_entity_alias_map(action_dynamic_alias_store_path)
-    allowed_entity_ids = {v for v in outlet_entity_map.values() if v}
-    allowed_entity_ids.update(extra_entity_alias_map.values())
-    allowed_entity_ids.update(dynamic_entity_alias_map.values())
-    state_lock = threading.Lock()
-    pending_device_suggestions: dict[str, dict[str, Any]] = {}
-    discovery_last_published_at: dict[str, float] = {}
-    try:
-        discovery_ignore_pattern = re.compile(action_device_discovery_ignore_regex)
-    except re.error:
-        discovery_ignore_pattern = re.compile(DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX)
+    response.raise_for_status()
+    rows = response.json()
+    return [row for row in rows if isinstance(row, dict)] if isinstance(rows, list) else []
 
-    if not influx_token:
-        raise RuntimeError("INFLUX_TOKEN is required for authenticated InfluxDB access.")
 
-    current_mode = action_mode_default if action_mode_default in VALID_ACTION_MODES else "auto"
+def main() -> None:
+    # Imported here because the pipeline module builds on the parsers above.
+    from agent.pipeline import AgentConfig, AgentPipeline
 
-    influx = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org)
+    config = AgentConfig.from_env()
+    if not config.influx_token:
+        raise RuntimeError("INFLUX_TOKEN is required for authenticated InfluxDB access.")
+
+    influx = InfluxDBClient(url=config.influx_url, token=config.influx_token, org=config.influx_org)
     write_api = influx.write_api(write_options=SYNCHRONOUS)
-    suggestion_queue: queue.Queue[tuple[str, str]] = queue.Queue(maxsize=suggestion_queue_max)
-    action_queue: queue.Queue[tuple[str, str, str, float]] = queue.Queue(maxsize=action_queue_max)
 
-    if action_bridge_enabled and not ha_token:
+    if config.action_bridge_enabled and not config.ha_token:
         print(
             "ACTION_BRIDGE_ENABLED=true but HA_TOKEN is empty; action bridge will reject commands",
             flush=True,
         )
     print(
         "Ollama models:",
-        f"parse={action_parse_ollama_model}, suggestion={suggestion_ollama_model}",
+        f"parse={config.action_parse_ollama_model}, suggestion={config.suggestion_ollama_model}",
         flush=True,
     )
 
-    def write_action_audit(
-        *,
-        status: str,
-        action: str,
-        command: str,
-        detail: str,
-        source: str,
-        entity_id: str,
-        mode: str,
-    ) -> None:
-        try:
-            action_point = (
-                Point("agent_action")
-                .tag("status", status)
-                .tag("action", action or "none")
-                .tag("entity_id", entity_id or "none")
-                .tag("source", source or "manual")
-                .tag("mode", mode)
-                .field("command", command[:5000])
-                .field("detail", detail[:5000])
-                .time(time.time_ns(), WritePrecision.NS)
-            )
-            write_api.write(bucket=influx_bucket, record=action_point)
-        except Exception as exc:
-            print("influx write agent_action failed:", exc, flush=True)
-
-    def get_current_alias_map() -> dict[str, str]:
-        with state_lock:
-            return merge_entity_alias_maps(extra_entity_alias_map, dynamic_entity_alias_map)
-
-    def publish_action_result_payload(payload: dict[str, Any]) -> None:
-        try:
-            publish_result = client.publish(
-                action_result_topic,
-                json.dumps(payload, ensure_ascii=True),
-                qos=0,
-                retain=False,
-            )
-            if publish_result.rc != mqtt.MQTT_ERR_SUCCESS:
-                print("failed to publish action result rc=", publish_result.rc, flush=True)
-        except Exception as exc:
-            print("action result publish failed:", exc, flush=True)
-
-    def publish_device_suggestion(
-        *,
-        entity_id: str,
-        domain: str,
-        topic: str,
-        payload: str,
-        suggested_alias: str,
-    ) -> None:
-        suggestion = {
-            "status": "suggested",
-            "event": "device_suggestion",
-            "command": f"discover {entity_id}",
-            "action": "suggest_device",
-            "entity_id": entity_id,
-            "domain": domain,
-            "topic": topic,
-            "state": payload[:500],
-            "suggested_alias": suggested_alias,
-            "approve_example": f"approve device {entity_id} as {suggested_alias}",
-            "reject_example": f"reject device {entity_id}",
-            "source": "agent",
-            "mode": current_mode,
-            "detail": (
-                "new controllable device discovered; "
-                f"approve with: approve device {entity_id} as {suggested_alias}"
-            ),
-            "time": time.time(),
-        }
-        try:
-            suggestion_result = client.publish(
-                action_device_suggestion_topic,
-                json.dumps(suggestion, ensure_ascii=True),
-                qos=0,
-                retain=False,
-            )
-            if suggestion_result.rc != mqtt.MQTT_ERR_SUCCESS:
-                print("failed to publish device suggestion rc=", suggestion_result.rc, flush=True)
-        except Exception as exc:
-            print("device suggestion publish failed:", exc, flush=True)
-        publish_action_result_payload(suggestion)
-
-        write_action_audit(
-            status="suggested",
-            action="suggest_device",
-            command=f"discover {entity_id}",
-            detail=f"suggested_alias={suggested_alias}; topic={topic}",
-            source="agent",
-            entity_id=entity_id,
-            mode=current_mode,
-        )
-
-    def publish_mode(client: mqtt.Client, mode: str, source: str, detail: str) -> None:
-        payload = json.dumps(
-            {
-                "mode": mode,
-                "source": source,
-                "detail": detail,
-                "time": time.time(),
-            },
-            ensure_ascii=True,
-        )
-        result = client.publish(action_mode_topic, payload, qos=0, retain=True)
-        if result.rc != mqtt.MQTT_ERR_SUCCESS:
-            print("failed to publish mode rc=", result.rc, flush=True)
-
-    def on_connect(client, userdata, flags, rc, properties=None):
-        print("MQTT connected rc=", rc, flush=True)
-        subscribe_result, _ = client.subscribe(TOPIC)
-        print("MQTT subscribe rc=", subscribe_result, "topic=", TOPIC, flush=True)
-        if action_bridge_enabled:
-            publish_mode(
-                client=client,
-                mode=current_mode,
-                source="agent_boot",
-                detail="published current mode on connect",
-            )
-
-    def on_disconnect(client, userdata, disconnect_flags, reason_code, properties=None):
-        print("MQTT disconnected reason=", reason_code, flush=True)
-
-    def on_message(client, userdata, msg):
-        try:
-            payload = msg.payload.decode("utf-8", errors="replace")
-        except Exception:
-            payload = str(msg.payload)
-
-        try:
-            point = (
-                Point("mqtt_event")
-                .tag("topic", msg.topic)
-                .field("payload", payload[:5000])
-                .time(time.time_ns(), WritePrecision.NS)
-            )
-            write_api.write(bucket=influx_bucket, record=point)
-        except Exception as exc:
-            print("influx write mqtt_event failed:", exc, flush=True)
-
-        if action_bridge_enabled and msg.topic == action_command_topic:
-            try:
-                action_queue.put_nowait(("command", payload, "mqtt", time.time()))
-            except queue.Full:
-                print("action queue full; dropping command payload", flush=True)
-
-        if action_bridge_enabled and msg.topic == action_mode_set_topic:
-            try:
-                action_queue.put_nowait(("mode_set", payload, "mqtt", time.time()))
-            except queue.Full:
-                print("action queue full; dropping mode payload", flush=True)
-
-        if is_actionable_topic(msg.topic):
-            try:
-                suggestion_queue.put_nowait((msg.topic, payload))
-            except queue.Full:
-                print("suggestion queue full; dropping topic=", msg.topic, flush=True)
-
-        if action_bridge_enabled and action_device_discovery_enabled:
-            discovered = parse_discoverable_entity_from_topic(msg.topic)
-            if discovered is not None:
-                domain, object_id = discovered
-                if discovery_ignore_pattern.search(object_id) is not None:
-                    return
-                entity_id = f"{domain}.{object_id}"
-                now = time.time()
-                suggestion_alias = ""
-                should_publish = False
-                with state_lock:
-                    alias_map = merge_entity_alias_maps(
-                        extra_entity_alias_map,
-                        dynamic_entity_alias_map,
-                    )
-                    if entity_id in allowed_entity_ids:
-                        should_publish = False
-                    elif entity_id in pending_device_suggestions:
-                        pending_device_suggestions[entity_id]["last_seen"] = now
-                        should_publish = False
-                    else:
-                        last_published = discovery_last_published_at.get(entity_id, 0.0)
-                        if (now - last_published) >= action_device_discovery_cooldown_seconds:
-                            suggestion_alias = suggest_alias_from_entity_id(entity_id)
-                            if (
-                                suggestion_alias in alias_map
-                                and alias_map[suggestion_alias] != entity_id
-                            ):
-                                suggestion_alias = f"{suggestion_alias} {domain}"
-                            pending_device_suggestions[entity_id] = {
-                                "entity_id": entity_id,
-                                "domain": domain,
-                                "topic": msg.topic,
-                                "suggested_alias": suggestion_alias,
-                                "first_seen": now,
-                                "last_seen": now,
-                            }
-                            discovery_last_published_at[entity_id] = now
-                            should_publish = True
-                if should_publish:
-                    publish_device_suggestion(
-                        entity_id=entity_id,
-                        domain=domain,
-                        topic=msg.topic,
-                        payload=payload,
-                        suggested_alias=suggestion_alias,
-                    )
-
-    def suggestion_worker() -> None:
-        while True:
-            topic, payload = suggestion_queue.get()
-            try:
-                suggestion = ollama_suggest(
-                    ollama_url=ollama_url,
-                    model=suggestion_ollama_model,
-                    timeout=suggestion_http_timeout,
-                    text=f"topic={topic} payload={payload}",
-                )
-                suggestion_point = (
-                    Point("agent_suggestion")
-                    .tag("topic", topic)
-                    .field("suggestion", suggestion[:5000])
-                    .time(time.time_ns(), WritePrecision.NS)
-                )
-                write_api.write(bucket=influx_bucket, record=suggestion_point)
-            except Exception as exc:
-                print("influx write agent_suggestion failed:", exc, flush=True)
-            finally:
-                suggestion_queue.task_done()
-
-    def action_worker() -> None:
-        nonlocal current_mode
-
-        last_command_ts = 0.0
-        last_entity_action: dict[str, tuple[str, float]] = {}
-
-        while True:
-            item_type, raw_payload, inbound_source, received_ts = action_queue.get()
-
-            if item_type == "mode_set":
-                requested = raw_payload.strip().lower()
-                if requested not in VALID_ACTION_MODES:
-                    detail = f"invalid mode '{requested}', expected suggest|ask|auto"
-                    write_action_audit(
-                        status="rejected",
-                        action="set_mode",
-                        command=raw_payload,
-                        detail=detail,
-                        source=inbound_source,
-                        entity_id="none",
-                        mode=current_mode,
-                    )
-                else:
-                    current_mode = requested
-                    detail = f"mode set to {current_mode}"
-                    publish_mode(client=client, mode=current_mode, source=inbound_source, detail=detail)
-                    write_action_audit(
-                        status="mode_change",
-                        action="set_mode",
-                        command=raw_payload,
-                        detail=detail,
-                        source=inbound_source,
-                        entity_id="none",
-                        mode=current_mode,
-                    )
-                action_queue.task_done()
-                continue
-
-            command_text = ""
-            source = "manual"
-            confirm = False
-            payload_detail = ""
-            status = "rejected"
-            detail = ""
-            action = ""
-            outlet = 0
-            entity_id = ""
-            planned_steps: list[dict[str, Any]] = []
-            executed_steps: list[dict[str, Any]] = []
-            capability_rows: list[dict[str, Any]] = []
-
-            try:
-                command_text, source, confirm, payload_detail = parse_command_payload(raw_payload)
-                now = received_ts
-                device_action, device_entity_id, device_alias, device_detail = (
-                    parse_device_management_payload(raw_payload)
-                )
-                if device_action is None:
-                    device_action, device_entity_id, device_alias, device_detail = (
-                        parse_device_management_command(command_text)
-                    )
-
-                if device_action is not None:
-                    action = f"{device_action}_device"
-                    entity_id = device_entity_id or "none"
-                    if not is_valid_entity_id(device_entity_id):
-                        status = "rejected"
-                        detail = f"{device_detail}; invalid entity_id '{device_entity_id}'"
-                    elif device_action == "approve":
-                        alias_to_use = _normalize_alias(device_alias)
-                        save_required = False
-                        save_error = ""
-                        with state_lock:
-                            alias_map = merge_entity_alias_maps(
-                                extra_entity_alias_map,
-                                dynamic_entity_alias_map,
-                            )
-                            if not alias_to_use:
-                                pending_alias = (
-                                    pending_device_suggestions.get(device_entity_id, {}).get(
-                                        "suggested_alias",
-                                        "",
-                                    )
-                                )
-                                alias_to_use = _normalize_alias(
-                                    pending_alias or suggest_alias_from_entity_id(device_entity_id)
-                                )
-                            if not alias_to_use:
-                                status = "rejected"
-                                detail = f"{device_detail}; could not infer alias for {device_entity_id}"
-                            elif (
-                                alias_to_use in extra_entity_alias_map
-                                and extra_entity_alias_map[alias_to_use] != device_entity_id
-                            ):
-                                status = "rejected"
-                                detail = (
-                                    f"{device_detail}; alias '{alias_to_use}' is reserved by static config"
-                                )
-                            elif (
-                                alias_to_use in alias_map
-                                and alias_map[alias_to_use] != device_entity_id
-                            ):
-                                status = "rejected"
-                                detail = (
-                                    f"{device_detail}; alias '{alias_to_use}' already maps to {alias_map[alias_to_use]}"
-                                )
-                            else:
-                                dynamic_entity_alias_map[alias_to_use] = device_entity_id
-                                allowed_entity_ids.add(device_entity_id)
-                                pending_device_suggestions.pop(device_entity_id, None)
-                                discovery_last_published_at[device_entity_id] = now
-                                save_required = True
-                                status = "executed"
-                                detail = (
-                                    f"{device_detail}; approved {device_entity_id} as alias '{alias_to_use}'"
-                                )
-                        if save_required:
-                            try:
-                                save_dynamic_entity_alias_map(
-                                    action_dynamic_alias_store_path,
-                                    dynamic_entity_alias_map,
-                                )
-                            except Exception as exc:
-                                status = "failed"
-                                save_error = str(exc)
-                                detail = f"{detail}; failed to persist aliases: {save_error}"
-                    else:
-                        with state_lock:
-                            removed = pending_device_suggestions.pop(device_entity_id, None)
-                            discovery_last_published_at[device_entity_id] = now
-                        status = "executed"
-                        if removed is None:
-                            detail = (
-                                f"{device_detail}; no pending suggestion for {device_entity_id}, cooldown updated"
-                            )
-                        else:
-                            detail = f"{device_detail}; rejected suggestion for {device_entity_id}"
-
-                else:
-                    current_alias_map = get_current_alias_map()
-                    is_cap_query, cap_targets, cap_detail = parse_capability_query(
-                        command_text,
-                        current_alias_map,
-                    )
-                    if is_cap_query:
-                        action = "capabilities"
-                        status = "executed"
-                        detail_parts: list[str] = [payload_detail, cap_detail]
-                        if cap_targets:
-                            for target in cap_targets:
-                                target_outlet = int(target.get("outlet", 0))
-                                target_alias = str(target.get("entity_alias", "")).strip().lower()
-                                target_entity = (
-                                    outlet_entity_map.get(target_outlet, "")
-                                    if target_outlet in {1, 2, 3, 4}
-                                    else current_alias_map.get(target_alias, "")
-                                )
-                                if not target_entity:
-                                    capability_rows.append(
-                                        {
-                                            "target": (
-                                                f"plug {target_outlet}"
-                                                if target_outlet in {1, 2, 3, 4}
-                                                else target_alias
-                                            ),
-                                            "status": "unknown",
-                                            "detail": "target not resolved",
-                                        }
-                                    )
-                                    continue
-                                domain = target_entity.split(".", 1)[0]
-                                capability_rows.append(
-                                    {
-                                        "target": (
-                                            f"plug {target_outlet}"
-                                            if target_outlet in {1, 2, 3, 4}
-                                            else target_alias
-                                        ),
-                                        "entity_id": target_entity,
-                                        "domain": domain,
-                                        "allowed": target_entity in allowed_entity_ids,
-                                        "supported_actions": capabilities_for_domain(domain),
-                                    }
-                                )
-                            detail_parts.append(
-                                f"found {len(capability_rows)} target(s); see capabilities field"
-                            )
-                            first = capability_rows[0]
-                            entity_id = str(first.get("entity_id", "none"))
-                            outlet = int(cap_targets[0].get("outlet", 0))
-                        else:
-                            seen_entities: set[str] = set()
-                            for plug_outlet, plug_entity in sorted(outlet_entity_map.items()):
-                                if not plug_entity:
-                                    continue
-                                domain = plug_entity.split(".", 1)[0]
-                                capability_rows.append(
-                                    {
-                                        "target": f"plug {plug_outlet}",
-                                        "entity_id": plug_entity,
-                                        "domain": domain,
-                                        "allowed": plug_entity in allowed_entity_ids,
-                                        "supported_actions": capabilities_for_domain(domain),
-                                    }
-                                )
-                                seen_entities.add(plug_entity)
-                            for alias_key, alias_entity in sorted(current_alias_map.items()):
-                                if alias_entity in seen_entities:
-                                    continue
-                                domain = alias_entity.split(".", 1)[0]
-                                capability_rows.append(
-                                    {
-                                        "target": alias_key,
-                                        "entity_id": alias_entity,
-                                        "domain": domain,
-                                        "allowed": alias_entity in allowed_entity_ids,
-                                        "supported_actions": capabilities_for_domain(domain),
-                                    }
-                                )
-                            detail_parts.append(
-                                f"showing {len(capability_rows)} controllable target(s)"
-                            )
-                            entity_id = "multiple"
-                        detail = "; ".join(part for part in detail_parts if part)
-
-                if (
-                    status == "rejected"
-                    and not action
-                    and (now - last_command_ts) < action_rate_limit_seconds
-                ):
-                    status = "rejected"
-                    detail = (
-                        f"rate limited: wait at least {action_rate_limit_seconds:.1f}s between commands"
-                    )
-                elif status == "rejected" and not action and current_mode == "suggest":
-                    status = "rejected"
-                    detail = "mode=suggest: action execution disabled"
-                elif status == "rejected" and not action:
-                    planned_steps, detail = parse_direct_action_plan(
-                        command_text,
-                        extra_entity_alias_map=current_alias_map,
-                    )
-                    if not planned_steps and action_parse_with_ollama:
-                        parsed_steps, parsed_detail = parse_ollama_action_plan(
-                            ollama_url=ollama_url,
-                            model=action_parse_ollama_model,
-                            timeout=action_parse_timeout,
-                            text=command_text,
-                            extra_entity_alias_map=current_alias_map,
-                        )
-                        if parsed_steps:
-                            planned_steps = parsed_steps
-                            detail = (
-                                f"{detail}; {parsed_detail}" if detail else parsed_detail
-                            )
-                        elif parsed_detail:
-                            detail = f"{detail}; {parsed_detail}" if detail else parsed_detail
-
-                    if not planned_steps:
-                        status = "rejected"
-                    elif current_mode == "ask" and not confirm:
-                        status = "rejected"
-                        detail = (
-                            f"mode=ask requires confirmation; planned {len(planned_steps)} step(s); "
-                            f"resend: confirm {command_text}"
-                        )
-                    else:
-                        step_summaries: list[str] = []
-                        executed_count = 0
-                        failed_count = 0
-                        rejected_count = 0
-
-                        for idx, step in enumerate(planned_steps, start=1):
-                            step_action = str(step.get("action", ""))
-                            step_outlet = int(step.get("outlet", 0))
-                            step_alias = str(step.get("entity_alias", "")).strip().lower()
-                            step_entity_id = (
-                                outlet_entity_map.get(step_outlet, "")
-                                if step_outlet in {1, 2, 3, 4}
-                                else current_alias_map.get(step_alias, "")
-                            )
-
-                            if not step_entity_id:
-                                step_status = "rejected"
-                                step_detail = (
-                                    f"step {idx}: unresolved target "
-                                    f"(outlet={step_outlet}, alias='{step_alias}')"
-                                )
-                            elif step_entity_id not in allowed_entity_ids:
-                                step_status = "rejected"
-                                step_detail = f"step {idx}: entity {step_entity_id} not in allowlist"
-                            elif not ha_token:
-                                step_status = "rejected"
-                                step_detail = f"step {idx}: HA_TOKEN is empty"
-                            else:
-                                prev = last_entity_action.get(step_entity_id)
-                                if (
-                                    prev
-                                    and prev[0] in {"turn_on", "turn_off"}
-                                    and step_action in {"turn_on", "turn_off"}
-                                    and prev[0] != step_action
-                                    and (now - prev[1]) < action_flip_cooldown_seconds
-                                ):
-                                    step_status = "rejected"
-                                    step_detail = (
-                                        f"step {idx}: cooldown active for {step_entity_id}; "
-                                        f"wait {action_flip_cooldown_seconds:.1f}s before flip"
-                                    )
-                                else:
-                                    ok, exec_detail = execute_home_assistant_action(
-                                        ha_url=ha_url,
-                                        ha_token=ha_token,
-                                        action=step_action,
-                                        entity_id=step_entity_id,
-                                        timeout=action_http_timeout,
-                                        step=step,
-                                    )
-                                    step_status = "executed" if ok else "failed"
-                                    step_detail = f"step {idx}: {exec_detail}"
-                                    if step_status == "executed":
-                                        last_entity_action[step_entity_id] = (step_action, now)
-
-                            if step_status == "executed":
-                                executed_count += 1
-                            elif step_status == "failed":
-                                failed_count += 1
-                            else:
-                                rejected_count += 1
-
-                            step_label = (
-                                f"plug {step_outlet}"
-                                if step_outlet in {1, 2, 3, 4}
-                                else (step_alias or step_entity_id or "unknown")
-                            )
-                            step_summaries.append(
-                                f"{idx}/{len(planned_steps)} {step_action} {step_label}: {step_status}"
-                            )
-                            executed_steps.append(
-                                {
-                                    "index": idx,
-                                    "action": step_action,
-                                    "outlet": step_outlet,
-                                    "entity_alias": step_alias,
-                                    "entity_id": step_entity_id or "none",
-                                    "status": step_status,
-                                    "detail": step_detail,
-                                    "percentage": int(step.get("percentage", 0))
-                                    if step.get("percentage") is not None
-                                    else 0,
-                                    "oscillating": step.get("oscillating")
-                                    if "oscillating" in step
-                                    else None,
-                                    "preset_mode": str(step.get("preset_mode", ""))
-                                    if step.get("preset_mode") is not None
-                                    else "",
-                                    "pulse_seconds": float(step.get("pulse_seconds", 0))
-                                    if step.get("pulse_seconds") is not None
-                                    else 0.0,
-                                }
-                            )
-
-                        if executed_count == len(planned_steps):
-                            status = "executed"
-                        elif executed_count > 0 or failed_count > 0:
-                            status = "failed"
-                        else:
-                            status = "rejected"
-
-                        if planned_steps:
-                            first = planned_steps[0]
-                            first_outlet = int(first.get("outlet", 0))
-                            first_alias = str(first.get("entity_alias", "")).strip().lower()
-                            first_entity = (
-                                outlet_entity_map.get(first_outlet, "")
-                                if first_outlet in {1, 2, 3, 4}
-                                else current_alias_map.get(first_alias, "")
-                            )
-                            if len(planned_steps) == 1:
-                                action = str(first.get("action", ""))
-                                outlet = first_outlet
-                                entity_id = first_entity or "none"
-                            else:
-                                action = "multi"
-                                outlet = 0
-                                entity_id = "multiple"
-
-                        detail = (
-                            f"{payload_detail}; {detail}; "
-                            f"executed={executed_count}/{len(planned_steps)}; "
-                            f"failed={failed_count}; rejected={rejected_count}; "
-                            + " | ".join(step_summaries)
-                        )
-                        if status == "executed":
-                            last_command_ts = now
-            except Exception as exc:
-                status = "failed"
-                detail = f"action worker exception: {exc}"
-
-            result = {
-                "status": status,
-                "command": command_text or raw_payload,
-                "action": action or "none",
-                "outlet": outlet,
-                "entity_id": entity_id or "none",
-                "source": source,
-                "mode": current_mode,
-                "detail": detail,
-                "steps": executed_steps,
-                "time": time.time(),
-            }
-            if capability_rows:
-                result["capabilities"] = capability_rows
-
-            publish_action_result_payload(result)
-
-            write_action_audit(
-                status=status,
-                action=action or "none",
-                command=command_text or raw_payload,
-                detail=detail,
-                source=source,
-                entity_id=entity_id or "none",
-                mode=current_mode,
-            )
-            action_queue.task_done()
-
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-    if mqtt_user:
-        client.username_pw_set(mqtt_user, mqtt_password)
+    protocol = mqtt.MQTTv5 if config.mqtt_protocol in {"5", "5.0", "v5"} else mqtt.MQTTv311
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, protocol=protocol)
+    if config.mqtt_user:
+        client.username_pw_set(config.mqtt_user, config.mqtt_password)
 
-    client.on_connect = on_connect
-    client.on_disconnect = on_disconnect
-    client.on_message = on_message
+    pipeline = AgentPipeline(config, client, write_api)
+    pipeline.attach(client)
     client.reconnect_delay_set(min_delay=1, max_delay=30)
 
-    threading.Thread(target=suggestion_worker, daemon=True).start()
-    if action_bridge_enabled:
-        threading.Thread(target=action_worker, daemon=True).start()
+    pipeline.start_workers()
 
-    client.connect(mqtt_host, mqtt_port, mqtt_keepalive)
+    client.connect(config.mqtt_host, config.mqtt_port, config.mqtt_keepalive)
     client.loop_forever()
 
 
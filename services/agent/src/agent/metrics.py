@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class LatencyStats:
+    def __init__(self, max_samples: int = 10000) -> None:
+        self._samples: deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def percentile(self, pct: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+        return ordered[rank]
+
+    def snapshot(self) -> dict[str, Any]:
+        mean = self.total_seconds / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": round(mean * 1000.0, 3),
+            "p50_ms": round(self.percentile(50) * 1000.0, 3),
+            "p95_ms": round(self.percentile(95) * 1000.0, 3),
+            "p99_ms": round(self.percentile(99) * 1000.0, 3),
+            "max_ms": round(self.max_seconds * 1000.0, 3),
+        }
+
+
+class MonitoredQueue(queue.Queue):
+    """Queue that tracks its high-water mark and rejected puts."""
+
+    def __init__(self, maxsize: int = 0, name: str = "") -> None:
+        super().__init__(maxsize=maxsize)
+        self.name = name
+        self.high_water = 0
+        self.enqueued = 0
+        self.dropped = 0
+
+    def _put(self, item: Any) -> None:
+        super()._put(item)
+        self.enqueued += 1
+        depth = self._qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+
+    def put(self, item: Any, block: bool = True, timeout: float | None = None) -> None:
+        try:
+            super().put(item, block=block, timeout=timeout)
+        except queue.Full:
+            with self.mutex:
+                self.dropped += 1
+            raise
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.mutex:
+            return {
+                "depth": self._qsize(),
+                "maxsize": self.maxsize,
+                "high_water": self.high_water,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+            }
+
+
+class PipelineMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stages: dict[str, LatencyStats] = {}
+        self.queues: dict[str, MonitoredQueue] = {}
+        self.counters: dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = LatencyStats()
+                self.stages[stage] = stats
+            stats.record(seconds)
+
+    @contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_queue(self, name: str, monitored: MonitoredQueue) -> MonitoredQueue:
+        monitored.name = name
+        with self._lock:
+            self.queues[name] = monitored
+        return monitored
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            stages = {name: stats.snapshot() for name, stats in sorted(self.stages.items())}
+            queues = dict(self.queues)
+            counters = dict(sorted(self.counters.items()))
+        return {
+            "stages": stages,
+            "queues": {name: q.snapshot() for name, q in sorted(queues.items())},
+            "counters": counters,
+        }
+
+
+class MonitoredPriorityQueue(MonitoredQueue, queue.PriorityQueue):
+    """Priority variant; items are `(priority, sequence, payload)` tuples."""
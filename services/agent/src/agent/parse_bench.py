@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any
+
+from agent.main import parse_direct_action_plan
+from agent.pipeline import AgentConfig, AgentState
+from agent.replay import parse_env_overrides
+
+
+def load_transcripts(file_path: str) -> list[dict[str, Any]]:
+    """Rows from `scripts/voice-stt-batch.py` output (or any JSONL with `command`/`text`)."""
+    rows: list[dict[str, Any]] = []
+    with open(file_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict) and row.get("ok", True):
+                rows.append(row)
+    return rows
+
+
+def _canonical_step(step: dict[str, Any]) -> tuple[str, int, str]:
+    return (
+        str(step.get("action", "")),
+        int(step.get("outlet", 0) or 0),
+        str(step.get("entity_alias", "")).strip().lower(),
+    )
+
+
+def _step_matches(actual: dict[str, Any], expected: dict[str, Any]) -> bool:
+    """Canonical fields must agree; other keys only when the label sets them.
+
+    The rule parser adds keys such as `oscillating` that hand-written labels
+    usually leave out, so those must not count as a miss.
+    """
+    if _canonical_step(actual) != _canonical_step(expected):
+        return False
+    return all(
+        actual.get(key) == value
+        for key, value in expected.items()
+        if key not in {"action", "outlet", "entity_alias"}
+    )
+
+
+def _fold_text(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def plans_match(actual: list[dict[str, Any]], expected: list[dict[str, Any]]) -> bool:
+    if len(actual) != len(expected):
+        return False
+    remaining = list(actual)
+    # Most specific labels first so a looser one cannot take their step.
+    for step in sorted(expected, key=len, reverse=True):
+        for index, candidate in enumerate(remaining):
+            if _step_matches(candidate, step):
+                del remaining[index]
+                break
+        else:
+            return False
+    return True
+
+
+def _percentile_us(ordered: list[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index] * 1e6, 1)
+
+
+def run_parse_bench(
+    rows: list[dict[str, Any]],
+    alias_map: dict[str, str],
+    repeat: int = 1,
+    max_mismatches: int = 20,
+) -> dict[str, Any]:
+    """Parse every transcript with the rule parser; report accuracy and per-call latency.
+
+    Rows with `expected_steps` count toward plan accuracy, rows with
+    `expected_text` toward transcript exact-match against the raw `text`
+    (case, punctuation and whitespace folded).
+    """
+    durations: list[float] = []
+    parsed = 0
+    labeled = 0
+    correct = 0
+    text_labeled = 0
+    text_exact = 0
+    mismatches: list[dict[str, Any]] = []
+    started = time.perf_counter()
+    for row in rows:
+        text = str(row.get("command") or row.get("text") or "")
+        steps: list[dict[str, Any]] = []
+        for _ in range(max(1, repeat)):
+            call_started = time.perf_counter()
+            steps, _ = parse_direct_action_plan(text, extra_entity_alias_map=alias_map)
+            durations.append(time.perf_counter() - call_started)
+        if steps:
+            parsed += 1
+        expected_steps = row.get("expected_steps")
+        if isinstance(expected_steps, list):
+            labeled += 1
+            if plans_match(steps, expected_steps):
+                correct += 1
+            elif len(mismatches) < max_mismatches:
+                mismatches.append(
+                    {
+                        "path": row.get("path", ""),
+                        "text": text,
+                        "expected_steps": expected_steps,
+                        "actual_steps": steps,
+                    }
+                )
+        expected_text = row.get("expected_text")
+        if isinstance(expected_text, str):
+            text_labeled += 1
+            if _fold_text(expected_text) == _fold_text(str(row.get("text", ""))):
+                text_exact += 1
+    elapsed = time.perf_counter() - started
+    ordered = sorted(durations)
+    return {
+        "rows": len(rows),
+        "parsed": parsed,
+        "parse_rate": round(parsed / len(rows), 4) if rows else 0.0,
+        "labeled": labeled,
+        "correct": correct,
+        "accuracy": round(correct / labeled, 4) if labeled else None,
+        "text_labeled": text_labeled,
+        "text_exact": text_exact,
+        "text_accuracy": round(text_exact / text_labeled, 4) if text_labeled else None,
+        "calls": len(durations),
+        "calls_per_second": round(len(durations) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_us": _percentile_us(ordered, 0.50),
+        "p95_us": _percentile_us(ordered, 0.95),
+        "max_us": round(ordered[-1] * 1e6, 1) if ordered else 0.0,
+        "mismatches": mismatches,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark parse_direct_action_plan on batch voice transcripts."
+    )
+    parser.add_argument("--input", required=True, help="JSONL from scripts/voice-stt-batch.py")
+    parser.add_argument("--repeat", type=int, default=1, help="parse each row N times for timing")
+    parser.add_argument("--env", action="append", default=[], help="agent env override KEY=VALUE")
+    parser.add_argument("--min-accuracy", type=float, default=0.0, help="fail below this plan accuracy")
+    parser.add_argument("--output", default="", help="write JSON report to this file")
+    args = parser.parse_args(argv)
+
+    rows = load_transcripts(args.input)
+    if not rows:
+        print("no transcripts", file=sys.stderr)
+        return 2
+    env = {**os.environ, **parse_env_overrides(args.env)}
+    # Same alias map the running agent would use (static + dynamic aliases).
+    state = AgentState(AgentConfig.from_env(env))
+    report = run_parse_bench(rows, state.alias_map(), repeat=args.repeat)
+
+    rendered = json.dumps(report, indent=2, ensure_ascii=False)
+    print(rendered)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(rendered + "\n")
+    accuracy = report["accuracy"]
+    return 1 if accuracy is not None and accuracy < args.min_accuracy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1741 @@
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Mapping
+
+import paho.mqtt.client as mqtt
+from influxdb_client import Point, WritePrecision
+
+from agent.admission import (
+    CONTROL_PRIORITY,
+    DEFAULT_SOURCE_PRIORITIES,
+    DEFAULT_SOURCE_RATE_LIMITS,
+    AdmissionController,
+    parse_source_priorities,
+    parse_source_rate_limits,
+)
+from agent.dedup import CommandDeduplicator, DedupEntry, replayed_result
+from agent.downsample import EventDownsampler
+from agent.fanout import (
+    TopicAliasRegistry,
+    compact_entity_results,
+    encode_result_payload,
+    entity_state_topic,
+    summarize_result,
+    topic_alias_maximum,
+)
+from agent.inventory import CapabilityInventory, capability_row
+from agent.main import (
+    DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX,
+    TOPIC,
+    VALID_ACTION_MODES,
+    _normalize_alias,
+    execute_home_assistant_action,
+    influx_query_sql,
+    is_actionable_topic,
+    is_valid_entity_id,
+    load_dynamic_entity_alias_map,
+    merge_entity_alias_maps,
+    ollama_embed,
+    ollama_suggest,
+    parse_capability_query,
+    parse_command_payload,
+    parse_command_request_id,
+    parse_device_management_command,
+    parse_device_management_payload,
+    parse_direct_action_plan,
+    parse_discoverable_entity_from_topic,
+    parse_extra_entity_alias_map,
+    parse_ollama_action_plan,
+    save_dynamic_entity_alias_map,
+    suggest_alias_from_entity_id,
+)
+from agent.metrics import MonitoredPriorityQueue, MonitoredQueue, PipelineMetrics
+from agent.rollup import ActionRollup
+from agent.semantic import SemanticResolver
+from agent.speculative import PartialParseWarmer, SpeculativeParser
+
+ActionItem = tuple[str, str, str, float]
+QueuedAction = tuple[int, int, ActionItem]
+TimingHook = Callable[[str, float], None]
+
+
+@dataclass
+class AgentConfig:
+    mqtt_host: str = "mosquitto"
+    mqtt_port: int = 1883
+    mqtt_user: str = ""
+    mqtt_password: str = ""
+    mqtt_keepalive: int = 120
+    mqtt_protocol: str = "3.1.1"
+    mqtt_topic_aliases: bool = False
+    ollama_url: str = "http://ollama:11434"
+    action_parse_ollama_model: str = "llama3.1:8b"
+    suggestion_ollama_model: str = "llama3.1:8b"
+    influx_url: str = "http://influxdb:8181"
+    influx_token: str = ""
+    influx_org: str = "homelab"
+    influx_bucket: str = "home"
+    influx_raw_bucket: str = ""
+    downsample_enabled: bool = False
+    downsample_interval_seconds: float = 300.0
+    downsample_after_hours: int = 1
+    downsample_backfill_hours: int = 168
+    downsample_state_path: str = "/app/runtime/downsample_state.json"
+    action_rollup_enabled: bool = True
+    action_rollup_flush_seconds: float = 15.0
+    suggestion_queue_max: int = 1000
+    suggestion_http_timeout: int = 120
+    action_bridge_enabled: bool = False
+    action_parse_with_ollama: bool = True
+    action_command_topic: str = "home/ai/command"
+    action_result_topic: str = "home/ai/action_result"
+    action_result_fanout_enabled: bool = False
+    action_result_entity_topic_prefix: str = "home/ai/entity"
+    action_result_summary_topic: str = "home/ai/action_summary"
+    action_result_compress_min_bytes: int = 0
+    action_device_suggestion_topic: str = "home/ai/device_suggestion"
+    action_capability_inventory_topic: str = "home/ai/capabilities"
+    action_capability_fast_path: bool = True
+    action_mode_topic: str = "home/ai/mode"
+    action_mode_set_topic: str = "home/ai/mode/set"
+    action_mode_default: str = "auto"
+    action_queue_max: int = 100
+    action_lanes_enabled: bool = True
+    action_slow_queue_max: int = 20
+    action_speculative_parse_enabled: bool = False
+    action_speculative_parse_sources: tuple[str, ...] = ("voice",)
+    action_speculative_max_inflight: int = 1
+    action_voice_partial_topic: str = "home/ai/voice/partial"
+    action_partial_warm_enabled: bool = False
+    action_semantic_resolver_enabled: bool = False
+    action_embedding_model: str = "nomic-embed-text"
+    action_embedding_timeout: int = 10
+    action_semantic_cache_dir: str = "/app/runtime/embeddings"
+    action_semantic_min_score: float = 0.6
+    action_semantic_min_margin: float = 0.05
+    action_semantic_intent_min_margin: float = 0.15
+    action_device_discovery_enabled: bool = True
+    action_device_discovery_cooldown_seconds: float = 600.0
+    action_device_discovery_ignore_regex: str = DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX
+    action_dynamic_alias_store_path: str = "/app/runtime/dynamic_aliases.json"
+    action_http_timeout: int = 20
+    action_parse_timeout: int = 120
+    action_rate_limit_seconds: float = 2.0
+    action_flip_cooldown_seconds: float = 3.0
+    action_admission_enabled: bool = True
+    action_source_rate_limits: dict[str, tuple[float, float]] = field(
+        default_factory=lambda: dict(DEFAULT_SOURCE_RATE_LIMITS)
+    )
+    action_source_priorities: dict[str, int] = field(
+        default_factory=lambda: dict(DEFAULT_SOURCE_PRIORITIES)
+    )
+    action_admission_headroom_per_priority: float = 0.25
+    action_dedup_window_seconds: float = 1.5
+    action_dedup_request_id_window_seconds: float = 60.0
+    action_dedup_max_entries: int = 256
+    ha_url: str = "http://homeassistant:8123"
+    ha_token: str = ""
+    outlet_entity_map: dict[int, str] = field(
+        default_factory=lambda: {
+            1: "switch.p304m_tapo_p304m_1",
+            2: "switch.p304m_tapo_p304m_2",
+            3: "switch.p304m_tapo_p304m_3",
+            4: "switch.p304m_tapo_p304m_4",
+        }
+    )
+    extra_entity_alias_map: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] | None = None) -> "AgentConfig":
+        getenv = (os.environ if env is None else env).get
+        ollama_default_model = getenv("OLLAMA_MODEL", "llama3.1:8b")
+        suggestion_http_timeout = int(getenv("SUGGESTION_HTTP_TIMEOUT", "120"))
+        return cls(
+            mqtt_host=getenv("MQTT_HOST", "mosquitto"),
+            mqtt_port=int(getenv("MQTT_PORT", "1883")),
+            mqtt_user=getenv("MQTT_USER", ""),
+            mqtt_password=getenv("MQTT_PASSWORD", ""),
+            mqtt_keepalive=int(getenv("MQTT_KEEPALIVE", "120")),
+            mqtt_protocol=getenv("MQTT_PROTOCOL", "3.1.1").strip().lower(),
+            mqtt_topic_aliases=getenv("MQTT_TOPIC_ALIASES", "false").lower() == "true",
+            ollama_url=getenv("OLLAMA_URL", "http://ollama:11434"),
+            action_parse_ollama_model=getenv("ACTION_PARSE_OLLAMA_MODEL", ollama_default_model),
+            suggestion_ollama_model=getenv("SUGGESTION_OLLAMA_MODEL", ollama_default_model),
+            influx_url=getenv("INFLUX_URL", "http://influxdb:8181"),
+            influx_token=getenv("INFLUX_TOKEN", ""),
+            influx_org=getenv("INFLUX_ORG", "homelab"),
+            influx_bucket=getenv("INFLUX_BUCKET", "home"),
+            influx_raw_bucket=getenv("INFLUX_RAW_BUCKET", "").strip(),
+            downsample_enabled=getenv("DOWNSAMPLE_ENABLED", "false").lower() == "true",
+            downsample_interval_seconds=float(getenv("DOWNSAMPLE_INTERVAL_SECONDS", "300")),
+            downsample_after_hours=int(getenv("DOWNSAMPLE_AFTER_HOURS", "1")),
+            downsample_backfill_hours=int(getenv("DOWNSAMPLE_BACKFILL_HOURS", "168")),
+            downsample_state_path=getenv(
+                "DOWNSAMPLE_STATE_PATH",
+                "/app/runtime/downsample_state.json",
+            ).strip(),
+            action_rollup_enabled=getenv("ACTION_ROLLUP_ENABLED", "true").lower() == "true",
+            action_rollup_flush_seconds=float(getenv("ACTION_ROLLUP_FLUSH_SECONDS", "15")),
+            suggestion_queue_max=int(getenv("SUGGESTION_QUEUE_MAX", "1000")),
+            suggestion_http_timeout=suggestion_http_timeout,
+            action_bridge_enabled=getenv("ACTION_BRIDGE_ENABLED", "false").lower() == "true",
+            action_parse_with_ollama=getenv("ACTION_PARSE_WITH_OLLAMA", "true").lower() == "true",
+            action_command_topic=getenv("ACTION_COMMAND_TOPIC", "home/ai/command"),
+            action_result_topic=getenv("ACTION_RESULT_TOPIC", "home/ai/action_result"),
+            action_result_fanout_enabled=(
+                getenv("ACTION_RESULT_FANOUT_ENABLED", "false").lower() == "true"
+            ),
+            action_result_entity_topic_prefix=getenv(
+                "ACTION_RESULT_ENTITY_TOPIC_PREFIX",
+                "home/ai/entity",
+            ),
+            action_result_summary_topic=getenv(
+                "ACTION_RESULT_SUMMARY_TOPIC",
+                "home/ai/action_summary",
+            ),
+            action_result_compress_min_bytes=int(
+                getenv("ACTION_RESULT_COMPRESS_MIN_BYTES", "0")
+            ),
+            action_capability_inventory_topic=getenv(
+                "ACTION_CAPABILITY_INVENTORY_TOPIC",
+                "home/ai/capabilities",
+            ).strip(),
+            action_capability_fast_path=(
+                getenv("ACTION_CAPABILITY_FAST_PATH", "true").lower() == "true"
+            ),
+            action_device_suggestion_topic=getenv(
+                "ACTION_DEVICE_SUGGESTION_TOPIC",
+                "home/ai/device_suggestion",
+            ),
+            action_mode_topic=getenv("ACTION_MODE_TOPIC", "home/ai/mode"),
+            action_mode_set_topic=getenv("ACTION_MODE_SET_TOPIC", "home/ai/mode/set"),
+            action_mode_default=getenv("ACTION_MODE_DEFAULT", "auto").lower(),
+            action_queue_max=int(getenv("ACTION_QUEUE_MAX", "100")),
+            action_lanes_enabled=getenv("ACTION_LANES_ENABLED", "true").lower() == "true",
+            action_slow_queue_max=int(getenv("ACTION_SLOW_QUEUE_MAX", "20")),
+            action_speculative_parse_enabled=(
+                getenv("ACTION_SPECULATIVE_PARSE_ENABLED", "false").lower() == "true"
+            ),
+            action_speculative_parse_sources=tuple(
+                item.strip().lower()
+                for item in getenv("ACTION_SPECULATIVE_PARSE_SOURCES", "voice").split(",")
+                if item.strip()
+            ),
+            action_speculative_max_inflight=int(
+                getenv("ACTION_SPECULATIVE_MAX_INFLIGHT", "1")
+            ),
+            action_voice_partial_topic=getenv(
+                "ACTION_VOICE_PARTIAL_TOPIC",
+                "home/ai/voice/partial",
+            ).strip(),
+            action_partial_warm_enabled=(
+                getenv("ACTION_PARTIAL_WARM_ENABLED", "false").lower() == "true"
+            ),
+            action_semantic_resolver_enabled=(
+                getenv("ACTION_SEMANTIC_RESOLVER_ENABLED", "false").lower() == "true"
+            ),
+            action_embedding_model=getenv("ACTION_EMBEDDING_MODEL", "nomic-embed-text").strip(),
+            action_embedding_timeout=int(getenv("ACTION_EMBEDDING_TIMEOUT", "10")),
+            action_semantic_cache_dir=getenv(
+                "ACTION_SEMANTIC_CACHE_DIR",
+                "/app/runtime/embeddings",
+            ).strip(),
+            action_semantic_min_score=float(getenv("ACTION_SEMANTIC_MIN_SCORE", "0.6")),
+            action_semantic_min_margin=float(getenv("ACTION_SEMANTIC_MIN_MARGIN", "0.05")),
+            action_semantic_intent_min_margin=float(
+                getenv("ACTION_SEMANTIC_INTENT_MIN_MARGIN", "0.15")
+            ),
+            action_device_discovery_enabled=(
+                getenv("ACTION_DEVICE_DISCOVERY_ENABLED", "true").lower() == "true"
+            ),
+            action_device_discovery_cooldown_seconds=float(
+                getenv("ACTION_DEVICE_DISCOVERY_COOLDOWN_SECONDS", "600")
+            ),
+            action_device_discovery_ignore_regex=getenv(
+                "ACTION_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX",
+                DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX,
+            ),
+            action_dynamic_alias_store_path=getenv(
+                "ACTION_DYNAMIC_ALIAS_STORE_PATH",
+                "/app/runtime/dynamic_aliases.json",
+            ),
+            action_http_timeout=int(getenv("ACTION_HTTP_TIMEOUT", "20")),
+            action_parse_timeout=int(
+                getenv("ACTION_PARSE_TIMEOUT", str(suggestion_http_timeout))
+            ),
+            action_rate_limit_seconds=float(getenv("ACTION_RATE_LIMIT_SECONDS", "2")),
+            action_flip_cooldown_seconds=float(getenv("ACTION_FLIP_COOLDOWN_SECONDS", "3")),
+            action_admission_enabled=(
+                getenv("ACTION_ADMISSION_ENABLED", "true").lower() == "true"
+            ),
+            action_source_rate_limits=parse_source_rate_limits(
+                getenv("ACTION_SOURCE_RATE_LIMITS_JSON", "")
+            ),
+            action_source_priorities=parse_source_priorities(
+                getenv("ACTION_SOURCE_PRIORITIES_JSON", "")
+            ),
+            action_admission_headroom_per_priority=float(
+                getenv("ACTION_ADMISSION_HEADROOM_PER_PRIORITY", "0.25")
+            ),
+            action_dedup_window_seconds=float(getenv("ACTION_DEDUP_WINDOW_SECONDS", "1.5")),
+            action_dedup_request_id_window_seconds=float(
+                getenv("ACTION_DEDUP_REQUEST_ID_WINDOW_SECONDS", "60")
+            ),
+            action_dedup_max_entries=int(getenv("ACTION_DEDUP_MAX_ENTRIES", "256")),
+            ha_url=getenv("HA_URL", "http://homeassistant:8123"),
+            ha_token=getenv("HA_TOKEN", ""),
+            outlet_entity_map={
+                1: getenv("ACTION_ENTITY_PLUG_1", "switch.p304m_tapo_p304m_1"),
+                2: getenv("ACTION_ENTITY_PLUG_2", "switch.p304m_tapo_p304m_2"),
+                3: getenv("ACTION_ENTITY_PLUG_3", "switch.p304m_tapo_p304m_3"),
+                4: getenv("ACTION_ENTITY_PLUG_4", "switch.p304m_tapo_p304m_4"),
+            },
+            extra_entity_alias_map=parse_extra_entity_alias_map(
+                getenv("ACTION_EXTRA_ENTITY_MAP_JSON", "")
+            ),
+        )
+
+
+class AgentState:
+    """Alias maps, allowlist, discovery bookkeeping and mode shared across stages."""
+
+    def __init__(self, config: AgentConfig) -> None:
+        self.lock = threading.Lock()
+        self.outlet_entity_map = dict(config.outlet_entity_map)
+        self.extra_entity_alias_map = dict(config.extra_entity_alias_map)
+        self.dynamic_entity_alias_map = load_dynamic_entity_alias_map(
+            config.action_dynamic_alias_store_path
+        )
+        self.allowed_entity_ids = {v for v in self.outlet_entity_map.values() if v}
+        self.allowed_entity_ids.update(self.extra_entity_alias_map.values())
+        self.allowed_entity_ids.update(self.dynamic_entity_alias_map.values())
+        self.pending_device_suggestions: dict[str, dict[str, Any]] = {}
+        self.discovery_last_published_at: dict[str, float] = {}
+        mode = config.action_mode_default
+        self.current_mode = mode if mode in VALID_ACTION_MODES else "auto"
+        self.inventory = CapabilityInventory()
+        self.inventory.rebuild(
+            self.outlet_entity_map,
+            merge_entity_alias_maps(self.extra_entity_alias_map, self.dynamic_entity_alias_map),
+            self.allowed_entity_ids,
+        )
+
+    def alias_map(self) -> dict[str, str]:
+        # Merged once per alias-map version by the inventory; treat as read-only.
+        return self.inventory.alias_map()
+
+    def resolve_entity(self, outlet: int, alias: str, alias_map: dict[str, str]) -> str:
+        if outlet in {1, 2, 3, 4}:
+            return self.outlet_entity_map.get(outlet, "")
+        return alias_map.get(alias, "")
+
+
+class AuditWriter:
+    def __init__(self, write_api: Any, bucket: str, rollup: ActionRollup | None = None) -> None:
+        self.write_api = write_api
+        self.bucket = bucket
+        self.rollup = rollup
+
+    def write(
+        self,
+        *,
+        status: str,
+        action: str,
+        command: str,
+        detail: str,
+        source: str,
+        entity_id: str,
+        mode: str,
+        latency_seconds: float | None = None,
+    ) -> None:
+        if self.rollup is not None:
+            self.rollup.record(
+                status=status,
+                source=source,
+                mode=mode,
+                action=action,
+                latency_seconds=latency_seconds,
+            )
+        try:
+            action_point = (
+                Point("agent_action")
+                .tag("status", status)
+                .tag("action", action or "none")
+                .tag("entity_id", entity_id or "none")
+                .tag("source", source or "manual")
+                .tag("mode", mode)
+                .field("command", command[:5000])
+                .field("detail", detail[:5000])
+                .time(time.time_ns(), WritePrecision.NS)
+            )
+            self.write_api.write(bucket=self.bucket, record=action_point)
+        except Exception as exc:
+            print("influx write agent_action failed:", exc, flush=True)
+
+
+class ResultPublisher:
+    def __init__(self, client: Any, config: AgentConfig) -> None:
+        self.client = client
+        self.config = config
+        self.topic_aliases = TopicAliasRegistry() if config.mqtt_topic_aliases else None
+        self._publish_lock = threading.Lock()
+
+    def on_connect(self, properties: Any) -> None:
+        if self.topic_aliases is not None:
+            self.topic_aliases.reset(topic_alias_maximum(properties))
+
+    def publish(self, topic: str, payload: str, retain: bool = False) -> Any:
+        if self.topic_aliases is None:
+            return self.client.publish(topic, payload, qos=0, retain=retain)
+        # Alias registration and the publish that carries it must not interleave.
+        with self._publish_lock:
+            publish_topic, properties = self.topic_aliases.resolve(topic)
+            return self.client.publish(
+                publish_topic,
+                payload,
+                qos=0,
+                retain=retain,
+                properties=properties,
+            )
+
+    def publish_action_result(self, payload: dict[str, Any]) -> None:
+        try:
+            publish_result = self.publish(
+                self.config.action_result_topic,
+                encode_result_payload(payload, self.config.action_result_compress_min_bytes),
+            )
+            if publish_result.rc != mqtt.MQTT_ERR_SUCCESS:
+                print("failed to publish action result rc=", publish_result.rc, flush=True)
+        except Exception as exc:
+            print("action result publish failed:", exc, flush=True)
+        if self.config.action_result_fanout_enabled and payload.get("event") != "device_suggestion":
+            self.publish_fanout(payload)
+
+    def publish_fanout(self, payload: dict[str, Any]) -> None:
+        try:
+            for entity_id, record in compact_entity_results(payload).items():
+                self.publish(
+                    entity_state_topic(self.config.action_result_entity_topic_prefix, entity_id),
+                    json.dumps(record, ensure_ascii=True, separators=(",", ":")),
+                    retain=True,
+                )
+            self.publish(
+                self.config.action_result_summary_topic,
+                json.dumps(summarize_result(payload), ensure_ascii=True, separators=(",", ":")),
+                retain=True,
+            )
+        except Exception as exc:
+            print("action result fan-out failed:", exc, flush=True)
+
+    def publish_capability_inventory(self, document: dict[str, Any]) -> None:
+        if not self.config.action_capability_inventory_topic:
+            return
+        try:
+            result = self.publish(
+                self.config.action_capability_inventory_topic,
+                encode_result_payload(document, self.config.action_result_compress_min_bytes),
+                retain=True,
+            )
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                print("failed to publish capability inventory rc=", result.rc, flush=True)
+        except Exception as exc:
+            print("capability inventory publish failed:", exc, flush=True)
+
+    def publish_device_suggestion(self, suggestion: dict[str, Any]) -> None:
+        try:
+            suggestion_result = self.publish(
+                self.config.action_device_suggestion_topic,
+                json.dumps(suggestion, ensure_ascii=True),
+            )
+            if suggestion_result.rc != mqtt.MQTT_ERR_SUCCESS:
+                print("failed to publish device suggestion rc=", suggestion_result.rc, flush=True)
+        except Exception as exc:
+            print("device suggestion publish failed:", exc, flush=True)
+        self.publish_action_result(suggestion)
+
+    def publish_mode(self, mode: str, source: str, detail: str) -> None:
+        payload = json.dumps(
+            {
+                "mode": mode,
+                "source": source,
+                "detail": detail,
+                "time": time.time(),
+            },
+            ensure_ascii=True,
+        )
+        result = self.publish(self.config.action_mode_topic, payload, retain=True)
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            print("failed to publish mode rc=", result.rc, flush=True)
+
+
+class Stage:
+    """Pipeline stage with timing hooks around `process`.
+
+    Call `run` from the pipeline so hooks fire; call `process` directly to profile
+    or benchmark the stage in isolation.
+    """
+
+    name = "stage"
+
+    def __init__(self) -> None:
+        self.timing_hooks: list[TimingHook] = []
+
+    def add_timing_hook(self, hook: TimingHook) -> None:
+        self.timing_hooks.append(hook)
+
+    @contextmanager
+    def timed(self, name: str | None = None) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in self.timing_hooks:
+                hook(name or self.name, elapsed)
+
+    def run(self, *args: Any, **kwargs: Any) -> Any:
+        with self.timed():
+            return self.process(*args, **kwargs)
+
+    def process(self, *args: Any, **kwargs: Any) -> Any:
+        raise NotImplementedError
+
+
+class IngestWriter(Stage):
+    name = "ingest"
+
+    def __init__(self, write_api: Any, bucket: str) -> None:
+        super().__init__()
+        self.write_api = write_api
+        self.bucket = bucket
+
+    def process(self, topic: str, payload: str) -> None:
+        try:
+            point = (
+                Point("mqtt_event")
+                .tag("topic", topic)
+                .field("payload", payload[:5000])
+                .time(time.time_ns(), WritePrecision.NS)
+            )
+            self.write_api.write(bucket=self.bucket, record=point)
+        except Exception as exc:
+            print("influx write mqtt_event failed:", exc, flush=True)
+
+
+class TopicClassifier(Stage):
+    """Maps an inbound topic to the routes it should take through the pipeline."""
+
+    name = "classify"
+
+    def __init__(self, config: AgentConfig) -> None:
+        super().__init__()
+        self.config = config
+
+    def process(self, topic: str) -> list[str]:
+        routes: list[str] = []
+        bridge = self.config.action_bridge_enabled
+        if bridge and topic == self.config.action_command_topic:
+            routes.append("command")
+        if bridge and topic == self.config.action_mode_set_topic:
+            routes.append("mode_set")
+        if (
+            bridge
+            and self.config.action_partial_warm_enabled
+            and topic == self.config.action_voice_partial_topic
+        ):
+            routes.append("voice_partial")
+        if is_actionable_topic(topic):
+            routes.append("suggestion")
+        if bridge and self.config.action_device_discovery_enabled:
+            routes.append("discovery")
+        return routes
+
+
+class DeviceDiscovery(Stage):
+    name = "discovery"
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        state: AgentState,
+        publisher: ResultPublisher,
+        audit: AuditWriter,
+    ) -> None:
+        super().__init__()
+        self.config = config
+        self.state = state
+        self.publisher = publisher
+        self.audit = audit
+        try:
+            self.ignore_pattern = re.compile(config.action_device_discovery_ignore_regex)
+        except re.error:
+            self.ignore_pattern = re.compile(DEFAULT_DEVICE_DISCOVERY_IGNORE_OBJECTID_REGEX)
+
+    def process(self, topic: str, payload: str) -> bool:
+        discovered = parse_discoverable_entity_from_topic(topic)
+        if discovered is None:
+            return False
+        domain, object_id = discovered
+        if self.ignore_pattern.search(object_id) is not None:
+            return False
+        entity_id = f"{domain}.{object_id}"
+        now = time.time()
+        suggestion_alias = ""
+        should_publish = False
+        state = self.state
+        with state.lock:
+            alias_map = merge_entity_alias_maps(
+                state.extra_entity_alias_map,
+                state.dynamic_entity_alias_map,
+            )
+            if entity_id in state.allowed_entity_ids:
+                should_publish = False
+            elif entity_id in state.pending_device_suggestions:
+                state.pending_device_suggestions[entity_id]["last_seen"] = now
+                should_publish = False
+            else:
+                last_published = state.discovery_last_published_at.get(entity_id, 0.0)
+                if (now - last_published) >= self.config.action_device_discovery_cooldown_seconds:
+                    suggestion_alias = suggest_alias_from_entity_id(entity_id)
+                    if (
+                        suggestion_alias in alias_map
+                        and alias_map[suggestion_alias] != entity_id
+                    ):
+                        suggestion_alias = f"{suggestion_alias} {domain}"
+                    state.pending_device_suggestions[entity_id] = {
+                        "entity_id": entity_id,
+                        "domain": domain,
+                        "topic": topic,
+                        "suggested_alias": suggestion_alias,
+                        "first_seen": now,
+                        "last_seen": now,
+                    }
+                    state.discovery_last_published_at[entity_id] = now
+                    should_publish = True
+        if should_publish:
+            self.publish_suggestion(
+                entity_id=entity_id,
+                domain=domain,
+                topic=topic,
+                payload=payload,
+                suggested_alias=suggestion_alias,
+            )
+        return should_publish
+
+    def publish_suggestion(
+        self,
+        *,
+        entity_id: str,
+        domain: str,
+        topic: str,
+        payload: str,
+        suggested_alias: str,
+    ) -> None:
+        mode = self.state.current_mode
+        suggestion = {
+            "status": "suggested",
+            "event": "device_suggestion",
+            "command": f"discover {entity_id}",
+            "action": "suggest_device",
+            "entity_id": entity_id,
+            "domain": domain,
+            "topic": topic,
+            "state": payload[:500],
+            "suggested_alias": suggested_alias,
+            "approve_example": f"approve device {entity_id} as {suggested_alias}",
+            "reject_example": f"reject device {entity_id}",
+            "source": "agent",
+            "mode": mode,
+            "detail": (
+                "new controllable device discovered; "
+                f"approve with: approve device {entity_id} as {suggested_alias}"
+            ),
+            "time": time.time(),
+        }
+        self.publisher.publish_device_suggestion(suggestion)
+        self.audit.write(
+            status="suggested",
+            action="suggest_device",
+            command=f"discover {entity_id}",
+            detail=f"suggested_alias={suggested_alias}; topic={topic}",
+            source="agent",
+            entity_id=entity_id,
+            mode=mode,
+        )
+
+
+class SuggestionEngine(Stage):
+    name = "suggestion"
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        write_api: Any,
+        suggest: Callable[..., str] = ollama_suggest,
+    ) -> None:
+        super().__init__()
+        self.config = config
+        self.write_api = write_api
+        self.suggest = suggest
+
+    def process(self, topic: str, payload: str) -> None:
+        try:
+            suggestion = self.suggest(
+                ollama_url=self.config.ollama_url,
+                model=self.config.suggestion_ollama_model,
+                timeout=self.config.suggestion_http_timeout,
+                text=f"topic={topic} payload={payload}",
+            )
+            suggestion_point = (
+                Point("agent_suggestion")
+                .tag("topic", topic)
+                .field("suggestion", suggestion[:5000])
+                .time(time.time_ns(), WritePrecision.NS)
+            )
+            self.write_api.write(bucket=self.config.influx_bucket, record=suggestion_point)
+        except Exception as exc:
+            print("influx write agent_suggestion failed:", exc, flush=True)
+
+
+class ActionExecutor(Stage):
+    """Parses commands, applies guardrails, calls Home Assistant and reports results.
+
+    `ha_executor` and `llm_parser` default to the real HTTP implementations and can
+    be swapped for stand-ins when benchmarking.
+    """
+
+    name = "action"
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        state: AgentState,
+        publisher: ResultPublisher,
+        audit: AuditWriter,
+        ha_executor: Callable[..., tuple[bool, str]] = execute_home_assistant_action,
+        llm_parser: Callable[..., tuple[list[dict[str, Any]], str]] = parse_ollama_action_plan,
+    ) -> None:
+        super().__init__()
+        self.config = config
+        self.state = state
+        self.publisher = publisher
+        self.audit = audit
+        self.ha_executor = ha_executor
+        self.llm_parser = llm_parser
+        self.speculation = (
+            SpeculativeParser(config.action_speculative_max_inflight)
+            if config.action_speculative_parse_enabled or config.action_partial_warm_enabled
+            else None
+        )
+        self.partial_warmer = (
+            PartialParseWarmer(self.speculation) if config.action_partial_warm_enabled else None
+        )
+        self.semantic = (
+            SemanticResolver(
+                embed=lambda texts: ollama_embed(
+                    ollama_url=config.ollama_url,
+                    model=config.action_embedding_model,
+                    timeout=config.action_embedding_timeout,
+                    texts=texts,
+                ),
+                model=config.action_embedding_model,
+                cache_dir=config.action_semantic_cache_dir,
+                min_score=config.action_semantic_min_score,
+                min_margin=config.action_semantic_min_margin,
+                intent_min_margin=config.action_semantic_intent_min_margin,
+            )
+            if config.action_semantic_resolver_enabled
+            else None
+        )
+        # Guardrail state (mode, rate limiter, flip cooldowns) is shared by both
+        # command lanes; read and update it only while holding guard_lock.
+        self.guard_lock = threading.RLock()
+        self.last_command_ts = 0.0
+        self.last_entity_action: dict[str, tuple[str, float]] = {}
+
+    def process(
+        self,
+        item: ActionItem,
+        speculative: Future | None = None,
+    ) -> dict[str, Any] | None:
+        item_type, raw_payload, inbound_source, received_ts = item
+        if item_type == "mode_set":
+            self.set_mode(raw_payload, inbound_source)
+            return None
+        return self.handle_command(raw_payload, received_ts, speculative)
+
+    def set_mode(self, raw_payload: str, inbound_source: str) -> None:
+        requested = raw_payload.strip().lower()
+        if requested not in VALID_ACTION_MODES:
+            detail = f"invalid mode '{requested}', expected suggest|ask|auto"
+            self.audit.write(
+                status="rejected",
+                action="set_mode",
+                command=raw_payload,
+                detail=detail,
+                source=inbound_source,
+                entity_id="none",
+                mode=self.state.current_mode,
+            )
+            return
+        with self.guard_lock:
+            self.state.current_mode = requested
+        detail = f"mode set to {requested}"
+        self.publisher.publish_mode(mode=requested, source=inbound_source, detail=detail)
+        self.audit.write(
+            status="mode_change",
+            action="set_mode",
+            command=raw_payload,
+            detail=detail,
+            source=inbound_source,
+            entity_id="none",
+            mode=requested,
+        )
+
+    def handle_command(
+        self,
+        raw_payload: str,
+        received_ts: float,
+        speculative: Future | None = None,
+    ) -> dict[str, Any]:
+        command_text = ""
+        source = "manual"
+        status = "rejected"
+        detail = ""
+        action = ""
+        outlet = 0
+        entity_id = ""
+        executed_steps: list[dict[str, Any]] = []
+        capability_rows: list[dict[str, Any]] = []
+
+        try:
+            command_text, source, confirm, payload_detail = parse_command_payload(raw_payload)
+            device_action, device_entity_id, device_alias, device_detail = (
+                parse_device_management_payload(raw_payload)
+            )
+            if device_action is None:
+                device_action, device_entity_id, device_alias, device_detail = (
+                    parse_device_management_command(command_text)
+                )
+
+            current_alias_map: dict[str, str] = {}
+            if device_action is not None:
+                action = f"{device_action}_device"
+                entity_id = device_entity_id or "none"
+                status, detail = self.manage_device(
+                    device_action,
+                    device_entity_id,
+                    device_alias,
+                    device_detail,
+                    time.time(),
+                )
+            else:
+                current_alias_map = self.state.alias_map()
+                is_cap_query, cap_targets, cap_detail = parse_capability_query(
+                    command_text,
+                    current_alias_map,
+                )
+                if is_cap_query:
+                    action = "capabilities"
+                    status = "executed"
+                    capability_rows, entity_id, outlet, detail = self.describe_capabilities(
+                        cap_targets,
+                        current_alias_map,
+                        [payload_detail, cap_detail],
+                    )
+
+            guard_detail = "" if status != "rejected" or action else self.guardrail_rejection()
+            if guard_detail:
+                status = "rejected"
+                detail = guard_detail
+            elif status == "rejected" and not action:
+                planned_steps, detail = self.plan(
+                    command_text,
+                    current_alias_map,
+                    parse_command_request_id(raw_payload),
+                    speculative,
+                )
+                speculative = None
+                if not planned_steps:
+                    status = "rejected"
+                else:
+                    with self.guard_lock:
+                        # The other lane may have executed or changed mode while this
+                        # command was being parsed, so check again before executing.
+                        # Guardrails compare execution times, not arrival times:
+                        # lanes finish out of order, and received_ts is only used
+                        # for latency metrics.
+                        now = time.time()
+                        guard_detail = self.guardrail_rejection(now)
+                        if guard_detail:
+                            status = "rejected"
+                            detail = guard_detail
+                        elif self.state.current_mode == "ask" and not confirm:
+                            status = "rejected"
+                            detail = (
+                                f"mode=ask requires confirmation; planned {len(planned_steps)} "
+                                f"step(s); resend: confirm {command_text}"
+                            )
+                        else:
+                            status, action, outlet, entity_id, detail, executed_steps = (
+                                self.execute_plan(
+                                    planned_steps,
+                                    current_alias_map,
+                                    now,
+                                    payload_detail,
+                                    detail,
+                                )
+                            )
+        except Exception as exc:
+            status = "failed"
+            detail = f"action worker exception: {exc}"
+        if speculative is not None:
+            # Rejected before planning (guardrail, device management, error).
+            self.speculation.discard(speculative)
+
+        return self.report(
+            status=status,
+            command=command_text or raw_payload,
+            action=action,
+            outlet=outlet,
+            entity_id=entity_id,
+            source=source,
+            detail=detail,
+            steps=executed_steps,
+            capabilities=capability_rows,
+            request_id=parse_command_request_id(raw_payload),
+            received_ts=received_ts,
+        )
+
+    def report(
+        self,
+        *,
+        status: str,
+        command: str,
+        action: str,
+        outlet: int,
+        entity_id: str,
+        source: str,
+        detail: str,
+        steps: list[dict[str, Any]] | None = None,
+        capabilities: list[dict[str, Any]] | None = None,
+        request_id: str = "",
+        received_ts: float | None = None,
+    ) -> dict[str, Any]:
+        result = {
+            "status": status,
+            "command": command,
+            "action": action or "none",
+            "outlet": outlet,
+            "entity_id": entity_id or "none",
+            "source": source,
+            "mode": self.state.current_mode,
+            "detail": detail,
+            "steps": steps or [],
+            "time": time.time(),
+        }
+        if capabilities:
+            result["capabilities"] = capabilities
+        if request_id:
+            result["request_id"] = request_id
+
+        self.publisher.publish_action_result(result)
+        self.audit.write(
+            status=status,
+            action=action or "none",
+            command=command,
+            detail=detail,
+            source=source,
+            entity_id=entity_id or "none",
+            mode=self.state.current_mode,
+            latency_seconds=None if received_ts is None else time.time() - received_ts,
+        )
+        return result
+
+    def reject_overloaded(self, raw_payload: str, source: str, detail: str) -> dict[str, Any]:
+        command_text, _, _, _ = parse_command_payload(raw_payload)
+        return self.report(
+            status="rejected",
+            command=command_text or raw_payload,
+            action="",
+            outlet=0,
+            entity_id="",
+            source=source,
+            detail=detail,
+            request_id=parse_command_request_id(raw_payload),
+        )
+
+    def manage_device(
+        self,
+        device_action: str,
+        device_entity_id: str,
+        device_alias: str,
+        device_detail: str,
+        now: float,
+    ) -> tuple[str, str]:
+        state = self.state
+        if not is_valid_entity_id(device_entity_id):
+            return "rejected", f"{device_detail}; invalid entity_id '{device_entity_id}'"
+
+        if device_action != "approve":
+            with state.lock:
+                removed = state.pending_device_suggestions.pop(device_entity_id, None)
+                state.discovery_last_published_at[device_entity_id] = now
+            if removed is None:
+                return "executed", (
+                    f"{device_detail}; no pending suggestion for {device_entity_id}, cooldown updated"
+                )
+            return "executed", f"{device_detail}; rejected suggestion for {device_entity_id}"
+
+        alias_to_use = _normalize_alias(device_alias)
+        save_required = False
+        with state.lock:
+            alias_map = merge_entity_alias_maps(
+                state.extra_entity_alias_map,
+                state.dynamic_entity_alias_map,
+            )
+            if not alias_to_use:
+                pending_alias = state.pending_device_suggestions.get(device_entity_id, {}).get(
+                    "suggested_alias",
+                    "",
+                )
+                alias_to_use = _normalize_alias(
+                    pending_alias or suggest_alias_from_entity_id(device_entity_id)
+                )
+            if not alias_to_use:
+                status = "rejected"
+                detail = f"{device_detail}; could not infer alias for {device_entity_id}"
+            elif (
+                alias_to_use in state.extra_entity_alias_map
+                and state.extra_entity_alias_map[alias_to_use] != device_entity_id
+            ):
+                status = "rejected"
+                detail = f"{device_detail}; alias '{alias_to_use}' is reserved by static config"
+            elif alias_to_use in alias_map and alias_map[alias_to_use] != device_entity_id:
+                status = "rejected"
+                detail = (
+                    f"{device_detail}; alias '{alias_to_use}' already maps to {alias_map[alias_to_use]}"
+                )
+            else:
+                state.dynamic_entity_alias_map[alias_to_use] = device_entity_id
+                state.allowed_entity_ids.add(device_entity_id)
+                state.inventory.add_alias(alias_to_use, device_entity_id)
+                state.pending_device_suggestions.pop(device_entity_id, None)
+                state.discovery_last_published_at[device_entity_id] = now
+                save_required = True
+                status = "executed"
+                detail = f"{device_detail}; approved {device_entity_id} as alias '{alias_to_use}'"
+        if save_required:
+            try:
+                save_dynamic_entity_alias_map(
+                    self.config.action_dynamic_alias_store_path,
+                    state.dynamic_entity_alias_map,
+                )
+            except Exception as exc:
+                status = "failed"
+                detail = f"{detail}; failed to persist aliases: {exc}"
+            self.publisher.publish_capability_inventory(state.inventory.document())
+            if self.semantic is not None:
+                # Embed the new alias now rather than on the next fallback command.
+                try:
+                    self.semantic.sync(
+                        state.outlet_entity_map,
+                        state.alias_map(),
+                        state.inventory.version,
+                    )
+                except Exception as exc:
+                    print("embedding index update failed:", exc, flush=True)
+        return status, detail
+
+    def describe_capabilities(
+        self,
+        cap_targets: list[dict[str, Any]],
+        current_alias_map: dict[str, str],
+        detail_parts: list[str],
+    ) -> tuple[list[dict[str, Any]], str, int, str]:
+        state = self.state
+        entity_id = ""
+        outlet = 0
+        if cap_targets:
+            capability_rows: list[dict[str, Any]] = []
+            for target in cap_targets:
+                target_outlet = int(target.get("outlet", 0))
+                target_alias = str(target.get("entity_alias", "")).strip().lower()
+                target_entity = state.resolve_entity(target_outlet, target_alias, current_alias_map)
+                target_label = (
+                    f"plug {target_outlet}" if target_outlet in {1, 2, 3, 4} else target_alias
+                )
+                if not target_entity:
+                    capability_rows.append(
+                        {
+                            "target": target_label,
+                            "status": "unknown",
+                            "detail": "target not resolved",
+                        }
+                    )
+                    continue
+                row = state.inventory.row_for(target_label, target_entity)
+                if row is None:
+                    row = capability_row(
+                        target_label,
+                        target_entity,
+                        target_entity in state.allowed_entity_ids,
+                    )
+                capability_rows.append(row)
+            detail_parts.append(f"found {len(capability_rows)} target(s); see capabilities field")
+            entity_id = str(capability_rows[0].get("entity_id", "none"))
+            outlet = int(cap_targets[0].get("outlet", 0))
+        else:
+            capability_rows = state.inventory.rows()
+            detail_parts.append(f"showing {len(capability_rows)} controllable target(s)")
+            entity_id = "multiple"
+        detail = "; ".join(part for part in detail_parts if part)
+        return capability_rows, entity_id, outlet, detail
+
+    def answer_capability_query(self, raw_payload: str) -> dict[str, Any] | None:
+        """Report a capability/inventory query straight from the inventory cache.
+
+        Returns None for anything else so the caller can queue it as usual.
+        """
+        command_text, source, _, payload_detail = parse_command_payload(raw_payload)
+        if parse_device_management_payload(raw_payload)[0] is not None:
+            return None
+        if parse_device_management_command(command_text)[0] is not None:
+            return None
+        current_alias_map = self.state.alias_map()
+        is_cap_query, cap_targets, cap_detail = parse_capability_query(
+            command_text,
+            current_alias_map,
+        )
+        if not is_cap_query:
+            return None
+        capability_rows, entity_id, outlet, detail = self.describe_capabilities(
+            cap_targets,
+            current_alias_map,
+            [payload_detail, cap_detail],
+        )
+        return self.report(
+            status="executed",
+            command=command_text or raw_payload,
+            action="capabilities",
+            outlet=outlet,
+            entity_id=entity_id,
+            source=source,
+            detail=detail,
+            capabilities=capability_rows,
+            request_id=parse_command_request_id(raw_payload),
+        )
+
+    def guardrail_rejection(self, now: float | None = None) -> str:
+        with self.guard_lock:
+            now = time.time() if now is None else now
+            rate_limit = self.config.action_rate_limit_seconds
+            if rate_limit > 0 and (now - self.last_command_ts) < rate_limit:
+                return (
+                    "rate limited: wait at least "
+                    f"{self.config.action_rate_limit_seconds:.1f}s between commands"
+                )
+            if self.state.current_mode == "suggest":
+                return "mode=suggest: action execution disabled"
+        return ""
+
+    def needs_llm_parse(self, command_text: str) -> bool:
+        if not self.config.action_parse_with_ollama:
+            return False
+        if parse_device_management_command(command_text)[0] is not None:
+            return False
+        current_alias_map = self.state.alias_map()
+        if parse_capability_query(command_text, current_alias_map)[0]:
+            return False
+        planned_steps, _ = parse_direct_action_plan(
+            command_text,
+            extra_entity_alias_map=current_alias_map,
+        )
+        return not planned_steps
+
+    def lane_for(self, raw_payload: str) -> str:
+        """`fast` for commands that never reach the LLM parser, `slow` otherwise."""
+        command_text, _, _, _ = parse_command_payload(raw_payload)
+        if parse_device_management_payload(raw_payload)[0] is not None:
+            return "fast"
+        return "slow" if self.needs_llm_parse(command_text) else "fast"
+
+    def start_speculative_parse(self, raw_payload: str) -> Future | None:
+        """Start the LLM parse for a slow-lane command while it waits in the queue.
+
+        Only call this for commands `lane_for` routed to the slow lane: the rule
+        parser has already failed for them, so the call is never wasted on a
+        command the rules resolve. `handle_command` uses or discards the future.
+        """
+        if (
+            self.speculation is None
+            or not self.config.action_speculative_parse_enabled
+            or not self.config.action_parse_with_ollama
+        ):
+            return None
+        command_text, source, _, _ = parse_command_payload(raw_payload)
+        if source not in self.config.action_speculative_parse_sources:
+            return None
+        with self.guard_lock:
+            if self.state.current_mode == "suggest":
+                # handle_command rejects it before planning; keep the budget.
+                return None
+        request_id = parse_command_request_id(raw_payload)
+        if (
+            self.partial_warmer is not None
+            and request_id
+            and self.partial_warmer.has(request_id, command_text)
+        ):
+            return None
+        return self.speculation.start(
+            self.llm_parser,
+            **self.llm_kwargs(command_text, self.state.alias_map()),
+        )
+
+    def warm_from_partial(self, raw_payload: str) -> bool:
+        """Start the LLM parse for a partial voice transcript before the final command.
+
+        The final command must carry the partial's `utterance_id` as its
+        `request_id`; `plan` then reuses the warm parse when the text matches.
+        """
+        if self.partial_warmer is None:
+            return False
+        try:
+            partial = json.loads(raw_payload)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(partial, dict):
+            return False
+        utterance_id = str(partial.get("utterance_id", "")).strip()[:128]
+        command_text = str(partial.get("command", "")).strip()
+        if not utterance_id or not command_text or not self.needs_llm_parse(command_text):
+            return False
+        return self.partial_warmer.warm(
+            utterance_id,
+            command_text,
+            time.time(),
+            self.llm_parser,
+            self.llm_kwargs(command_text, self.state.alias_map()),
+        )
+
+    def semantic_plan(
+        self,
+        command_text: str,
+        current_alias_map: dict[str, str],
+    ) -> tuple[list[dict[str, Any]], str]:
+        try:
+            self.semantic.sync(
+                self.state.outlet_entity_map,
+                current_alias_map,
+                self.state.inventory.version,
+            )
+        except Exception as exc:
+            return [], f"embedding index unavailable: {exc}"
+        return self.semantic.resolve(command_text)
+
+    def llm_kwargs(self, command_text: str, current_alias_map: dict[str, str]) -> dict[str, Any]:
+        return {
+            "ollama_url": self.config.ollama_url,
+            "model": self.config.action_parse_ollama_model,
+            "timeout": self.config.action_parse_timeout,
+            "text": command_text,
+            "extra_entity_alias_map": current_alias_map,
+        }
+
+    def plan(
+        self,
+        command_text: str,
+        current_alias_map: dict[str, str],
+        request_id: str = "",
+        speculative: Future | None = None,
+    ) -> tuple[list[dict[str, Any]], str]:
+        llm_kwargs = self.llm_kwargs(command_text, current_alias_map)
+        if speculative is None and self.partial_warmer is not None and request_id:
+            speculative = self.partial_warmer.take(request_id, command_text, time.time())
+        planned_steps, detail = parse_direct_action_plan(
+            command_text,
+            extra_entity_alias_map=current_alias_map,
+        )
+        if not planned_steps and self.semantic is not None:
+            with self.timed("action_semantic_resolve"):
+                semantic_steps, semantic_detail = self.semantic_plan(command_text, current_alias_map)
+            if semantic_steps:
+                planned_steps = semantic_steps
+                detail = f"{detail}; {semantic_detail}" if detail else semantic_detail
+            elif semantic_detail:
+                detail = f"{detail}; {semantic_detail}" if detail else semantic_detail
+        if planned_steps and speculative is not None:
+            self.speculation.discard(speculative)
+        if not planned_steps and self.config.action_parse_with_ollama:
+            with self.timed("action_llm_parse"):
+                if speculative is not None:
+                    parsed_steps, parsed_detail = self.speculation.use(speculative)
+                else:
+                    parsed_steps, parsed_detail = self.llm_parser(**llm_kwargs)
+            if parsed_steps:
+                planned_steps = parsed_steps
+                detail = f"{detail}; {parsed_detail}" if detail else parsed_detail
+            elif parsed_detail:
+                detail = f"{detail}; {parsed_detail}" if detail else parsed_detail
+        return planned_steps, detail
+
+    def execute_plan(
+        self,
+        planned_steps: list[dict[str, Any]],
+        current_alias_map: dict[str, str],
+        now: float,
+        payload_detail: str,
+        plan_detail: str,
+    ) -> tuple[str, str, int, str, str, list[dict[str, Any]]]:
+        config = self.config
+        executed_steps: list[dict[str, Any]] = []
+        step_summaries: list[str] = []
+        executed_count = 0
+        failed_count = 0
+        rejected_count = 0
+
+        for idx, step in enumerate(planned_steps, start=1):
+            step_action = str(step.get("action", ""))
+            step_outlet = int(step.get("outlet", 0))
+            step_alias = str(step.get("entity_alias", "")).strip().lower()
+            step_entity_id = self.state.resolve_entity(step_outlet, step_alias, current_alias_map)
+
+            if not step_entity_id:
+                step_status = "rejected"
+                step_detail = (
+                    f"step {idx}: unresolved target "
+                    f"(outlet={step_outlet}, alias='{step_alias}')"
+                )
+            elif step_entity_id not in self.state.allowed_entity_ids:
+                step_status = "rejected"
+                step_detail = f"step {idx}: entity {step_entity_id} not in allowlist"
+            elif not config.ha_token:
+                step_status = "rejected"
+                step_detail = f"step {idx}: HA_TOKEN is empty"
+            else:
+                prev = self.last_entity_action.get(step_entity_id)
+                if (
+                    prev
+                    and prev[0] in {"turn_on", "turn_off"}
+                    and step_action in {"turn_on", "turn_off"}
+                    and prev[0] != step_action
+                    and (now - prev[1]) < config.action_flip_cooldown_seconds
+                ):
+                    step_status = "rejected"
+                    step_detail = (
+                        f"step {idx}: cooldown active for {step_entity_id}; "
+                        f"wait {config.action_flip_cooldown_seconds:.1f}s before flip"
+                    )
+                else:
+                    with self.timed("action_ha_call"):
+                        ok, exec_detail = self.ha_executor(
+                            ha_url=config.ha_url,
+                            ha_token=config.ha_token,
+                            action=step_action,
+                            entity_id=step_entity_id,
+                            timeout=config.action_http_timeout,
+                            step=step,
+                        )
+                    step_status = "executed" if ok else "failed"
+                    step_detail = f"step {idx}: {exec_detail}"
+                    if step_status == "executed":
+                        self.last_entity_action[step_entity_id] = (step_action, now)
+
+            if step_status == "executed":
+                executed_count += 1
+            elif step_status == "failed":
+                failed_count += 1
+            else:
+                rejected_count += 1
+
+            step_label = (
+                f"plug {step_outlet}"
+                if step_outlet in {1, 2, 3, 4}
+                else (step_alias or step_entity_id or "unknown")
+            )
+            step_summaries.append(
+                f"{idx}/{len(planned_steps)} {step_action} {step_label}: {step_status}"
+            )
+            executed_steps.append(
+                {
+                    "index": idx,
+                    "action": step_action,
+                    "outlet": step_outlet,
+                    "entity_alias": step_alias,
+                    "entity_id": step_entity_id or "none",
+                    "status": step_status,
+                    "detail": step_detail,
+                    "percentage": int(step.get("percentage", 0))
+                    if step.get("percentage") is not None
+                    else 0,
+                    "oscillating": step.get("oscillating") if "oscillating" in step else None,
+                    "preset_mode": str(step.get("preset_mode", ""))
+                    if step.get("preset_mode") is not None
+                    else "",
+                    "pulse_seconds": float(step.get("pulse_seconds", 0))
+                    if step.get("pulse_seconds") is not None
+                    else 0.0,
+                }
+            )
+
+        if executed_count == len(planned_steps):
+            status = "executed"
+        elif executed_count > 0 or failed_count > 0:
+            status = "failed"
+        else:
+            status = "rejected"
+
+        first = planned_steps[0]
+        first_outlet = int(first.get("outlet", 0))
+        first_alias = str(first.get("entity_alias", "")).strip().lower()
+        first_entity = self.state.resolve_entity(first_outlet, first_alias, current_alias_map)
+        if len(planned_steps) == 1:
+            action = str(first.get("action", ""))
+            outlet = first_outlet
+            entity_id = first_entity or "none"
+        else:
+            action = "multi"
+            outlet = 0
+            entity_id = "multiple"
+
+        detail = (
+            f"{payload_detail}; {plan_detail}; "
+            f"executed={executed_count}/{len(planned_steps)}; "
+            f"failed={failed_count}; rejected={rejected_count}; "
+            + " | ".join(step_summaries)
+        )
+        if status == "executed":
+            self.last_command_ts = now
+        return status, action, outlet, entity_id, detail, executed_steps
+
+
+class AgentPipeline:
+    """Wires the agent stages together with explicit queues between them.
+
+    Inbound MQTT messages run ingest -> classify -> (discovery inline |
+    action queue | suggestion queue). Commands that need the LLM parser go to a
+    separate slow action lane so deterministic commands never wait behind them.
+    Any stage can be replaced through the constructor, and every stage reports
+    timings into `metrics`.
+    """
+
+    def __init__(
+        self,
+        config: AgentConfig,
+        client: Any,
+        write_api: Any,
+        *,
+        metrics: PipelineMetrics | None = None,
+        ingest: IngestWriter | None = None,
+        classifier: TopicClassifier | None = None,
+        discovery: DeviceDiscovery | None = None,
+        executor: ActionExecutor | None = None,
+        suggestions: SuggestionEngine | None = None,
+    ) -> None:
+        self.config = config
+        self.client = client
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.state = AgentState(config)
+        self.rollup = (
+            ActionRollup(write_api, config.influx_bucket) if config.action_rollup_enabled else None
+        )
+        self.audit = AuditWriter(write_api, config.influx_bucket, self.rollup)
+        self.publisher = ResultPublisher(client, config)
+
+        # Raw MQTT history may live in its own database so it can carry a retention period.
+        raw_bucket = config.influx_raw_bucket or config.influx_bucket
+        self.ingest = ingest or IngestWriter(write_api, raw_bucket)
+        self.downsampler = (
+            EventDownsampler(
+                query_sql=lambda query: influx_query_sql(
+                    config.influx_url,
+                    config.influx_token,
+                    raw_bucket,
+                    query,
+                ),
+                write_api=write_api,
+                bucket=config.influx_bucket,
+                state_path=config.downsample_state_path,
+                after_hours=config.downsample_after_hours,
+                backfill_hours=config.downsample_backfill_hours,
+            )
+            if config.downsample_enabled
+            else None
+        )
+        self.classifier = classifier or TopicClassifier(config)
+        self.discovery = discovery or DeviceDiscovery(
+            config,
+            self.state,
+            self.publisher,
+            self.audit,
+        )
+        self.executor = executor or ActionExecutor(
+            config,
+            self.state,
+            self.publisher,
+            self.audit,
+        )
+        self.suggestions = suggestions or SuggestionEngine(config, write_api)
+        self.admission = AdmissionController(
+            config.action_source_rate_limits,
+            config.action_source_priorities,
+            headroom_per_priority=config.action_admission_headroom_per_priority,
+        )
+        self._action_seq = itertools.count()
+        self.dedup = CommandDeduplicator(
+            config.action_dedup_window_seconds,
+            config.action_dedup_request_id_window_seconds,
+            max_entries=config.action_dedup_max_entries,
+        )
+        self._dedup_lock = threading.Lock()
+        self._dedup_pending: dict[int, DedupEntry] = {}
+        self._speculative_pending: dict[int, Future] = {}
+        for stage in self.stages():
+            stage.add_timing_hook(self.metrics.record)
+        if self.executor.speculation is not None:
+            self.executor.speculation.add_count_hook(self.metrics.count)
+
+        self.suggestion_queue: queue.Queue[tuple[str, str]] = self.metrics.register_queue(
+            "suggestion",
+            MonitoredQueue(maxsize=config.suggestion_queue_max),
+        )
+        self.action_queue: queue.Queue[QueuedAction] = self.metrics.register_queue(
+            "action",
+            MonitoredPriorityQueue(maxsize=config.action_queue_max),
+        )
+        self.action_slow_queue: queue.Queue[QueuedAction] = self.metrics.register_queue(
+            "action_slow",
+            MonitoredPriorityQueue(maxsize=config.action_slow_queue_max),
+        )
+
+    def stages(self) -> list[Stage]:
+        return [self.ingest, self.classifier, self.discovery, self.executor, self.suggestions]
+
+    def attach(self, client: Any) -> None:
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_message = self.on_message
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        print("MQTT connected rc=", rc, flush=True)
+        self.publisher.on_connect(properties)
+        subscribe_result, _ = client.subscribe(TOPIC)
+        print("MQTT subscribe rc=", subscribe_result, "topic=", TOPIC, flush=True)
+        if self.config.action_bridge_enabled:
+            self.publisher.publish_mode(
+                mode=self.state.current_mode,
+                source="agent_boot",
+                detail="published current mode on connect",
+            )
+            self.publisher.publish_capability_inventory(self.state.inventory.document())
+
+    def on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
+        print("MQTT disconnected reason=", reason_code, flush=True)
+
+    def on_message(self, client, userdata, msg):
+        try:
+            payload = msg.payload.decode("utf-8", errors="replace")
+        except Exception:
+            payload = str(msg.payload)
+        self.handle_message(msg.topic, payload)
+
+    def handle_message(self, topic: str, payload: str) -> None:
+        self.metrics.count("messages")
+        with self.metrics.time_stage("on_message"):
+            self.ingest.run(topic, payload)
+            for route in self.classifier.run(topic):
+                if route in {"command", "mode_set"}:
+                    self.submit_action(route, payload, "mqtt")
+                elif route == "suggestion":
+                    try:
+                        self.suggestion_queue.put_nowait((topic, payload))
+                    except queue.Full:
+                        print("suggestion queue full; dropping topic=", topic, flush=True)
+                elif route == "discovery":
+                    self.discovery.run(topic, payload)
+                elif route == "voice_partial":
+                    self.executor.warm_from_partial(payload)
+
+    def submit_action(self, item_type: str, payload: str, source: str) -> bool:
+        item = (item_type, payload, source, time.time())
+        if item_type == "mode_set":
+            try:
+                self.action_queue.put_nowait((CONTROL_PRIORITY, next(self._action_seq), item))
+            except queue.Full:
+                print("action queue full; dropping mode payload", flush=True)
+                return False
+            return True
+
+        command_text, command_source, confirm, _ = parse_command_payload(payload)
+        dedup_key = CommandDeduplicator.make_key(
+            command_text,
+            command_source,
+            parse_command_request_id(payload),
+            confirm,
+        )
+        entry, cached = self.dedup.check(dedup_key)
+        if entry is None:
+            # Duplicates skip admission, parsing, HA and audit entirely.
+            self.metrics.count("dedup_duplicates")
+            if cached is not None:
+                self.publisher.publish_action_result(replayed_result(cached))
+            return True
+
+        slow = (
+            self.config.action_lanes_enabled or self.config.action_speculative_parse_enabled
+        ) and self.executor.lane_for(payload) == "slow"
+        action_queue = self.action_queue
+        if slow and self.config.action_lanes_enabled:
+            action_queue = self.action_slow_queue
+        # Admission runs before queueing so overload is reported immediately
+        # instead of after the command has waited behind the backlog.
+        priority = self.admission.priority_for(command_source)
+        if self.config.action_admission_enabled:
+            admitted, reason = self.admission.admit(
+                command_source,
+                action_queue.qsize(),
+                action_queue.maxsize,
+            )
+            if not admitted:
+                self.dedup.abort(entry)
+                self.metrics.count(f"admission_rejected.{command_source}")
+                self.executor.reject_overloaded(payload, command_source, reason)
+                return False
+        if self.config.action_capability_fast_path:
+            # Inventory queries are answered from cache on the MQTT thread so they
+            # never wait behind (or delay) real actions in the action queue. They
+            # still pass dedup and admission, so a burst cannot republish the
+            # inventory past the source's token bucket.
+            try:
+                with self.metrics.time_stage("capability_query"):
+                    answered = self.executor.answer_capability_query(payload)
+            except Exception as exc:
+                print("capability fast path failed:", exc, flush=True)
+                answered = None
+            if answered is not None:
+                self.metrics.count("capability_queries")
+                for _ in range(self.dedup.complete(entry, answered)):
+                    self.publisher.publish_action_result(replayed_result(answered))
+                return True
+        seq = next(self._action_seq)
+        # Rules already failed for slow commands, so the LLM parse can start
+        # now and overlap the queue wait.
+        speculative = self.executor.start_speculative_parse(payload) if slow else None
+        with self._dedup_lock:
+            self._dedup_pending[seq] = entry
+            if speculative is not None:
+                self._speculative_pending[seq] = speculative
+        try:
+            action_queue.put_nowait((priority, seq, item))
+        except queue.Full:
+            with self._dedup_lock:
+                self._dedup_pending.pop(seq, None)
+                speculative = self._speculative_pending.pop(seq, None)
+            if speculative is not None:
+                self.executor.speculation.discard(speculative)
+            self.dedup.abort(entry)
+            self.metrics.count(f"admission_rejected.{command_source}")
+            self.executor.reject_overloaded(
+                payload,
+                command_source,
+                f"overloaded: {action_queue.name} queue full ({action_queue.maxsize})",
+            )
+            return False
+        return True
+
+    def process_action(self, queued: QueuedAction) -> dict[str, Any] | None:
+        _, seq, item = queued
+        self.metrics.record("action_queue_wait", max(0.0, time.time() - item[3]))
+        with self._dedup_lock:
+            entry = self._dedup_pending.pop(seq, None)
+            speculative = self._speculative_pending.pop(seq, None)
+        try:
+            result = self.executor.run(item, speculative)
+        except Exception:
+            if entry is not None:
+                self.dedup.abort(entry)
+            raise
+        if entry is not None and result is not None:
+            for _ in range(self.dedup.complete(entry, result)):
+                self.publisher.publish_action_result(replayed_result(result))
+        return result
+
+    def action_worker(self, action_queue: queue.Queue[QueuedAction] | None = None) -> None:
+        action_queue = self.action_queue if action_queue is None else action_queue
+        while True:
+            queued = action_queue.get()
+            try:
+                self.process_action(queued)
+            finally:
+                action_queue.task_done()
+
+    def suggestion_worker(self) -> None:
+        while True:
+            topic, payload = self.suggestion_queue.get()
+            try:
+                self.suggestions.run(topic, payload)
+            finally:
+                self.suggestion_queue.task_done()
+
+    def rollup_worker(self) -> None:
+        while True:
+            time.sleep(self.config.action_rollup_flush_seconds)
+            self.rollup.flush()
+
+    def downsample_worker(self) -> None:
+        while True:
+            try:
+                summary = self.downsampler.run_once(time.time())
+                if summary["hours"]:
+                    print("downsampled mqtt_event:", summary, flush=True)
+            except Exception as exc:
+                print("mqtt_event downsampling failed:", exc, flush=True)
+            time.sleep(self.config.downsample_interval_seconds)
+
+    def drain(self) -> int:
+        """Process queued work on the calling thread; used by tests and stage benchmarks."""
+        processed = 0
+        for action_queue in (self.action_queue, self.action_slow_queue):
+            while True:
+                try:
+                    queued = action_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self.process_action(queued)
+                finally:
+                    action_queue.task_done()
+                processed += 1
+        while True:
+            try:
+                topic, payload = self.suggestion_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.suggestions.run(topic, payload)
+            finally:
+                self.suggestion_queue.task_done()
+            processed += 1
+        return processed
+
+    def start_workers(self) -> None:
+        threading.Thread(target=self.suggestion_worker, daemon=True).start()
+        if self.rollup is not None:
+            threading.Thread(target=self.rollup_worker, daemon=True).start()
+        if self.downsampler is not None:
+            threading.Thread(target=self.downsample_worker, daemon=True).start()
+        if self.config.action_bridge_enabled:
+            threading.Thread(target=self.action_worker, daemon=True).start()
+            threading.Thread(
+                target=self.action_worker,
+                args=(self.action_slow_queue,),
+                daemon=True,
+            ).start()
@@ -0,0 +1,443 @@
+import argparse
+import json
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import paho.mqtt.client as mqtt
+
+from agent.main import influx_query_sql
+from agent.metrics import PipelineMetrics
+from agent.pipeline import AgentConfig, AgentPipeline
+
+CaptureMessage = tuple[float, str, str]
+
+
+def _parse_capture_time(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        number = float(value)
+        # Influx line-protocol captures use nanoseconds.
+        return number / 1e9 if number > 1e12 else number
+    text = str(value).strip()
+    if not text:
+        return 0.0
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return _parse_capture_time(float(text))
+    text = text.replace("Z", "+00:00")
+    match = re.match(r"^(.*T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(.*)$", text)
+    if match:
+        fraction = (match.group(2) or "")[:6]
+        text = match.group(1) + (f".{fraction}" if fraction else "") + match.group(3)
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _capture_row_to_message(row: dict[str, Any]) -> CaptureMessage | None:
+    topic = str(row.get("topic", "")).strip()
+    if not topic:
+        return None
+    payload = row.get("payload", "")
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=True)
+    return _parse_capture_time(row.get("time", 0.0)), topic, payload
+
+
+def load_capture_jsonl(file_path: str) -> list[CaptureMessage]:
+    messages: list[CaptureMessage] = []
+    with open(file_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(row, dict):
+                continue
+            message = _capture_row_to_message(row)
+            if message is not None:
+                messages.append(message)
+    messages.sort(key=lambda item: item[0])
+    return messages
+
+
+def load_capture_from_influx(
+    influx_url: str,
+    influx_token: str,
+    database: str,
+    since_minutes: int,
+    limit: int,
+    timeout: int = 60,
+) -> list[CaptureMessage]:
+    query = (
+        "SELECT time, topic, payload FROM mqtt_event "
+        f"WHERE time >= now() - INTERVAL '{int(since_minutes)} minutes' "
+        f"ORDER BY time LIMIT {int(limit)}"
+    )
+    rows = influx_query_sql(influx_url, influx_token, database, query, timeout=timeout)
+    messages: list[CaptureMessage] = []
+    for row in rows:
+        message = _capture_row_to_message(row)
+        if message is not None:
+            messages.append(message)
+    messages.sort(key=lambda item: item[0])
+    return messages
+
+
+class FakeMqttMessage:
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+        self.retain = False
+
+
+class FakePublishResult:
+    def __init__(self, rc: int = mqtt.MQTT_ERR_SUCCESS) -> None:
+        self.rc = rc
+        self.mid = 0
+
+
+class FakeMqttClient:
+    """In-process MQTT client that delivers injected and looped-back messages."""
+
+    def __init__(self, loopback: bool = True) -> None:
+        self.loopback = loopback
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.subscriptions: list[str] = []
+        self.published: dict[str, int] = {}
+        self.retained: dict[str, Any] = {}
+        self.connected = threading.Event()
+        self._inbound: queue.Queue[FakeMqttMessage] = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def username_pw_set(self, username: str, password: str | None = None) -> None:
+        return None
+
+    def reconnect_delay_set(self, min_delay: int = 1, max_delay: int = 120) -> None:
+        return None
+
+    def connect(self, host: str, port: int = 1883, keepalive: int = 60) -> int:
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic: str, qos: int = 0) -> tuple[int, int]:
+        self.subscriptions.append(topic)
+        return mqtt.MQTT_ERR_SUCCESS, len(self.subscriptions)
+
+    def publish(
+        self,
+        topic: str,
+        payload: Any = None,
+        qos: int = 0,
+        retain: bool = False,
+        properties: Any = None,
+    ) -> FakePublishResult:
+        with self._lock:
+            self.published[topic] = self.published.get(topic, 0) + 1
+            if retain:
+                self.retained[topic] = payload
+        if self.loopback and any(
+            mqtt.topic_matches_sub(sub, topic) for sub in self.subscriptions
+        ):
+            self.inject(topic, payload)
+        return FakePublishResult()
+
+    def inject(self, topic: str, payload: Any) -> None:
+        if isinstance(payload, str):
+            raw = payload.encode("utf-8")
+        elif payload is None:
+            raw = b""
+        else:
+            raw = bytes(payload)
+        self._inbound.put(FakeMqttMessage(topic, raw))
+
+    def is_idle(self) -> bool:
+        return self._inbound.unfinished_tasks == 0
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def loop_forever(self) -> None:
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0, None)
+        self.connected.set()
+        while not self._stop.is_set():
+            try:
+                msg = self._inbound.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            try:
+                if self.on_message is not None:
+                    self.on_message(self, None, msg)
+            except Exception as exc:
+                print("replay on_message raised:", exc, flush=True)
+            finally:
+                self._inbound.task_done()
+
+
+class FakeWriteApi:
+    def __init__(self, latency_seconds: float = 0.0) -> None:
+        self.latency_seconds = latency_seconds
+        self.writes: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def write(self, bucket: str, record: Any = None, **kwargs: Any) -> None:
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds)
+        records = record if isinstance(record, list) else [record]
+        with self._lock:
+            for item in records:
+                measurement = str(getattr(item, "_name", "unknown"))
+                self.writes[measurement] = self.writes.get(measurement, 0) + 1
+
+
+class FakeInfluxClient:
+    def __init__(self, latency_seconds: float = 0.0, **kwargs: Any) -> None:
+        self.write_api_instance = FakeWriteApi(latency_seconds=latency_seconds)
+
+    def write_api(self, write_options: Any = None) -> FakeWriteApi:
+        return self.write_api_instance
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    server: "StandInServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return None
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        if self.path.startswith("/api/services/"):
+            self.server.record("ha", self.server.ha_latency_seconds)
+            self._respond(200, [])
+            return
+        if self.path == "/api/generate":
+            self.server.record("ollama", self.server.ollama_latency_seconds)
+            try:
+                body = json.loads(raw_body.decode("utf-8") or "{}")
+            except json.JSONDecodeError:
+                body = {}
+            prompt = str(body.get("prompt", ""))
+            if "Convert this home automation command" in prompt:
+                text = json.dumps(
+                    {"steps": [], "reason": "replay stand-in does not parse commands"}
+                )
+            else:
+                text = "replay stand-in suggestion"
+            self._respond(200, {"response": text})
+            return
+        self._respond(404, {"error": "not found"})
+
+    def _respond(self, status: int, body: Any) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Loopback HTTP server answering the Home Assistant and Ollama calls."""
+
+    daemon_threads = True
+
+    def __init__(self, ha_latency_seconds: float = 0.0, ollama_latency_seconds: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.ha_latency_seconds = ha_latency_seconds
+        self.ollama_latency_seconds = ollama_latency_seconds
+        self.calls: dict[str, int] = {"ha": 0, "ollama": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, kind: str, latency_seconds: float) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        if latency_seconds > 0:
+            time.sleep(latency_seconds)
+
+
+def _wait_until_drained(
+    client: FakeMqttClient,
+    metrics: PipelineMetrics,
+    timeout_seconds: float,
+) -> bool:
+    deadline = time.monotonic() + timeout_seconds
+    idle_rounds = 0
+    while time.monotonic() < deadline:
+        busy = not client.is_idle() or any(
+            q.unfinished_tasks > 0 for q in metrics.queues.values()
+        )
+        # Require a few idle polls in a row: workers publish results that loop back.
+        idle_rounds = 0 if busy else idle_rounds + 1
+        if idle_rounds >= 3:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def run_replay(
+    messages: list[CaptureMessage],
+    *,
+    speed: float = 0.0,
+    env_overrides: dict[str, str] | None = None,
+    influx_latency_seconds: float = 0.0,
+    ha_latency_seconds: float = 0.0,
+    ollama_latency_seconds: float = 0.0,
+    drain_timeout_seconds: float = 60.0,
+) -> dict[str, Any]:
+    server = StandInServer(
+        ha_latency_seconds=ha_latency_seconds,
+        ollama_latency_seconds=ollama_latency_seconds,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = {
+        "INFLUX_TOKEN": "replay",
+        "HA_TOKEN": "replay",
+        "HA_URL": server.url,
+        "OLLAMA_URL": server.url,
+        "ACTION_BRIDGE_ENABLED": "true",
+        "ACTION_DYNAMIC_ALIAS_STORE_PATH": "",
+    }
+    env.update(env_overrides or {})
+
+    metrics = PipelineMetrics()
+    client = FakeMqttClient()
+    influx = FakeInfluxClient(latency_seconds=influx_latency_seconds)
+    pipeline = AgentPipeline(
+        AgentConfig.from_env(env),
+        client,
+        influx.write_api(),
+        metrics=metrics,
+    )
+    pipeline.attach(client)
+    pipeline.start_workers()
+    threading.Thread(target=client.loop_forever, daemon=True).start()
+    try:
+        if not client.connected.wait(timeout=10):
+            raise RuntimeError("agent did not connect to the fake MQTT client")
+
+        started = time.perf_counter()
+        first_ts = messages[0][0] if messages else 0.0
+        for capture_ts, topic, payload in messages:
+            if speed > 0:
+                due = started + max(0.0, capture_ts - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            client.inject(topic, payload)
+        drained = _wait_until_drained(client, metrics, drain_timeout_seconds)
+        duration = time.perf_counter() - started
+    finally:
+        client.stop()
+        server.shutdown()
+        server.server_close()
+
+    snapshot = metrics.snapshot()
+    return {
+        "messages": len(messages),
+        "speed": speed,
+        "drained": drained,
+        "duration_seconds": round(duration, 4),
+        "messages_per_second": round(len(messages) / duration, 2) if duration > 0 else 0.0,
+        "stages": snapshot["stages"],
+        "queues": snapshot["queues"],
+        "counters": snapshot["counters"],
+        "stand_ins": {
+            "mqtt_published": dict(sorted(client.published.items())),
+            "influx_writes": dict(sorted(influx.write_api_instance.writes.items())),
+            "ha_calls": server.calls.get("ha", 0),
+            "ollama_calls": server.calls.get("ollama", 0),
+        },
+    }
+
+
+def parse_env_overrides(values: list[str]) -> dict[str, str]:
+    overrides: dict[str, str] = {}
+    for raw in values:
+        key, sep, value = raw.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"expected KEY=VALUE, got '{raw}'")
+        overrides[key.strip()] = value
+    return overrides
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded home/# capture through the agent with in-process stand-ins."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--capture", help="JSONL file with {time, topic, payload} rows")
+    source.add_argument("--from-influx", action="store_true", help="read mqtt_event rows from InfluxDB")
+    parser.add_argument("--influx-url", default="http://localhost:8181")
+    parser.add_argument("--influx-token", default="")
+    parser.add_argument("--influx-database", default="home")
+    parser.add_argument("--since-minutes", type=int, default=60)
+    parser.add_argument("--limit", type=int, default=50000)
+    parser.add_argument("--speed", type=float, nargs="+", default=[0.0], help="0 = as fast as possible")
+    parser.add_argument("--influx-latency-ms", type=float, default=0.0)
+    parser.add_argument("--ha-latency-ms", type=float, default=0.0)
+    parser.add_argument("--ollama-latency-ms", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--env", action="append", default=[], help="agent env override KEY=VALUE")
+    parser.add_argument("--min-rate", type=float, default=0.0, help="fail if messages/s drops below")
+    parser.add_argument("--output", default="", help="write JSON report to this file")
+    args = parser.parse_args(argv)
+
+    if args.capture:
+        messages = load_capture_jsonl(args.capture)
+    else:
+        messages = load_capture_from_influx(
+            influx_url=args.influx_url,
+            influx_token=args.influx_token,
+            database=args.influx_database,
+            since_minutes=args.since_minutes,
+            limit=args.limit,
+        )
+    if not messages:
+        print("capture is empty", file=sys.stderr)
+        return 2
+
+    reports = []
+    for speed in args.speed:
+        reports.append(
+            run_replay(
+                messages,
+                speed=speed,
+                env_overrides=parse_env_overrides(args.env),
+                influx_latency_seconds=args.influx_latency_ms / 1000.0,
+                ha_latency_seconds=args.ha_latency_ms / 1000.0,
+                ollama_latency_seconds=args.ollama_latency_ms / 1000.0,
+                drain_timeout_seconds=args.drain_timeout,
+            )
+        )
+
+    rendered = json.dumps(reports, indent=2)
+    print(rendered)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(rendered + "\n")
+
+    failed = [r for r in reports if not r["drained"] or r["messages_per_second"] < args.min_rate]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
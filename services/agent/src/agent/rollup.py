@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Any
+
+from influxdb_client import Point, WritePrecision
+
+from agent.metrics import LatencyStats
+
+RollupKey = tuple[int, str, str, str, str]
+
+
+class ActionRollup:
+    """Minute buckets of agent_action counts and latency, written as minutes close.
+
+    Every audited action is counted under (minute, status, source, mode, action).
+    A bucket is written once its minute has ended plus `grace_seconds`, so the
+    dashboard reads one row per minute and tag combination instead of scanning raw
+    agent_action history. Latency fields appear only when the bucket saw commands
+    with a known receive time.
+    """
+
+    def __init__(
+        self,
+        write_api: Any,
+        bucket: str,
+        measurement: str = "agent_action_rollup",
+        bucket_seconds: int = 60,
+        grace_seconds: float = 5.0,
+    ) -> None:
+        self.write_api = write_api
+        self.bucket = bucket
+        self.measurement = measurement
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._counts: dict[RollupKey, int] = {}
+        self._latency: dict[RollupKey, LatencyStats] = {}
+
+    def record(
+        self,
+        *,
+        status: str,
+        source: str,
+        mode: str,
+        action: str,
+        latency_seconds: float | None = None,
+        now: float | None = None,
+    ) -> None:
+        ts = time.time() if now is None else now
+        minute = int(ts // self.bucket_seconds) * self.bucket_seconds
+        key = (minute, status, source or "manual", mode, action or "none")
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if latency_seconds is not None:
+                stats = self._latency.get(key)
+                if stats is None:
+                    stats = self._latency[key] = LatencyStats(max_samples=1000)
+                stats.record(max(0.0, latency_seconds))
+
+    def _point(self, key: RollupKey, count: int, stats: LatencyStats | None) -> Point:
+        minute, status, source, mode, action = key
+        point = (
+            Point(self.measurement)
+            .tag("status", status)
+            .tag("source", source)
+            .tag("mode", mode)
+            .tag("action", action)
+            .field("count", count)
+            .time(minute * 1_000_000_000, WritePrecision.NS)
+        )
+        if stats is not None and stats.count:
+            snapshot = stats.snapshot()
+            point = (
+                point.field("latency_count", stats.count)
+                .field("latency_mean_ms", snapshot["mean_ms"])
+                .field("latency_p50_ms", snapshot["p50_ms"])
+                .field("latency_p95_ms", snapshot["p95_ms"])
+                .field("latency_max_ms", snapshot["max_ms"])
+            )
+        return point
+
+    def take_closed(self, now: float | None = None, force: bool = False) -> list[Point]:
+        ts = time.time() if now is None else now
+        cutoff = ts - self.bucket_seconds - self.grace_seconds
+        points: list[Point] = []
+        with self._lock:
+            for key in [k for k in self._counts if force or k[0] <= cutoff]:
+                points.append(self._point(key, self._counts.pop(key), self._latency.pop(key, None)))
+        return points
+
+    def flush(self, now: float | None = None, force: bool = False) -> int:
+        points = self.take_closed(now, force)
+        if not points:
+            return 0
+        try:
+            self.write_api.write(bucket=self.bucket, record=points)
+        except Exception as exc:
+            print("influx write agent_action_rollup failed:", exc, flush=True)
+            return 0
+        return len(points)
@@ -0,0 +1,246 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+from typing import Any, Callable
+
+import numpy as np
+
+EmbedFn = Callable[[list[str]], list[list[float]]]
+
+INTENT_PHRASES: dict[str, tuple[str, ...]] = {
+    "turn_on": (
+        "turn on",
+        "switch on",
+        "power on",
+        "start",
+        "enable",
+        "activate",
+        "light up",
+    ),
+    "turn_off": (
+        "turn off",
+        "switch off",
+        "power off",
+        "stop",
+        "disable",
+        "kill",
+        "shut down",
+        "cut the power",
+    ),
+}
+MULTI_TARGET_RE = re.compile(r"\b(and|then)\b|,")
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SemanticResolver:
+    """Embedding-based intent/target matcher tried before the generative parser.
+
+    Every target phrase (aliases plus `plug 1..4`) and every canonical intent
+    phrase is embedded once. Vectors are cached on disk per index version (a hash
+    of model + phrases) and reused across versions, so an approval embeds only the
+    new alias. A command resolves to a single step when both the best target and
+    the best intent clear `min_score`, the target leads the runner-up by at least
+    `min_margin` and the intent by at least `intent_min_margin`; anything else is
+    left to the LLM. The intent margin is stricter because "turn on" and
+    "turn off" embed almost identically and a wrong pick flips a real device.
+    """
+
+    def __init__(
+        self,
+        embed: EmbedFn,
+        model: str,
+        cache_dir: str = "",
+        min_score: float = 0.6,
+        min_margin: float = 0.05,
+        intent_min_margin: float = 0.15,
+    ) -> None:
+        self.embed = embed
+        self.model = model
+        self.cache_dir = cache_dir
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.intent_min_margin = intent_min_margin
+        self.version = ""
+        self.alias_version: int | None = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._vectors: dict[str, np.ndarray] = {}
+        self._target_keys: list[dict[str, Any]] = []
+        self._target_matrix = np.zeros((0, 0), dtype=np.float32)
+        self._intent_actions: list[str] = []
+        self._intent_matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def target_phrases(
+        outlet_entity_map: dict[int, str],
+        alias_map: dict[str, str],
+    ) -> dict[str, dict[str, Any]]:
+        phrases: dict[str, dict[str, Any]] = {}
+        for outlet, entity_id in sorted(outlet_entity_map.items()):
+            if entity_id and outlet in {1, 2, 3, 4}:
+                phrases[f"plug {outlet}"] = {"outlet": outlet, "entity_alias": ""}
+        for alias in sorted(alias_map):
+            phrases.setdefault(alias, {"outlet": 0, "entity_alias": alias})
+        return phrases
+
+    def index_version(self, phrases: list[str]) -> str:
+        digest = hashlib.sha1(self.model.encode("utf-8"))
+        for phrase in sorted(phrases):
+            digest.update(b"\0" + phrase.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _cache_path(self, version: str) -> str:
+        return os.path.join(self.cache_dir, f"embeddings-{version}.npz")
+
+    def _load_cached_vectors(self, version: str) -> None:
+        if not self.cache_dir:
+            return
+        path = self._cache_path(version)
+        candidates = [path] if os.path.exists(path) else []
+        # Seed from older versions so only changed phrases are embedded.
+        candidates += sorted(
+            glob.glob(os.path.join(self.cache_dir, "embeddings-*.npz")),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for candidate in candidates:
+            try:
+                with np.load(candidate, allow_pickle=False) as data:
+                    if str(data["model"]) != self.model:
+                        continue
+                    for text, vector in zip(data["texts"].tolist(), data["vectors"]):
+                        self._vectors.setdefault(str(text), vector)
+            except Exception as exc:
+                print("embedding cache load failed:", candidate, exc, flush=True)
+            if candidate == path:
+                return
+
+    def _save(self, version: str, phrases: list[str]) -> None:
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_path(version)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                model=np.array(self.model),
+                texts=np.array(phrases),
+                vectors=np.stack([self._vectors[phrase] for phrase in phrases]),
+            )
+            os.replace(tmp_path, path)
+            for stale in glob.glob(os.path.join(self.cache_dir, "embeddings-*.npz")):
+                if stale != path:
+                    os.remove(stale)
+        except Exception as exc:
+            print("embedding cache save failed:", exc, flush=True)
+
+    def sync(
+        self,
+        outlet_entity_map: dict[int, str],
+        alias_map: dict[str, str],
+        alias_version: int | None = None,
+    ) -> str:
+        """Bring the index up to date, embedding only phrases not seen before.
+
+        Passing the caller's alias-map version makes repeat calls O(1).
+        """
+        if alias_version is not None and alias_version == self.alias_version:
+            return self.version
+        with self._sync_lock:
+            version = self._sync(outlet_entity_map, alias_map)
+            self.alias_version = alias_version
+            return version
+
+    def _sync(self, outlet_entity_map: dict[int, str], alias_map: dict[str, str]) -> str:
+        targets = self.target_phrases(outlet_entity_map, alias_map)
+        intents = [(action, phrase) for action, group in INTENT_PHRASES.items() for phrase in group]
+        phrases = list(targets) + [phrase for _, phrase in intents]
+        version = self.index_version(phrases)
+        if version == self.version:
+            return version
+        if not self._vectors:
+            self._load_cached_vectors(version)
+        missing = [phrase for phrase in dict.fromkeys(phrases) if phrase not in self._vectors]
+        if missing:
+            embedded = _normalize_rows(np.asarray(self.embed(missing), dtype=np.float32))
+            for phrase, vector in zip(missing, embedded):
+                self._vectors[phrase] = vector
+        unique_phrases = list(dict.fromkeys(phrases))
+        target_matrix = np.stack([self._vectors[phrase] for phrase in targets]) if targets else None
+        intent_matrix = np.stack([self._vectors[phrase] for _, phrase in intents])
+        with self._lock:
+            self._target_keys = [dict(value, phrase=phrase) for phrase, value in targets.items()]
+            self._target_matrix = (
+                target_matrix
+                if target_matrix is not None
+                else np.zeros((0, intent_matrix.shape[1]), dtype=np.float32)
+            )
+            self._intent_actions = [action for action, _ in intents]
+            self._intent_matrix = intent_matrix
+            self.version = version
+        if missing:
+            self._save(version, unique_phrases)
+        return version
+
+    @staticmethod
+    def _best_two(scores: np.ndarray) -> tuple[int, float, float]:
+        if scores.size == 1:
+            return 0, float(scores[0]), -1.0
+        top = np.argpartition(-scores, 1)[:2]
+        first, second = (top[0], top[1]) if scores[top[0]] >= scores[top[1]] else (top[1], top[0])
+        return int(first), float(scores[first]), float(scores[second])
+
+    def resolve(self, text: str) -> tuple[list[dict[str, Any]], str]:
+        normalized = " ".join(text.lower().split())
+        if not normalized:
+            return [], ""
+        if MULTI_TARGET_RE.search(normalized):
+            return [], "embedding resolver skipped multi-step command"
+        with self._lock:
+            target_keys = self._target_keys
+            target_matrix = self._target_matrix
+            intent_actions = self._intent_actions
+            intent_matrix = self._intent_matrix
+        if not target_keys:
+            return [], "embedding index is empty"
+        try:
+            vector = _normalize_rows(np.asarray(self.embed([normalized]), dtype=np.float32))[0]
+        except Exception as exc:
+            return [], f"embedding request failed: {exc}"
+
+        target_idx, target_score, target_runner_up = self._best_two(target_matrix @ vector)
+        intent_scores = intent_matrix @ vector
+        best_by_action: dict[str, float] = {}
+        for action, score in zip(intent_actions, intent_scores.tolist()):
+            if score > best_by_action.get(action, -1.0):
+                best_by_action[action] = score
+        ranked = sorted(best_by_action.items(), key=lambda item: item[1], reverse=True)
+        action, intent_score = ranked[0]
+        intent_runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+
+        target = target_keys[target_idx]
+        scores = (
+            f"target='{target['phrase']}' {target_score:.2f}/{target_runner_up:.2f}, "
+            f"intent={action} {intent_score:.2f}/{intent_runner_up:.2f}"
+        )
+        if (
+            target_score < self.min_score
+            or intent_score < self.min_score
+            or target_score - target_runner_up < self.min_margin
+            or intent_score - intent_runner_up < self.intent_min_margin
+        ):
+            return [], f"embedding match below confidence ({scores})"
+        step = {
+            "action": action,
+            "outlet": int(target["outlet"]),
+            "entity_alias": str(target["entity_alias"]),
+        }
+        return [step], f"resolved by embeddings ({scores})"
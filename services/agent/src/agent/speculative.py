@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+CountHook = Callable[[str], None]
+
+
+class SpeculativeParser:
+    """Runs LLM parses ahead of the worker under a concurrency budget.
+
+    At most `max_inflight` speculative calls hit Ollama at once so suggestion
+    traffic keeps its share of the model. `start` returns None when the budget is
+    spent and the caller falls back to the sequential rule-then-LLM order. A
+    discarded call is cancelled if it has not started yet; an HTTP request that is
+    already in flight runs to completion and its result is dropped, holding its
+    budget slot until then.
+    """
+
+    def __init__(self, max_inflight: int) -> None:
+        self.max_inflight = max(1, max_inflight)
+        self._budget = threading.BoundedSemaphore(self.max_inflight)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_inflight,
+            thread_name_prefix="speculative-parse",
+        )
+        self.count_hooks: list[CountHook] = []
+
+    def add_count_hook(self, hook: CountHook) -> None:
+        self.count_hooks.append(hook)
+
+    def count(self, name: str) -> None:
+        for hook in self.count_hooks:
+            hook(name)
+
+    def start(self, parser: Callable[..., Any], **kwargs: Any) -> Future | None:
+        if not self._budget.acquire(blocking=False):
+            self.count("speculative_parse_budget_exhausted")
+            return None
+        try:
+            future = self._pool.submit(parser, **kwargs)
+        except Exception:
+            self._budget.release()
+            raise
+        future.add_done_callback(lambda _: self._budget.release())
+        self.count("speculative_parse_started")
+        return future
+
+    def use(self, future: Future) -> Any:
+        self.count("speculative_parse_used")
+        return future.result()
+
+    def discard(self, future: Future) -> None:
+        future.cancel()
+        self.count("speculative_parse_discarded")
+
+
+class PartialParseWarmer:
+    """Holds LLM parses started from partial voice transcripts.
+
+    Entries are keyed by utterance id. A newer partial for the same utterance
+    replaces (and discards) the older parse; the final command takes the entry
+    only if its text matches what was warmed, otherwise the warm parse is dropped.
+    Entries older than `ttl_seconds` are discarded on the next call.
+    """
+
+    def __init__(
+        self,
+        speculation: SpeculativeParser,
+        ttl_seconds: float = 30.0,
+        max_entries: int = 8,
+    ) -> None:
+        self.speculation = speculation
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[str, Future, float]] = {}
+
+    def _expire(self, now: float) -> None:
+        for key, (_, future, started) in list(self._entries.items()):
+            if now - started > self.ttl_seconds:
+                del self._entries[key]
+                self.speculation.discard(future)
+
+    def warm(
+        self,
+        key: str,
+        text: str,
+        now: float,
+        parser: Callable[..., Any],
+        parser_kwargs: dict[str, Any],
+    ) -> bool:
+        with self._lock:
+            self._expire(now)
+            current = self._entries.get(key)
+            if current is not None and current[0] == text:
+                return False
+            if current is not None:
+                del self._entries[key]
+                self.speculation.discard(current[1])
+            elif len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][2])
+                self.speculation.discard(self._entries.pop(oldest)[1])
+            future = self.speculation.start(parser, **parser_kwargs)
+            if future is None:
+                return False
+            self._entries[key] = (text, future, now)
+            self.speculation.count("partial_warm_started")
+            return True
+
+    def has(self, key: str, text: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and entry[0] == text
+
+    def take(self, key: str, text: str, now: float) -> Future | None:
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry[0] != text:
+            self.speculation.discard(entry[1])
+            self.speculation.count("partial_warm_missed")
+            return None
+        self.speculation.count("partial_warm_hit")
+        return entry[1]
@@ -0,0 +1,17 @@
+"""Test doubles shared by several test modules."""
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingWriteApi:
+    def __init__(self) -> None:
+        self.records: list = []
+
+    def write(self, bucket, record=None, **kwargs):
+        self.records.extend(record if isinstance(record, list) else [record])
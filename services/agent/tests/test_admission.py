@@ -0,0 +1,111 @@
+import json
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.admission import AdmissionController
+from agent.admission import TokenBucket
+from agent.admission import parse_source_priorities
+from agent.admission import parse_source_rate_limits
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+from fakes import FakeClock
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_bucket_refills_at_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate_per_second=2.0, burst=2.0, clock=clock)
+        self.assertTrue(bucket.try_take())
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+        clock.now += 0.5
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+
+
+class AdmissionControllerTests(unittest.TestCase):
+    def test_low_priority_is_shed_before_queue_fills(self):
+        controller = AdmissionController(
+            {"voice": (100.0, 100.0), "api": (100.0, 100.0)},
+            {"voice": 0, "api": 2},
+            headroom_per_priority=0.25,
+        )
+        admitted, detail = controller.admit("api", queue_depth=50, queue_max=100)
+        self.assertFalse(admitted)
+        self.assertIn("overloaded", detail)
+        admitted, _ = controller.admit("voice", queue_depth=99, queue_max=100)
+        self.assertTrue(admitted)
+
+    def test_bucket_exhaustion_is_overloaded(self):
+        clock = FakeClock()
+        controller = AdmissionController({"api": (1.0, 1.0)}, {"api": 2}, clock=clock)
+        self.assertTrue(controller.admit("api", 0, 100)[0])
+        admitted, detail = controller.admit("api", 0, 100)
+        self.assertFalse(admitted)
+        self.assertIn("exceeded", detail)
+
+    def test_parse_overrides_keep_defaults_for_invalid_entries(self):
+        limits = parse_source_rate_limits('{"api":{"rate":5,"burst":20},"voice":{"rate":0}}')
+        self.assertEqual(limits["api"], (5.0, 20.0))
+        self.assertEqual(limits["voice"], (1.0, 5.0))
+        self.assertEqual(parse_source_priorities("not json")["voice"], 0)
+
+
+class PipelineAdmissionTests(unittest.TestCase):
+    def _pipeline(self, **overrides) -> tuple[AgentPipeline, FakeMqttClient]:
+        config = AgentConfig(
+            action_bridge_enabled=True,
+            action_dynamic_alias_store_path="",
+            action_rate_limit_seconds=0.0,
+            ha_token="test-token",
+        )
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        client = FakeMqttClient(loopback=False)
+        pipeline = AgentPipeline(config, client, FakeWriteApi())
+        return pipeline, client
+
+    def test_excess_commands_get_immediate_overloaded_result(self):
+        pipeline, client = self._pipeline(action_source_rate_limits={"api": (0.001, 2.0)})
+        results: list[dict] = []
+        pipeline.publisher.publish_action_result = results.append
+        for outlet in (1, 2, 3):
+            pipeline.handle_message(
+                "home/ai/command",
+                json.dumps({"command": f"turn on plug {outlet}", "source": "api"}),
+            )
+        self.assertEqual(pipeline.action_queue.qsize(), 2)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["status"], "rejected")
+        self.assertTrue(results[0]["detail"].startswith("overloaded"))
+        self.assertEqual(pipeline.metrics.counters["admission_rejected.api"], 1)
+
+    def test_capability_queries_are_admission_controlled(self):
+        pipeline, _ = self._pipeline(action_source_rate_limits={"api": (0.001, 2.0)})
+        results: list[dict] = []
+        pipeline.publisher.publish_action_result = results.append
+        for request_id in ("a", "b", "c"):
+            pipeline.handle_message(
+                "home/ai/command",
+                json.dumps({"command": "list devices", "source": "api", "request_id": request_id}),
+            )
+        self.assertEqual([result["status"] for result in results], ["executed", "executed", "rejected"])
+        self.assertTrue(results[2]["detail"].startswith("overloaded"))
+        self.assertEqual(pipeline.metrics.counters["capability_queries"], 2)
+
+    def test_voice_is_dequeued_before_queued_api(self):
+        pipeline, _ = self._pipeline()
+        pipeline.handle_message("home/ai/command", '{"command":"turn on plug 1","source":"api"}')
+        pipeline.handle_message("home/ai/command", '{"command":"turn on plug 2","source":"voice"}')
+        order = [pipeline.action_queue.get_nowait()[2][1] for _ in range(2)]
+        self.assertIn('"voice"', order[0])
+        self.assertIn('"api"', order[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.dedup import CommandDeduplicator
+from agent.main import parse_command_request_id
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+from fakes import FakeClock
+
+
+class CommandDeduplicatorTests(unittest.TestCase):
+    def test_key_normalizes_text_and_separates_confirm(self):
+        plain = CommandDeduplicator.make_key("Turn  ON plug 2", "voice")
+        self.assertEqual(plain, CommandDeduplicator.make_key("turn on plug 2", "voice"))
+        self.assertNotEqual(plain, CommandDeduplicator.make_key("turn on plug 2", "api"))
+        self.assertNotEqual(
+            plain,
+            CommandDeduplicator.make_key("turn on plug 2", "voice", confirm=True),
+        )
+
+    def test_cached_result_expires_after_window(self):
+        clock = FakeClock(10.0)
+        dedup = CommandDeduplicator(1.0, 60.0, clock=clock)
+        key = CommandDeduplicator.make_key("turn on plug 2", "voice")
+        entry, cached = dedup.check(key)
+        self.assertIsNotNone(entry)
+        self.assertEqual(dedup.complete(entry, {"status": "executed"}), 0)
+        clock.now += 0.5
+        self.assertEqual(dedup.check(key), (None, {"status": "executed"}))
+        clock.now += 1.0
+        entry, cached = dedup.check(key)
+        self.assertIsNotNone(entry)
+        self.assertIsNone(cached)
+
+    def test_request_id_parsing(self):
+        self.assertEqual(parse_command_request_id('{"command":"x","request_id":"abc-1"}'), "abc-1")
+        self.assertEqual(parse_command_request_id("turn on plug 1"), "")
+
+
+class PipelineDedupTests(unittest.TestCase):
+    def _pipeline(self) -> tuple[AgentPipeline, list]:
+        ha_calls: list = []
+
+        def fake_ha(**kwargs):
+            ha_calls.append(kwargs["entity_id"])
+            return True, "stub ok"
+
+        config = AgentConfig(
+            action_bridge_enabled=True,
+            action_dynamic_alias_store_path="",
+            action_rate_limit_seconds=0.0,
+            ha_token="test-token",
+        )
+        pipeline = AgentPipeline(config, FakeMqttClient(loopback=False), FakeWriteApi())
+        pipeline.executor.ha_executor = fake_ha
+        return pipeline, ha_calls
+
+    def test_double_tap_executes_once_and_replays_result(self):
+        pipeline, ha_calls = self._pipeline()
+        results: list[dict] = []
+        pipeline.publisher.publish_action_result = results.append
+        payload = json.dumps({"command": "turn on plug 2", "source": "voice"})
+        pipeline.handle_message("home/ai/command", payload)
+        pipeline.handle_message("home/ai/command", payload)
+        self.assertEqual(pipeline.action_queue.qsize(), 1)
+        pipeline.drain()
+        pipeline.handle_message("home/ai/command", payload)
+        self.assertEqual(ha_calls, ["switch.p304m_tapo_p304m_2"])
+        self.assertEqual(len(results), 3)
+        self.assertNotIn("duplicate", results[0])
+        self.assertTrue(results[1]["duplicate"])
+        self.assertTrue(results[2]["duplicate"])
+        self.assertEqual(results[2]["status"], "executed")
+
+    def test_request_id_is_echoed_and_used_as_key(self):
+        pipeline, ha_calls = self._pipeline()
+        results: list[dict] = []
+        pipeline.publisher.publish_action_result = results.append
+        first = json.dumps({"command": "turn on plug 1", "source": "api", "request_id": "r-1"})
+        retry = json.dumps({"command": "switch on plug 1", "source": "api", "request_id": "r-1"})
+        pipeline.handle_message("home/ai/command", first)
+        pipeline.drain()
+        pipeline.handle_message("home/ai/command", retry)
+        self.assertEqual(len(ha_calls), 1)
+        self.assertEqual([r["request_id"] for r in results], ["r-1", "r-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
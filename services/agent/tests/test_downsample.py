@@ -0,0 +1,69 @@
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.downsample import EventDownsampler
+from agent.downsample import hourly_points
+from agent.downsample import hourly_query
+from fakes import RecordingWriteApi
+
+HOUR = 3600
+NOW = 1_767_225_600 + 10 * HOUR + 1200  # 10:20 UTC
+
+
+class DownsampleTests(unittest.TestCase):
+    def test_hourly_query_bounds_one_hour(self):
+        query = hourly_query(1_767_225_600)
+        self.assertIn("time >= '2026-01-01T00:00:00Z' AND time < '2026-01-01T01:00:00Z'", query)
+        self.assertIn("GROUP BY topic", query)
+
+    def test_numeric_stats_only_for_numeric_topics(self):
+        rows = [
+            {
+                "topic": "home/ha/sensor/power/state",
+                "event_count": 60,
+                "last_payload": "12.5",
+                "last_time": "2026-01-01T00:59:00",
+                "numeric_count": 60,
+                "value_min": 10.0,
+                "value_max": 20.0,
+                "value_mean": 12.0,
+            },
+            {"topic": "home/ha/switch/x/state", "event_count": 3, "last_payload": "on", "numeric_count": 0},
+            {"topic": "", "event_count": 1},
+        ]
+        lines = [p.to_line_protocol() for p in hourly_points(rows, 1_767_225_600)]
+        self.assertEqual(len(lines), 2)
+        self.assertIn("mean=12", lines[0])
+        self.assertIn("count=60i", lines[0])
+        self.assertNotIn("mean=", lines[1])
+        self.assertTrue(lines[1].endswith(" 1767225600000000000"))
+
+    def test_runs_resume_from_saved_state(self):
+        queries: list[str] = []
+
+        def fake_query(query: str) -> list:
+            queries.append(query)
+            return [{"topic": "home/a", "event_count": 2, "last_payload": "x", "numeric_count": 0}]
+
+        with tempfile.TemporaryDirectory() as folder:
+            state_path = str(pathlib.Path(folder) / "state.json")
+            write_api = RecordingWriteApi()
+            first = EventDownsampler(fake_query, write_api, "home", state_path, after_hours=1, backfill_hours=3)
+            summary = first.run_once(NOW)
+            # 10:20 with after_hours=1 -> hours 06..09 are complete and old enough.
+            self.assertEqual(summary["hours"], 4)
+            self.assertEqual(summary["last_hour"], "2026-01-01T09:00:00Z")
+
+            second = EventDownsampler(fake_query, write_api, "home", state_path, after_hours=1)
+            self.assertEqual(second.run_once(NOW)["hours"], 0)
+            self.assertEqual(second.run_once(NOW + HOUR)["hours"], 1)
+        self.assertEqual(len(queries), 5)
+        self.assertEqual(len(write_api.records), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
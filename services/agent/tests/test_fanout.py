@@ -0,0 +1,83 @@
+import json
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.fanout import TopicAliasRegistry
+from agent.fanout import compact_entity_results
+from agent.fanout import decode_result_capabilities
+from agent.fanout import encode_result_payload
+from agent.pipeline import AgentConfig
+from agent.pipeline import ResultPublisher
+from agent.replay import FakeMqttClient
+
+
+class FanoutHelperTests(unittest.TestCase):
+    def test_compact_records_are_keyed_by_step_entity(self):
+        result = {
+            "status": "executed",
+            "source": "voice",
+            "time": 1.0,
+            "request_id": "r-1",
+            "steps": [
+                {"entity_id": "switch.plug_1", "action": "turn_on", "status": "executed", "detail": "ok"},
+                {"entity_id": "light.lamp", "action": "turn_off", "status": "failed", "detail": "x" * 500},
+            ],
+        }
+        compact = compact_entity_results(result)
+        self.assertEqual(set(compact), {"switch.plug_1", "light.lamp"})
+        self.assertEqual(compact["switch.plug_1"]["request_id"], "r-1")
+        self.assertEqual(len(compact["light.lamp"]["detail"]), 200)
+
+    def test_capabilities_round_trip_when_compressed(self):
+        capabilities = [{"entity_id": f"switch.plug_{i}", "actions": ["turn_on"]} for i in range(50)]
+        result = {"status": "executed", "action": "list_capabilities", "capabilities": capabilities}
+        encoded = json.loads(encode_result_payload(result, compress_min_bytes=64))
+        self.assertNotIn("capabilities", encoded)
+        self.assertEqual(encoded["capabilities_count"], 50)
+        self.assertEqual(decode_result_capabilities(encoded), capabilities)
+        plain = json.loads(encode_result_payload(result, compress_min_bytes=0))
+        self.assertEqual(plain["capabilities"], capabilities)
+
+    def test_alias_registry_sends_topic_once(self):
+        registry = TopicAliasRegistry()
+        self.assertEqual(registry.resolve("home/ai/action_result"), ("home/ai/action_result", None))
+        registry.reset(1)
+        first_topic, first_props = registry.resolve("home/ai/action_result")
+        second_topic, second_props = registry.resolve("home/ai/action_result")
+        self.assertEqual(first_topic, "home/ai/action_result")
+        self.assertEqual(second_topic, "")
+        self.assertEqual(first_props.TopicAlias, second_props.TopicAlias)
+        self.assertEqual(registry.resolve("home/ai/action_mode"), ("home/ai/action_mode", None))
+
+
+class ResultPublisherFanoutTests(unittest.TestCase):
+    def test_fanout_publishes_retained_entity_and_summary_topics(self):
+        client = FakeMqttClient(loopback=False)
+        publisher = ResultPublisher(client, AgentConfig(action_result_fanout_enabled=True))
+        publisher.publish_action_result(
+            {
+                "status": "executed",
+                "action": "turn_on",
+                "entity_id": "switch.plug_1",
+                "source": "api",
+                "time": 1.0,
+            }
+        )
+        self.assertEqual(client.published["home/ai/action_result"], 1)
+        entity_record = json.loads(client.retained["home/ai/entity/switch.plug_1/last_action"])
+        self.assertEqual(entity_record["status"], "executed")
+        summary = json.loads(client.retained["home/ai/action_summary"])
+        self.assertEqual(summary["entity_id"], "switch.plug_1")
+
+    def test_fanout_is_off_by_default(self):
+        client = FakeMqttClient(loopback=False)
+        publisher = ResultPublisher(client, AgentConfig())
+        publisher.publish_action_result({"status": "executed", "entity_id": "switch.plug_1"})
+        self.assertEqual(client.retained, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
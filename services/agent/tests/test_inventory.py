@@ -0,0 +1,82 @@
+import json
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.inventory import CapabilityInventory
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+
+
+def _pipeline(**overrides) -> tuple[AgentPipeline, FakeMqttClient]:
+    config = AgentConfig(
+        action_bridge_enabled=True,
+        action_dynamic_alias_store_path="",
+        action_rate_limit_seconds=0.0,
+        ha_token="test-token",
+        extra_entity_alias_map={"desk lamp": "light.desk_lamp"},
+    )
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    client = FakeMqttClient(loopback=False)
+    return AgentPipeline(config, client, FakeWriteApi()), client
+
+
+class CapabilityInventoryTests(unittest.TestCase):
+    def test_rows_list_plugs_then_sorted_aliases(self):
+        inventory = CapabilityInventory()
+        inventory.rebuild(
+            {1: "switch.plug_1", 2: ""},
+            {"zeta fan": "fan.zeta", "alpha lamp": "light.alpha", "plug one": "switch.plug_1"},
+            {"switch.plug_1", "fan.zeta", "light.alpha"},
+        )
+        rows = inventory.rows()
+        self.assertEqual([row["target"] for row in rows], ["plug 1", "alpha lamp", "zeta fan"])
+        self.assertIn("set_percentage", rows[2]["supported_actions"])
+        self.assertIs(inventory.rows(), rows)
+
+    def test_add_alias_bumps_version_and_invalidates_rows(self):
+        inventory = CapabilityInventory()
+        inventory.rebuild({}, {}, set())
+        version = inventory.version
+        self.assertEqual(inventory.rows(), [])
+        self.assertEqual(inventory.add_alias("study fan", "fan.study_fan"), version + 1)
+        self.assertEqual(inventory.alias_map(), {"study fan": "fan.study_fan"})
+        self.assertEqual(inventory.rows()[0]["entity_id"], "fan.study_fan")
+
+
+class PipelineInventoryTests(unittest.TestCase):
+    def test_inventory_query_is_answered_without_queueing(self):
+        pipeline, client = _pipeline()
+        results: list[dict] = []
+        pipeline.publisher.publish_action_result = results.append
+        pipeline.handle_message("home/ai/command", "list devices")
+        self.assertEqual(pipeline.action_queue.qsize(), 0)
+        self.assertEqual(results[0]["action"], "capabilities")
+        self.assertEqual(len(results[0]["capabilities"]), 5)
+        self.assertEqual(pipeline.metrics.counters["capability_queries"], 1)
+
+    def test_approval_updates_retained_inventory(self):
+        pipeline, client = _pipeline()
+        pipeline.on_connect(client, None, None, 0)
+        before = json.loads(client.retained["home/ai/capabilities"])
+        pipeline.handle_message("home/ai/command", "approve device fan.study_fan as study fan")
+        pipeline.drain()
+        after = json.loads(client.retained["home/ai/capabilities"])
+        self.assertEqual(after["version"], before["version"] + 1)
+        self.assertEqual(after["count"], before["count"] + 1)
+        self.assertEqual(pipeline.state.alias_map()["study fan"], "fan.study_fan")
+
+    def test_fast_path_can_be_disabled(self):
+        pipeline, _ = _pipeline(action_capability_fast_path=False)
+        pipeline.handle_message("home/ai/command", "what can desk lamp do")
+        self.assertEqual(pipeline.action_queue.qsize(), 1)
+        self.assertEqual(pipeline.drain(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.parse_bench import load_transcripts
+from agent.parse_bench import plans_match
+from agent.parse_bench import run_parse_bench
+
+
+class ParseBenchTests(unittest.TestCase):
+    def test_load_transcripts_skips_failed_and_invalid_rows(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = pathlib.Path(folder) / "results.jsonl"
+            path.write_text(
+                "\n".join(
+                    [
+                        json.dumps({"path": "a.wav", "ok": True, "text": "turn on plug 1"}),
+                        json.dumps({"path": "b.wav", "ok": False, "error": "no speech recognized"}),
+                        "not json",
+                    ]
+                ),
+                encoding="utf-8",
+            )
+            rows = load_transcripts(str(path))
+        self.assertEqual([row["path"] for row in rows], ["a.wav"])
+
+    def test_plans_match_ignores_step_order(self):
+        actual = [{"action": "turn_on", "outlet": 2, "entity_alias": ""}, {"action": "turn_off", "outlet": 1}]
+        expected = [{"action": "turn_off", "outlet": 1, "entity_alias": ""}, {"action": "turn_on", "outlet": 2}]
+        self.assertTrue(plans_match(actual, expected))
+        self.assertFalse(plans_match(actual[:1], expected))
+
+    def test_plans_match_ignores_extras_the_label_leaves_out(self):
+        actual = [
+            {"action": "oscillate_off", "outlet": 0, "entity_alias": "fan", "oscillating": False}
+        ]
+        self.assertTrue(plans_match(actual, [{"action": "oscillate_off", "entity_alias": "fan"}]))
+        self.assertTrue(
+            plans_match(actual, [{"action": "oscillate_off", "entity_alias": "fan", "oscillating": False}])
+        )
+        self.assertFalse(
+            plans_match(actual, [{"action": "oscillate_off", "entity_alias": "fan", "oscillating": True}])
+        )
+
+    def test_report_counts_accuracy_and_timing(self):
+        rows = [
+            {
+                "path": "a.wav",
+                "text": "Turn on plug 2.",
+                "command": "turn on plug 2",
+                "expected_text": "turn on plug 2.",
+                "expected_steps": [{"action": "turn_on", "outlet": 2}],
+            },
+            {
+                "path": "b.wav",
+                "text": "turn of plug 3",
+                "expected_steps": [{"action": "turn_off", "outlet": 3}],
+            },
+        ]
+        report = run_parse_bench(rows, alias_map={}, repeat=3)
+        self.assertEqual(report["rows"], 2)
+        self.assertEqual(report["labeled"], 2)
+        self.assertEqual(report["correct"], 1)
+        self.assertEqual(report["accuracy"], 0.5)
+        self.assertEqual(report["calls"], 6)
+        self.assertEqual(report["mismatches"][0]["path"], "b.wav")
+        self.assertEqual(report["text_labeled"], 1)
+        self.assertEqual(report["text_exact"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import pathlib
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.pipeline import ActionExecutor
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.pipeline import TopicClassifier
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+
+
+def _config(**overrides) -> AgentConfig:
+    config = AgentConfig(
+        action_bridge_enabled=True,
+        action_dynamic_alias_store_path="",
+        action_rate_limit_seconds=0.0,
+        ha_token="test-token",
+    )
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return config
+
+
+def _build_pipeline(config: AgentConfig, ha_calls: list) -> tuple[AgentPipeline, FakeMqttClient]:
+    def fake_ha(**kwargs):
+        ha_calls.append((kwargs["action"], kwargs["entity_id"]))
+        return True, "stub ok"
+
+    client = FakeMqttClient(loopback=False)
+    pipeline = AgentPipeline(config, client, FakeWriteApi())
+    pipeline.executor.ha_executor = fake_ha
+    return pipeline, client
+
+
+class TopicClassifierTests(unittest.TestCase):
+    def test_command_topic_routes_to_command_and_discovery(self):
+        classifier = TopicClassifier(_config())
+        self.assertEqual(classifier.process("home/ai/command"), ["command", "discovery"])
+
+    def test_actionable_topic_routes_to_suggestion(self):
+        classifier = TopicClassifier(_config(action_bridge_enabled=False))
+        self.assertEqual(classifier.process("home/ha/switch/demo/state"), ["suggestion"])
+
+
+class AgentPipelineTests(unittest.TestCase):
+    def test_command_flows_through_executor(self):
+        ha_calls: list = []
+        pipeline, client = _build_pipeline(_config(), ha_calls)
+        pipeline.handle_message("home/ai/command", "turn on plug 2")
+        self.assertEqual(pipeline.action_queue.qsize(), 1)
+        self.assertEqual(pipeline.drain(), 1)
+        self.assertEqual(ha_calls, [("turn_on", "switch.p304m_tapo_p304m_2")])
+        self.assertEqual(client.published["home/ai/action_result"], 1)
+        snapshot = pipeline.metrics.snapshot()
+        self.assertEqual(snapshot["stages"]["action"]["count"], 1)
+        self.assertEqual(snapshot["stages"]["ingest"]["count"], 1)
+
+    def test_mode_set_updates_shared_state(self):
+        pipeline, client = _build_pipeline(_config(), [])
+        pipeline.handle_message("home/ai/mode/set", "ask")
+        pipeline.drain()
+        self.assertEqual(pipeline.state.current_mode, "ask")
+        self.assertEqual(client.retained["home/ai/mode"].count('"ask"'), 1)
+
+    def test_discovery_then_approval_allows_entity(self):
+        ha_calls: list = []
+        pipeline, _ = _build_pipeline(_config(), ha_calls)
+        pipeline.handle_message("home/ha/fan/study_fan/state", "on")
+        self.assertIn("fan.study_fan", pipeline.state.pending_device_suggestions)
+        pipeline.handle_message("home/ai/command", "approve device fan.study_fan as study fan")
+        pipeline.handle_message("home/ai/command", "turn off study fan")
+        pipeline.drain()
+        self.assertIn("fan.study_fan", pipeline.state.allowed_entity_ids)
+        self.assertEqual(ha_calls, [("turn_off", "fan.study_fan")])
+
+    def test_stage_timing_hook_receives_stage_name(self):
+        config = _config()
+        pipeline, _ = _build_pipeline(config, [])
+        executor: ActionExecutor = pipeline.executor
+        seen: list[str] = []
+        executor.add_timing_hook(lambda name, seconds: seen.append(name))
+        executor.run(("command", "what devices do we have", "test", 0.0))
+        self.assertEqual(seen, ["action"])
+
+
+class CommandLaneTests(unittest.TestCase):
+    def test_llm_commands_use_slow_lane(self):
+        pipeline, _ = _build_pipeline(_config(), [])
+        pipeline.handle_message("home/ai/command", "turn on plug 2")
+        pipeline.handle_message("home/ai/command", "make the study cosy")
+        pipeline.handle_message("home/ai/command", "approve device fan.study_fan as study fan")
+        self.assertEqual(pipeline.action_queue.qsize(), 2)
+        self.assertEqual(pipeline.action_slow_queue.qsize(), 1)
+
+    def test_slow_parse_does_not_block_fast_lane(self):
+        ha_calls: list = []
+        pipeline, _ = _build_pipeline(_config(), ha_calls)
+        parse_started = threading.Event()
+        release_parse = threading.Event()
+        fast_done = threading.Event()
+
+        def slow_parser(**kwargs):
+            parse_started.set()
+            release_parse.wait(timeout=5)
+            return [{"action": "turn_off", "outlet": 3}], "stub llm"
+
+        def fake_ha(**kwargs):
+            ha_calls.append((kwargs["action"], kwargs["entity_id"]))
+            if kwargs["action"] == "turn_on":
+                fast_done.set()
+            return True, "stub ok"
+
+        pipeline.executor.llm_parser = slow_parser
+        pipeline.executor.ha_executor = fake_ha
+        pipeline.start_workers()
+        pipeline.handle_message("home/ai/command", "make the study cosy")
+        self.assertTrue(parse_started.wait(timeout=5))
+        pipeline.handle_message("home/ai/command", "turn on plug 2")
+        self.assertTrue(fast_done.wait(timeout=5))
+        release_parse.set()
+        pipeline.action_slow_queue.join()
+        self.assertEqual(ha_calls[0], ("turn_on", "switch.p304m_tapo_p304m_2"))
+        self.assertEqual(ha_calls[1], ("turn_off", "switch.p304m_tapo_p304m_3"))
+
+    def test_rate_limit_uses_execution_time_across_lanes(self):
+        ha_calls: list = []
+        pipeline, _ = _build_pipeline(_config(action_rate_limit_seconds=0.2), ha_calls)
+        fast_done = threading.Event()
+
+        def slow_parser(**kwargs):
+            # The LLM command arrived first but executes after the fast command,
+            # more than the rate limit later.
+            fast_done.wait(timeout=5)
+            time.sleep(0.3)
+            return [{"action": "turn_off", "outlet": 3}], "stub llm"
+
+        def fake_ha(**kwargs):
+            ha_calls.append((kwargs["action"], kwargs["entity_id"]))
+            if kwargs["action"] == "turn_on":
+                fast_done.set()
+            return True, "stub ok"
+
+        pipeline.executor.llm_parser = slow_parser
+        pipeline.executor.ha_executor = fake_ha
+        pipeline.start_workers()
+        pipeline.handle_message("home/ai/command", "make the study cosy")
+        pipeline.handle_message("home/ai/command", "turn on plug 2")
+        self.assertTrue(fast_done.wait(timeout=5))
+        pipeline.action_slow_queue.join()
+        # A rate-limited command never reaches Home Assistant.
+        self.assertEqual(
+            ha_calls,
+            [("turn_on", "switch.p304m_tapo_p304m_2"), ("turn_off", "switch.p304m_tapo_p304m_3")],
+        )
+
+    def test_mode_change_during_slow_parse_is_rechecked(self):
+        ha_calls: list = []
+        pipeline, _ = _build_pipeline(_config(), ha_calls)
+
+        def parser_switching_mode(**kwargs):
+            pipeline.executor.set_mode("suggest", "test")
+            return [{"action": "turn_on", "outlet": 1}], "stub llm"
+
+        pipeline.executor.llm_parser = parser_switching_mode
+        result = pipeline.executor.run(("command", "make the study cosy", "test", 0.0))
+        self.assertEqual(result["detail"], "mode=suggest: action execution disabled")
+        self.assertEqual(ha_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
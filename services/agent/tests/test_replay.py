@@ -0,0 +1,57 @@
+import json
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.replay import load_capture_jsonl
+from agent.replay import run_replay
+
+
+def _sample_capture() -> list[tuple[float, str, str]]:
+    messages = []
+    for idx in range(40):
+        messages.append((1000.0 + idx * 0.01, f"home/ha/sensor/demo_{idx % 4}/state", str(idx)))
+    messages.append((1000.5, "home/ha/switch/p304m_tapo_p304m_1/state", "on"))
+    messages.append((1000.6, "home/ai/command", '{"command":"turn off plug 2","source":"api"}'))
+    return messages
+
+
+class ReplayHarnessTests(unittest.TestCase):
+    def test_load_capture_jsonl_sorts_and_normalizes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = pathlib.Path(folder) / "capture.jsonl"
+            path.write_text(
+                "\n".join(
+                    [
+                        json.dumps({"time": "2026-01-01T00:00:01.123456789Z", "topic": "home/b", "payload": {"v": 1}}),
+                        "not json",
+                        json.dumps({"time": 1767225600000000000, "topic": "home/a", "payload": "x"}),
+                        json.dumps({"time": 5, "payload": "missing topic"}),
+                    ]
+                ),
+                encoding="utf-8",
+            )
+            messages = load_capture_jsonl(str(path))
+        self.assertEqual([m[1] for m in messages], ["home/a", "home/b"])
+        self.assertAlmostEqual(messages[0][0], 1767225600.0)
+        self.assertEqual(messages[1][2], '{"v": 1}')
+
+    def test_replay_reports_throughput_and_stage_stats(self):
+        report = run_replay(_sample_capture(), speed=0.0, drain_timeout_seconds=20)
+        self.assertTrue(report["drained"])
+        self.assertEqual(report["messages"], 42)
+        self.assertGreater(report["messages_per_second"], 0)
+        self.assertGreaterEqual(report["stages"]["ingest"]["count"], 42)
+        self.assertIn("p95_ms", report["stages"]["on_message"])
+        self.assertEqual(report["queues"]["action"]["enqueued"], 1)
+        self.assertEqual(report["queues"]["action"]["dropped"], 0)
+        self.assertGreaterEqual(report["queues"]["suggestion"]["high_water"], 1)
+        self.assertEqual(report["stand_ins"]["ha_calls"], 1)
+        self.assertEqual(report["stand_ins"]["mqtt_published"]["home/ai/action_result"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+from agent.rollup import ActionRollup
+from fakes import RecordingWriteApi
+
+
+class ActionRollupTests(unittest.TestCase):
+    def test_counts_group_by_minute_and_tags(self):
+        write_api = RecordingWriteApi()
+        rollup = ActionRollup(write_api, "home")
+        tags = {"source": "voice", "mode": "auto", "action": "turn_on"}
+        for offset in (0.0, 10.0, 59.0):
+            rollup.record(status="executed", now=120.0 + offset, **tags)
+        rollup.record(status="rejected", now=130.0, **tags)
+        rollup.record(status="executed", now=180.0, **tags)
+
+        self.assertEqual(rollup.flush(now=184.0), 0)
+        self.assertEqual(rollup.flush(now=190.0), 2)
+        lines = sorted(point.to_line_protocol() for point in write_api.records)
+        self.assertIn("status=executed", lines[0])
+        self.assertIn("count=3i", lines[0])
+        self.assertTrue(lines[0].endswith(" 120000000000"))
+        self.assertIn("count=1i", lines[1])
+        self.assertEqual(rollup.flush(now=190.0, force=True), 1)
+
+    def test_latency_fields_only_when_measured(self):
+        write_api = RecordingWriteApi()
+        rollup = ActionRollup(write_api, "home")
+        tags = {"source": "api", "mode": "auto", "action": "turn_on"}
+        rollup.record(status="executed", latency_seconds=0.2, now=0.0, **tags)
+        rollup.record(status="executed", latency_seconds=0.4, now=1.0, **tags)
+        rollup.record(status="mode_change", source="mqtt", mode="ask", action="set_mode", now=2.0)
+        rollup.flush(force=True)
+        lines = [point.to_line_protocol() for point in write_api.records]
+        executed = next(line for line in lines if "status=executed" in line)
+        mode_change = next(line for line in lines if "status=mode_change" in line)
+        self.assertIn("latency_count=2i", executed)
+        self.assertIn("latency_max_ms=400", executed)
+        self.assertNotIn("latency", mode_change)
+
+
+class PipelineRollupTests(unittest.TestCase):
+    def test_commands_feed_the_rollup(self):
+        config = AgentConfig(
+            action_bridge_enabled=True,
+            action_dynamic_alias_store_path="",
+            action_rate_limit_seconds=0.0,
+            ha_token="test-token",
+        )
+        write_api = FakeWriteApi()
+        pipeline = AgentPipeline(config, FakeMqttClient(loopback=False), write_api)
+        pipeline.executor.ha_executor = lambda **kwargs: (True, "stub ok")
+        pipeline.handle_message("home/ai/command", '{"command":"turn on plug 1","source":"api"}')
+        pipeline.handle_message("home/ai/command", '{"command":"turn off plug 2","source":"api"}')
+        pipeline.drain()
+        self.assertEqual(pipeline.rollup.flush(force=True), 2)
+        self.assertEqual(write_api.writes["agent_action_rollup"], 2)
+        self.assertEqual(write_api.writes["agent_action"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
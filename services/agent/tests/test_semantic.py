@@ -0,0 +1,132 @@
+import pathlib
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+from agent.semantic import INTENT_PHRASES
+from agent.semantic import SemanticResolver
+
+PLUGS = {1: "switch.plug_1", 2: "switch.plug_2"}
+
+
+class BagOfWordsEmbedder:
+    """Deterministic stand-in for the Ollama embed endpoint."""
+
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(list(texts))
+        vectors = []
+        for text in texts:
+            vector = [0.0] * 256
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode("utf-8")) % 256] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+def _resolver(embedder: BagOfWordsEmbedder, cache_dir: str = "") -> SemanticResolver:
+    return SemanticResolver(embedder, "test-embed", cache_dir=cache_dir, min_score=0.4)
+
+
+class SemanticResolverTests(unittest.TestCase):
+    def test_resolves_paraphrased_command(self):
+        resolver = _resolver(BagOfWordsEmbedder())
+        resolver.sync(PLUGS, {"desk lamp": "light.desk_lamp", "study fan": "fan.study_fan"})
+        steps, detail = resolver.resolve("kill the desk lamp")
+        self.assertEqual(steps, [{"action": "turn_off", "outlet": 0, "entity_alias": "desk lamp"}])
+        self.assertIn("resolved by embeddings", detail)
+
+    def test_low_confidence_escalates(self):
+        resolver = _resolver(BagOfWordsEmbedder())
+        resolver.sync(PLUGS, {"desk lamp": "light.desk_lamp"})
+        steps, detail = resolver.resolve("what is the weather like")
+        self.assertEqual(steps, [])
+        self.assertIn("below confidence", detail)
+        self.assertEqual(resolver.resolve("turn off desk lamp and plug 1")[0], [])
+
+    def test_close_on_off_intent_escalates(self):
+        # One axis per intent group and target; the command leans to "on" by less
+        # than the intent margin but clears the target margin comfortably.
+        axes = {"desk lamp": 2, "plug 1": 3, "plug 2": 4}
+
+        def embed(texts: list[str]) -> list[list[float]]:
+            vectors = []
+            for text in texts:
+                vector = [0.0] * 5
+                if text == "flip the desk lamp":
+                    vector[:3] = [0.5, 0.4, 1.0]
+                elif text in INTENT_PHRASES["turn_on"]:
+                    vector[0] = 1.0
+                elif text in axes:
+                    vector[axes[text]] = 1.0
+                else:  # turn_off phrases
+                    vector[1] = 1.0
+                vectors.append(vector)
+            return vectors
+
+        strict = SemanticResolver(embed, "test-embed", min_score=0.4)
+        strict.sync(PLUGS, {"desk lamp": "light.desk_lamp"})
+        steps, detail = strict.resolve("flip the desk lamp")
+        self.assertEqual(steps, [])
+        self.assertIn("below confidence", detail)
+
+        loose = SemanticResolver(embed, "test-embed", min_score=0.4, intent_min_margin=0.05)
+        loose.sync(PLUGS, {"desk lamp": "light.desk_lamp"})
+        self.assertEqual(loose.resolve("flip the desk lamp")[0][0]["action"], "turn_on")
+
+    def test_cache_is_reused_and_approvals_embed_only_new_alias(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = BagOfWordsEmbedder()
+            _resolver(first, cache_dir).sync(PLUGS, {"desk lamp": "light.desk_lamp"})
+            self.assertEqual(len(list(pathlib.Path(cache_dir).glob("embeddings-*.npz"))), 1)
+
+            second = BagOfWordsEmbedder()
+            resolver = _resolver(second, cache_dir)
+            resolver.sync(PLUGS, {"desk lamp": "light.desk_lamp"}, alias_version=1)
+            self.assertEqual(second.calls, [])
+            resolver.sync(
+                PLUGS,
+                {"desk lamp": "light.desk_lamp", "study fan": "fan.study_fan"},
+                alias_version=2,
+            )
+            self.assertEqual(second.calls, [["study fan"]])
+            resolver.sync(PLUGS, {}, alias_version=2)
+            self.assertEqual(len(second.calls), 1)
+
+
+class PipelineSemanticTests(unittest.TestCase):
+    def test_semantic_tier_runs_before_llm(self):
+        config = AgentConfig(
+            action_bridge_enabled=True,
+            action_dynamic_alias_store_path="",
+            action_rate_limit_seconds=0.0,
+            ha_token="test-token",
+            extra_entity_alias_map={"desk lamp": "light.desk_lamp"},
+            action_semantic_resolver_enabled=True,
+            action_semantic_cache_dir="",
+        )
+        pipeline = AgentPipeline(config, FakeMqttClient(loopback=False), FakeWriteApi())
+        ha_calls: list = []
+        llm_calls: list = []
+        pipeline.executor.semantic = _resolver(BagOfWordsEmbedder())
+        pipeline.executor.ha_executor = lambda **kwargs: (
+            ha_calls.append((kwargs["action"], kwargs["entity_id"])) or (True, "stub ok")
+        )
+        pipeline.executor.llm_parser = lambda **kwargs: llm_calls.append(kwargs) or ([], "no")
+        result = pipeline.executor.run(("command", "kill the desk lamp", "test", 0.0))
+        self.assertEqual(result["status"], "executed")
+        self.assertEqual(ha_calls, [("turn_off", "light.desk_lamp")])
+        self.assertEqual(llm_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
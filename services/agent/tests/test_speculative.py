@@ -0,0 +1,143 @@
+import pathlib
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from agent.pipeline import AgentConfig
+from agent.pipeline import AgentPipeline
+from agent.replay import FakeMqttClient
+from agent.replay import FakeWriteApi
+from agent.speculative import SpeculativeParser
+
+
+def _pipeline(llm_calls: list, **overrides) -> AgentPipeline:
+    settings = {"action_speculative_parse_enabled": True, **overrides}
+    config = AgentConfig(
+        action_bridge_enabled=True,
+        action_dynamic_alias_store_path="",
+        action_rate_limit_seconds=0.0,
+        ha_token="test-token",
+        **settings,
+    )
+    pipeline = AgentPipeline(config, FakeMqttClient(loopback=False), FakeWriteApi())
+    pipeline.executor.ha_executor = lambda **kwargs: (True, "stub ok")
+
+    def fake_llm(**kwargs):
+        llm_calls.append(kwargs["text"])
+        return [{"action": "turn_on", "outlet": 4}], "stub llm"
+
+    pipeline.executor.llm_parser = fake_llm
+    return pipeline
+
+
+class SpeculativeParserTests(unittest.TestCase):
+    def test_budget_limits_concurrent_calls(self):
+        counts: list[str] = []
+        speculation = SpeculativeParser(max_inflight=1)
+        speculation.add_count_hook(counts.append)
+        release = threading.Event()
+        first = speculation.start(lambda: release.wait(timeout=5))
+        self.assertIsNotNone(first)
+        self.assertIsNone(speculation.start(lambda: None))
+        release.set()
+        first.result(timeout=5)
+        second = speculation.start(lambda: "ok")
+        self.assertEqual(speculation.use(second), "ok")
+        self.assertEqual(counts.count("speculative_parse_budget_exhausted"), 1)
+
+
+class SpeculativePlanTests(unittest.TestCase):
+    def test_rule_parse_wins_and_llm_result_is_discarded(self):
+        llm_calls: list = []
+        pipeline = _pipeline(llm_calls)
+        pipeline.handle_message("home/ai/command", '{"command":"turn on plug 2","source":"voice"}')
+        pipeline.drain()
+        self.assertEqual(llm_calls, [])
+        self.assertNotIn("speculative_parse_started", pipeline.metrics.counters)
+
+    def test_llm_result_is_used_when_rules_fail(self):
+        llm_calls: list = []
+        pipeline = _pipeline(llm_calls)
+        pipeline.handle_message("home/ai/command", '{"command":"make it brighter","source":"voice"}')
+        self.assertEqual(pipeline.metrics.counters["speculative_parse_started"], 1)
+        pipeline.drain()
+        self.assertEqual(llm_calls, ["make it brighter"])
+        self.assertEqual(pipeline.metrics.counters["speculative_parse_used"], 1)
+
+    def test_other_sources_stay_sequential(self):
+        llm_calls: list = []
+        pipeline = _pipeline(llm_calls)
+        pipeline.submit_action("command", '{"command":"make it brighter","source":"api"}', "mqtt")
+        self.assertNotIn("speculative_parse_started", pipeline.metrics.counters)
+        pipeline.submit_action("command", '{"command":"make it brighter","source":"voice"}', "mqtt")
+        self.assertEqual(pipeline.metrics.counters["speculative_parse_started"], 1)
+
+    def test_suggest_mode_does_not_speculate(self):
+        llm_calls: list = []
+        pipeline = _pipeline(llm_calls)
+        pipeline.executor.set_mode("suggest", "test")
+        pipeline.submit_action("command", '{"command":"make it brighter","source":"voice"}', "mqtt")
+        self.assertNotIn("speculative_parse_started", pipeline.metrics.counters)
+        pipeline.drain()
+        self.assertEqual(llm_calls, [])
+
+
+class PartialWarmTests(unittest.TestCase):
+    def _warm_pipeline(self, llm_calls: list) -> AgentPipeline:
+        return _pipeline(
+            llm_calls,
+            action_speculative_parse_enabled=False,
+            action_partial_warm_enabled=True,
+        )
+
+    def test_final_command_reuses_parse_warmed_from_partial(self):
+        llm_calls: list = []
+        pipeline = self._warm_pipeline(llm_calls)
+        pipeline.handle_message(
+            "home/ai/voice/partial",
+            '{"utterance_id":"u1","seq":1,"text":"Make it brighter","command":"make it brighter"}',
+        )
+        result = pipeline.executor.run(
+            (
+                "command",
+                '{"command":"make it brighter","source":"voice","request_id":"u1"}',
+                "mqtt",
+                0.0,
+            )
+        )
+        self.assertEqual(result["status"], "executed")
+        self.assertEqual(llm_calls, ["make it brighter"])
+        self.assertEqual(pipeline.metrics.counters["partial_warm_hit"], 1)
+
+    def test_changed_final_text_discards_warm_parse(self):
+        llm_calls: list = []
+        pipeline = self._warm_pipeline(llm_calls)
+        pipeline.handle_message(
+            "home/ai/voice/partial",
+            '{"utterance_id":"u2","seq":1,"command":"make it"}',
+        )
+        pipeline.executor.run(
+            (
+                "command",
+                '{"command":"make it brighter","source":"voice","request_id":"u2"}',
+                "mqtt",
+                0.0,
+            )
+        )
+        self.assertEqual(llm_calls, ["make it", "make it brighter"])
+        self.assertEqual(pipeline.metrics.counters["partial_warm_missed"], 1)
+
+    def test_rule_parsable_partial_is_not_warmed(self):
+        llm_calls: list = []
+        pipeline = self._warm_pipeline(llm_calls)
+        warmed = pipeline.executor.warm_from_partial(
+            '{"utterance_id":"u3","seq":1,"command":"turn on plug 2"}'
+        )
+        self.assertFalse(warmed)
+        self.assertEqual(llm_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()